@@ -36,6 +36,7 @@ to import command files that contain it. But it is always optional (see
 ``checkMandatory``) because it is removed during import.
 """
 
+import ast
 import types
 from collections import OrderedDict
 
@@ -658,23 +659,180 @@ class Bloc(PartOfSyntax):
 
     def isEnabled(self, context):
         """Tell if the block is enabled by the given context"""
-        eval_context = {}
-        eval_context.update(DS.__dict__)
-        eval_context.update(block_utils(eval_context))
+        return BlocCondition.get(self.getCondition()).evaluate(context)
+
+
+class BlocCondition:
+
+    """Compiled condition of a BLOC, shared by all the blocs using the same
+    string.
+
+    The condition is compiled once and evaluated against a namespace made
+    of the data structure types (built once for all the conditions), the
+    helpers of `block_utils()` and the keywords of the context.
+
+    The keywords read by the condition are extracted at compile time: the
+    names it uses and the string arguments of the helpers
+    (``exists("TYPE")``, ``equal_to("TYPE", ...)``...). The result is
+    memoized on the values of these keywords only. If a helper is called
+    with a computed name, the keywords read are unknown and the condition
+    is always evaluated.
+
+    Attributes:
+        condition (str): Text of the condition.
+        code (code): Compiled condition, *None* if it is not valid.
+        names (tuple[str]): Keywords read by the condition, *None* if they
+            can not be determined.
+    """
+
+    MEMO_SIZE = 512
+    _conditions = {}
+    _helpers = frozenset(block_utils({}))
+    _base_namespace = None
+
+    @classmethod
+    def get(cls, condition):
+        """Return the compiled object of a condition.
+
+        Arguments:
+            condition (str): Text of the condition.
+
+        Returns:
+            BlocCondition: Object shared by all the blocs using *condition*.
+        """
+        compiled = cls._conditions.get(condition)
+        if compiled is None:
+            compiled = cls._conditions.setdefault(condition, cls(condition))
+        return compiled
+
+    @classmethod
+    def namespace(cls):
+        """Return the namespace shared by all the conditions (the data
+        structure types), to be used as globals, never modified."""
+        if cls._base_namespace is None:
+            cls._base_namespace = dict(DS.__dict__)
+        return cls._base_namespace
+
+    def __init__(self, condition):
+        self.condition = condition
+        self._memo = {}
+        # as `eval()` does for a string
+        source = condition.lstrip(" \t")
+        try:
+            self.code = compile(source, "<bloc condition>", "eval")
+        except (SyntaxError, ValueError, TypeError):
+            self.code = None
+            self.names = ()
+        else:
+            self.names = self._read_names(ast.parse(source, mode="eval"))
+
+    @classmethod
+    def _read_names(cls, tree):
+        """Return the keywords read by a condition, *None* if a helper is
+        called with a name that is not a literal string."""
+        names = set()
+        helpers = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                if node.func.id not in cls._helpers:
+                    continue
+                helpers.add(node.func)
+                args = list(node.args[:1])
+                args.extend(kwd.value for kwd in node.keywords if kwd.arg == "name")
+                if not args:
+                    return None
+                for arg in args:
+                    if isinstance(arg, (ast.Tuple, ast.List)):
+                        elts = arg.elts
+                    else:
+                        elts = [arg]
+                    for elt in elts:
+                        if not (isinstance(elt, ast.Constant) and isinstance(elt.value, str)):
+                            return None
+                        names.add(elt.value)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node not in helpers:
+                if node.id in cls._helpers:
+                    # helper passed as a value
+                    return None
+                names.add(node.id)
+        return tuple(sorted(names))
+
+    def evaluate(self, context):
+        """Evaluate the condition with the keywords of *context*.
+
+        Arguments:
+            context (dict): Keywords values.
+
+        Returns:
+            bool: Result of the condition, *False* if its evaluation fails.
+        """
+        if self.code is None:
+            return False
+        key = self._memo_key(context)
+        if key is not None:
+            try:
+                return self._memo[key]
+            except KeyError:
+                pass
+        enabled = self._evaluate(context)
+        if key is not None:
+            if len(self._memo) >= self.MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = enabled
+        return enabled
+
+    def _evaluate(self, context):
+        """Evaluate the condition without the memo."""
         # evaluate Python variables if present
-        for key, value in list(context.items()):
-            eval_context[key] = getattr(value, "evaluation", value)
+        values = {key: getattr(value, "evaluation", value) for key, value in context.items()}
+        eval_context = block_utils(values)
+        eval_context.update(values)
         try:
-            enabled = eval(self.getCondition(), {}, eval_context)
+            enabled = eval(self.code, self.namespace(), eval_context)
         except AssertionError:
             raise
         except Exception:
             # TODO: re-enable CataError, it seems me a catalog error!
             # raise CataError("Error evaluating {0!r}: {1}".format(
-            #                 self.getCondition(), str(exc)))
+            #                 self.condition, str(exc)))
             enabled = False
         return enabled
 
+    def _memo_key(self, context):
+        """Return the values of the keywords read by the condition as a
+        hashable key, *None* if it can not be built."""
+        if self.names is None:
+            return None
+        key = []
+        for name in self.names:
+            value = context.get(name, UNDEF)
+            value = _frozen(getattr(value, "evaluation", value))
+            if value is UNDEF:
+                return None
+            key.append(value)
+        return tuple(key)
+
+
+def _frozen(value):
+    """Return a hashable equivalent of a keyword value (types included, ``1``
+    and ``1.0`` are different for `is_type()`), *UNDEF* if there is none."""
+    if isinstance(value, (list, tuple)):
+        items = tuple(_frozen(i) for i in value)
+        if UNDEF in items:
+            return UNDEF
+        return (type(value), items)
+    if isinstance(value, dict):
+        items = tuple((k, _frozen(v)) for k, v in value.items())
+        if any(v is UNDEF for _, v in items):
+            return UNDEF
+        return (type(value), items)
+    try:
+        hash(value)
+    except TypeError:
+        return UNDEF
+    return (type(value), value)
+
 
 class Command(PartOfSyntax):
 
@@ -25,6 +25,9 @@ Implementation of the interface to the code_aster commands catalog.
 
 
 import importlib
+import importlib.machinery
+import importlib.util
+import os
 import os.path as osp
 import sys
 
@@ -85,21 +88,116 @@ def _import_aster(path, package):
     return module
 
 
-def import_aster(path):
+def unload_aster():
+    """Remove the modules of code_aster catalog already imported, so that
+    the next import reads the catalog again.
+
+    Returns:
+        dict: Modules removed, by name (see `restore_aster`).
+    """
+    # pylint: disable=consider-iterating-dictionary
+    removed = {}
+    for pkg in list(sys.modules.keys()):
+        if pkg.startswith('code_aster.') or pkg == 'code_aster':
+            removed[pkg] = sys.modules.pop(pkg)
+    return removed
+
+
+def restore_aster(modules):
+    """Put back the modules of a catalog removed by `unload_aster`.
+
+    Arguments:
+        modules (dict): Modules by name.
+    """
+    sys.modules.update(modules)
+
+
+def root_package(path):
+    """Register the *code_aster* package found at *path*, whatever the
+    other *code_aster* directories on *sys.path*."""
+    module = sys.modules.get("code_aster")
+    if module is not None:
+        return module
+    init = osp.join(path, "__init__.py")
+    spec = importlib.util.spec_from_file_location(
+        "code_aster", init if osp.isfile(init) else None,
+        submodule_search_locations=[path])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["code_aster"] = module
+    if spec.loader is not None:
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules["code_aster"]
+            raise
+    return module
+
+
+def import_aster(path, reload=True, commands=True):
     """Import the code_aster catalog from path.
 
     Example: ``path = /path/to/catalogue/vers``
 
     *path* contains the *code_aster* package.
+
+    With *reload=False*, the modules already imported (for example the
+    data structures referenced by a catalog snapshot) are kept.
+
+    With *commands=False*, the *Commands* package is registered without
+    importing the commands: use `command_modules` and `import_command`.
     """
     # to force reload
-    # pylint: disable=consider-iterating-dictionary
-    for pkg in list(sys.modules.keys()):
-        if pkg.startswith('code_aster.') or pkg == 'code_aster':
-            del sys.modules[pkg]
+    if reload:
+        unload_aster()
+    root_package(str(path))
     mods = {}
     for pkg in ("", "aster_version", "Commons", "Commands", "DataStructure",
                 "Syntax", "SyntaxChecker", "SyntaxObjects", "SyntaxUtils"):
         sep = "." if pkg else ""
-        mods[pkg] = _import_aster(path, "Cata" + sep + pkg)
+        if pkg == "Commands" and not commands:
+            mods[pkg] = _bare_package(mods[""], pkg)
+        else:
+            mods[pkg] = _import_aster(path, "Cata" + sep + pkg)
     return mods
+
+
+def _bare_package(parent, name):
+    """Register the subpackage *name* of *parent* without running its
+    *__init__* (which imports all the commands)."""
+    fullname = "{0}.{1}".format(parent.__name__, name)
+    module = sys.modules.get(fullname)
+    if module is None:
+        directory = osp.join(osp.dirname(parent.__file__), name)
+        spec = importlib.machinery.ModuleSpec(fullname, None,
+                                              is_package=True)
+        spec.submodule_search_locations = [directory]
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[fullname] = module
+        setattr(parent, name, module)
+    return module
+
+
+def command_modules(package):
+    """Return the names of the modules of the *Commands* package, sorted.
+
+    Arguments:
+        package (module): *Commands* package.
+    """
+    names = set()
+    for directory in package.__path__:
+        for filename in os.listdir(directory):
+            base, ext = osp.splitext(filename)
+            if ext == ".py" and base != "__init__":
+                names.add(base)
+    return sorted(names)
+
+
+def import_command(package, modname):
+    """Import one module of the *Commands* package.
+
+    Arguments:
+        package (module): *Commands* package.
+        modname (str): Module name, as given by `command_modules`.
+    """
+    return importlib.import_module("{0}.{1}".format(package.__name__,
+                                                    modname))
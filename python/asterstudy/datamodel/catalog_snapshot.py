@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+
+"""
+Catalog snapshot
+----------------
+
+On-disk snapshot of the commands catalog, so the language server starts
+without importing the ~260 modules of *code_aster/Cata/Commands*.
+
+The snapshot starts with a manifest: for each command, the module that
+defines it, its docstring and the names of its result types, then the
+categories. The keyword tree of
+each command is pickled on its own and only read when the command is
+used (`SnapshotCommands`).
+
+The snapshot mirrors each command as a tree of lightweight nodes
+(`SnapshotCommand`, `SnapshotFactorKeyword`, `SnapshotSimpleKeyword`,
+`SnapshotBloc`) whose `definition` holds the plain data of the catalog:
+`statut`, `typ`, `defaut`, `into`, `val_min`/`val_max`, docstrings,
+translations, BLOC conditions and the keyword tree itself. Rules keep
+their kind and arguments, and `sd_prod` functions keep the types they
+return with `__all__=True`.
+
+Anything else (evaluating a BLOC condition, calling `sd_prod` on real
+arguments, validators, ...) is forwarded to the real catalog object:
+the owning `Catalogs` then imports the module of that command only.
+
+A snapshot is keyed by the catalog path, the content of
+*aster_version.py* and the modification times of the catalog sources;
+it is written after the first full import of a catalog.
+
+When several catalogs are loaded, the strings and the plain tuples of
+their nodes (keyword names, paths, `into` values, docstrings) are shared
+between them: two versions of code_aster mostly have the same keywords.
+"""
+
+import hashlib
+import inspect
+import io
+import os
+import os.path as osp
+import pickle
+import sys
+from collections.abc import MutableMapping
+from contextlib import nullcontext
+
+from .aster_syntax import IDS, get_cata_typeid
+from .result_types import command_result_types
+
+# Bump when the layout of the snapshot changes
+SNAPSHOT_FORMAT = 3
+
+# Module holding the data structure classes used as `typ` / `sd_prod`
+_DS_MODULE = "code_aster.Cata.Language.DataStructure"
+
+
+# Plain tuples shared by the nodes of all the catalogs (strings are
+# interned with `sys.intern`)
+_SHARED = {}
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _share(value):
+    """Return a shared copy of a string or a flat tuple of scalars, or
+    *value* itself."""
+    # pylint: disable=unidiomatic-typecheck
+    if type(value) is str:
+        return sys.intern(value)
+    if type(value) is tuple and all(type(item) in _SCALARS
+                                    for item in value):
+        value = tuple(_share(item) for item in value)
+        # the types are part of the key: (1,) and (1.0,) are equal
+        key = (value, tuple(type(item) for item in value))
+        return _SHARED.setdefault(key, value)
+    return value
+
+
+def snapshot_dir():
+    """Return the directory where snapshots are stored.
+
+    Returns:
+        str: *$VS_CODE_ASTER_SNAPSHOT_DIR* or
+        *~/.cache/vs-code-aster/snapshots*.
+    """
+    return os.environ.get("VS_CODE_ASTER_SNAPSHOT_DIR") or osp.join(
+        osp.expanduser("~"), ".cache", "vs-code-aster", "snapshots")
+
+
+def snapshot_path(version_path):
+    """Return the snapshot file for the catalog at *version_path*.
+
+    Arguments:
+        version_path (str): Path to the *code_aster* package.
+
+    Returns:
+        str: Path of the snapshot file (may not exist).
+    """
+    version_path = osp.abspath(str(version_path))
+    cata = osp.join(version_path, "Cata")
+    key = hashlib.sha1()
+    key.update(repr((SNAPSHOT_FORMAT, sys.version_info[:2],
+                     version_path)).encode())
+    try:
+        with open(osp.join(cata, "aster_version.py"), "rb") as file:
+            key.update(file.read())
+    except OSError:
+        pass
+    count, latest = 0, 0
+    for root, _dirs, files in os.walk(cata):
+        for name in files:
+            if name.endswith(".py"):
+                count += 1
+                latest = max(latest,
+                             os.stat(osp.join(root, name)).st_mtime_ns)
+    key.update(repr((count, latest)).encode())
+    return osp.join(snapshot_dir(), key.hexdigest() + ".pickle")
+
+
+class SnapshotOwner:
+    """Link from the snapshot nodes to the `Catalogs` that can import the
+    real objects. Shared by all the nodes of a snapshot; stored as a
+    reference only."""
+
+    def __init__(self, catalogs=None):
+        self.catalogs = catalogs
+
+    def resolve(self, path):
+        """Return the real catalog object at *path*."""
+        return self.catalogs.real_object(path)
+
+    def activated(self):
+        """Context in which the modules of the catalog are importable
+        (see `Catalogs.activated`)."""
+        if self.catalogs is None:
+            return nullcontext()
+        return self.catalogs.activated()
+
+
+class SnapshotNode:
+    """Base of the snapshot nodes.
+
+    Attributes:
+        path (tuple[str]): Command name then keys down to the node.
+        name (str): `nom` of the object (empty for keywords).
+        definition (dict): Data entries of the definition; keywords are
+            snapshot nodes.
+        udocstring (str): Documentation of the object.
+    """
+
+    __slots__ = ("owner", "path", "name", "definition", "udocstring",
+                 "_rules")
+
+    typeid = None
+
+    def __init__(self, owner, path, name, definition, udocstring, rules):
+        self.owner = owner
+        self.path = _share(path)
+        self.name = _share(name)
+        self.definition = {sys.intern(key): _share(value)
+                           for key, value in definition.items()}
+        self.udocstring = _share(udocstring)
+        self._rules = rules
+
+    def __reduce__(self):
+        return (self.__class__, (self.owner, self.path, self.name,
+                                 self.definition, self.udocstring,
+                                 self._rules))
+
+    def __getattr__(self, attr):
+        # Only called for what the snapshot does not hold
+        if attr.startswith("__") or attr in SnapshotNode.__slots__:
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, "/".join(self.path))
+
+    @property
+    def rules(self):
+        """list: Rules of the object (kind and arguments only)."""
+        return self._rules
+
+    regles = rules
+
+    def getCataTypeId(self):
+        """Get the Cata type of object."""
+        return self.typeid
+
+    def resolve(self):
+        """Return the real catalog object (imports the catalog if needed)."""
+        return self.owner.resolve(self.path)
+
+
+class SnapshotCommand(SnapshotNode):
+    """Snapshot of a command."""
+    __slots__ = ()
+    typeid = IDS.command
+
+
+class SnapshotSimpleKeyword(SnapshotNode):
+    """Snapshot of a simple keyword (SIMP)."""
+    __slots__ = ()
+    typeid = IDS.simp
+
+
+class SnapshotFactorKeyword(SnapshotNode):
+    """Snapshot of a factor keyword (FACT)."""
+    __slots__ = ()
+    typeid = IDS.fact
+
+
+class SnapshotBloc(SnapshotNode):
+    """Snapshot of a BLOC. The condition is known, evaluating it needs the
+    real catalog."""
+    __slots__ = ()
+    typeid = IDS.bloc
+
+    def getCondition(self):
+        """Return the BLOC condition"""
+        return self.definition.get("condition")
+
+    def isEnabled(self, context):
+        """Tell if the block is enabled by the given context"""
+        return self.resolve().isEnabled(context)
+
+
+_NODE_CLASSES = {
+    IDS.command: SnapshotCommand,
+    IDS.simp: SnapshotSimpleKeyword,
+    IDS.fact: SnapshotFactorKeyword,
+    IDS.bloc: SnapshotBloc,
+}
+
+
+class SnapshotRule:
+    """Kind and arguments of a catalog rule. Instances are of a subclass
+    named as the real rule (`AtLeastOne`, `ExactlyOne`, ...)."""
+
+    __slots__ = ("ruleArgs",)
+
+    def __init__(self, *args):
+        self.ruleArgs = args
+
+    def __reduce__(self):
+        return (make_rule, (type(self).__name__, self.ruleArgs))
+
+    def __repr__(self):
+        return "{0}{1!r}".format(type(self).__name__, self.ruleArgs)
+
+
+_RULE_CLASSES = {}
+
+
+def make_rule(kind, args):
+    """Return a `SnapshotRule` of the given kind."""
+    cls = _RULE_CLASSES.get(kind)
+    if cls is None:
+        cls = _RULE_CLASSES[kind] = type(kind, (SnapshotRule,),
+                                         {"__slots__": ()})
+    return cls(*args)
+
+
+class SnapshotSdProd:
+    """Stand-in for an `sd_prod` function.
+
+    Keeps its name, signature and the outcome of a call with
+    `__all__=True` and *None* for its positional arguments (the way the
+    language server asks for all the possible results): `("types", result)`,
+    `("error", message)` or *None* if unknown. Other calls go to the real
+    function.
+    """
+
+    def __init__(self, owner, command, name, params, outcome):
+        self.owner = owner
+        self.command = command
+        self.__name__ = name
+        self.params = params
+        self.outcome = outcome
+
+    def __reduce__(self):
+        return (SnapshotSdProd, (self.owner, self.command, self.__name__,
+                                 self.params, self.outcome))
+
+    @property
+    def __signature__(self):
+        kind = inspect.Parameter
+        params = [kind(name, kind.POSITIONAL_OR_KEYWORD)
+                  for name in self.params]
+        params.append(kind("kwargs", kind.VAR_KEYWORD))
+        return inspect.Signature(params)
+
+    def __call__(self, *args, **kwargs):
+        if (self.outcome is not None and kwargs == {"__all__": True}
+                and len(args) == len(self.params)
+                and all(arg is None for arg in args)):
+            kind, value = self.outcome
+            if kind == "error":
+                raise RuntimeError(value)
+            return value
+        real = self.owner.resolve((self.command,)).definition["sd_prod"]
+        return real(*args, **kwargs)
+
+
+def _is_data(value):
+    """Tell if *value* can be stored without the catalog modules."""
+    if value is None or isinstance(value, (str, int, float, complex)):
+        return True
+    if isinstance(value, type):
+        return value.__module__ == _DS_MODULE
+    if isinstance(value, (tuple, list)):
+        return all(_is_data(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_data(item)
+                   for key, item in value.items())
+    return False
+
+
+def _snapshot_sd_prod(owner, command, func):
+    """Return a `SnapshotSdProd` for *func*, or *None* if it can not be
+    described."""
+    try:
+        params = tuple(
+            param.name for param in inspect.signature(func).parameters.values()
+            if param.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
+            and param.default is inspect.Parameter.empty)
+    except (TypeError, ValueError):
+        return None
+    try:
+        result = func(*([None] * len(params)), __all__=True)
+        outcome = ("types", result) if _is_data(result) else None
+    except Exception as exc: # pylint: disable=broad-except
+        outcome = ("error", repr(exc))
+    return SnapshotSdProd(owner, command, getattr(func, "__name__", ""),
+                          params, outcome)
+
+
+def _snapshot_node(owner, path, obj, memo):
+    """Return the snapshot of a catalog object and its keywords. Objects
+    shared inside the command give a single node."""
+    node = memo.get(id(obj))
+    if node is not None:
+        return node
+    definition = {}
+    for key, value in obj.definition.items():
+        if get_cata_typeid(value) in _NODE_CLASSES:
+            definition[key] = _snapshot_node(owner, path + (key,), value,
+                                             memo)
+        elif _is_data(value):
+            definition[key] = value
+        elif key == "sd_prod" and callable(value):
+            sd_prod = _snapshot_sd_prod(owner, path[0], value)
+            if sd_prod is not None:
+                definition[key] = sd_prod
+    rules = [make_rule(type(rule).__name__, tuple(rule.ruleArgs))
+             for rule in getattr(obj, "_rules", None) or ()
+             if _is_data(tuple(getattr(rule, "ruleArgs", ())))]
+    cls = _NODE_CLASSES[get_cata_typeid(obj)]
+    node = memo[id(obj)] = cls(owner, path, obj.definition.get("nom", ""),
+                               definition, obj.udocstring, rules)
+    return node
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler storing the `SnapshotOwner` as a reference."""
+
+    def persistent_id(self, obj):
+        # pylint: disable=no-self-use
+        return "owner" if isinstance(obj, SnapshotOwner) else None
+
+
+class _Unpickler(pickle.Unpickler):
+    """Unpickler linking the nodes to a live `SnapshotOwner`."""
+
+    def __init__(self, file, owner):
+        super().__init__(file)
+        self.owner = owner
+
+    def persistent_load(self, pid):
+        if pid != "owner":
+            raise pickle.UnpicklingError(pid)
+        return self.owner
+
+
+def _dumps(obj):
+    out = io.BytesIO()
+    _Pickler(out, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return out.getvalue()
+
+
+class SnapshotCommands(MutableMapping):
+    """Commands of a catalog read from a snapshot, by name.
+
+    The node of a command is unpickled on first access. The `Catalogs`
+    replaces it by the real command once imported.
+
+    Arguments:
+        owner (SnapshotOwner): Owner to link the nodes to.
+        blobs (dict): Pickled `SnapshotCommand` of each command, by name.
+    """
+
+    def __init__(self, owner, blobs):
+        self._owner = owner
+        self._blobs = blobs
+        self._objects = {}
+
+    def __getitem__(self, name):
+        obj = self._objects.get(name)
+        if obj is None:
+            blob = self._blobs[name]
+            # the data structure classes are those of this catalog
+            with self._owner.activated():
+                obj = _Unpickler(io.BytesIO(blob), self._owner).load()
+            obj = self._objects.setdefault(name, obj)
+        return obj
+
+    def __setitem__(self, name, obj):
+        if name not in self._blobs:
+            self._blobs[name] = None
+        self._objects[name] = obj
+
+    def __delitem__(self, name):
+        del self._blobs[name]
+        self._objects.pop(name, None)
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __contains__(self, name):
+        return name in self._blobs
+
+    def loaded(self):
+        """Return the names of the commands read so far."""
+        return list(self._objects)
+
+
+def _result_names(package, command):
+    """Return the names of the result types of *command* in the
+    *DataStructure* package, or *None* if one of them is not there."""
+    names = []
+    for typ in command_result_types(command):
+        if getattr(package, typ.__name__, None) is not typ:
+            return None
+        names.append(typ.__name__)
+    return tuple(names)
+
+
+def build(catalogs):
+    """Build the snapshot of a loaded catalog.
+
+    Arguments:
+        catalogs (Catalogs): Catalogs with the real objects imported.
+
+    Returns:
+        dict: Snapshot content, see `load`.
+    """
+    # pylint: disable=protected-access
+    owner = SnapshotOwner()
+    package = catalogs.package("DataStructure")
+    commands = {}
+    for name, command in catalogs.iteritems():
+        node = _snapshot_node(owner, (name,), command, {})
+        commands[name] = (catalogs._modules.get(name), node.udocstring,
+                          _result_names(package, command), _dumps(node))
+    return {
+        "commands": commands,
+        "categories": catalogs._categories,
+        "command_to_category": catalogs._command_to_category,
+        "command_to_subcategory": catalogs._command_to_subcategory,
+    }
+
+
+def save(path, snapshot):
+    """Write a snapshot, atomically.
+
+    Arguments:
+        path (str): Snapshot file.
+        snapshot (dict): Result of `build`.
+    """
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp, "wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    finally:
+        if osp.exists(tmp):
+            os.remove(tmp)
+
+
+def load(path):
+    """Read a snapshot.
+
+    Arguments:
+        path (str): Snapshot file.
+
+    Returns:
+        dict: Snapshot with keys *commands* (name -> (module, docstring,
+        names of the result types, pickled node)), *categories*, *command_to_category*,
+        *command_to_subcategory*, or *None* if there is no usable snapshot
+        at *path*.
+    """
+    try:
+        with open(path, "rb") as file:
+            snapshot = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception: # pylint: disable=broad-except
+        # Truncated or written by an incompatible version: rebuilt later
+        return None
+    commands = snapshot.get("commands") if isinstance(snapshot, dict) else None
+    if commands:
+        snapshot["commands"] = {
+            sys.intern(name): (module, _share(udocstring), _share(names), blob)
+            for name, (module, udocstring, names, blob) in commands.items()}
+    return snapshot
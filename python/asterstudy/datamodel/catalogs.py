@@ -31,20 +31,46 @@ Implementation of the catalogs container.
 import os
 import os.path as osp
 import re
+import sys
+import threading
 import traceback
 from collections import OrderedDict
+from contextlib import contextmanager
 from itertools import chain
+from types import MappingProxyType
 
-from .aster_syntax import IDS, get_cata_typeid, import_aster
+from . import catalog_snapshot
+from .aster_syntax import (IDS, command_modules, get_cata_typeid,
+                           import_aster, import_command, restore_aster,
+                           root_package, unload_aster)
 from .dict_categories import CATEGORIES_DEFINITION, DEPRECATED
 from .global_dict import GLOBAL_DICT
+from .keyword_index import KeywordIndex
+from .result_types import ResultTypes
 
 
 class Catalogs:
-    """Class for the catalogs access"""
+    """Class for the catalogs access
 
-    def __init__(self):
+    Several catalogs can be loaded at the same time (see `path`). They all
+    import the modules of a *code_aster* package: the modules of one catalog only
+    are in *sys.modules*, the others are put aside and swapped back by
+    `activated` before importing anything from their catalog.
+
+    Arguments:
+        path (str): Path to the *code_aster* package to read. By default,
+            *$VS_CODE_ASTER_CATA_PATH* or the vendored catalog.
+    """
+
+    # Lock held while the *code_aster* modules of a catalog are swapped in
+    # *sys.modules* or imported, and catalog whose modules are there
+    _modules_lock = threading.RLock()
+    _active = None
+
+    def __init__(self, path=None):
         """Create catalogs object."""
+        self._path = path
+        self._aster_modules = {}
         self._version = None
         self._pkgs = {}
         self._catalogs = {}
@@ -52,6 +78,15 @@ class Catalogs:
         self._command_to_category = {}
         self._command_to_subcategory = {}
         self._dockeys = {}
+        self._parsed = {}
+        self._parsed_views = OrderedDict()
+        self._indexes = {}
+        self.result_types = ResultTypes(self)
+        # Module of each command, and docstrings known without the command
+        # objects (read from a snapshot)
+        self._modules = {}
+        self._docstrings = {}
+        self._version_path = None
         self.read_catalogs()
 
     def reset(self):
@@ -61,8 +96,43 @@ class Catalogs:
         self._categories.clear()
         self._command_to_category.clear()
         self._command_to_subcategory.clear()
+        self._parsed.clear()
+        self._parsed_views.clear()
+        self._indexes.clear()
+        self.result_types.clear()
+        self._modules.clear()
+        self._docstrings.clear()
+        self._version_path = None
         self._version = None
 
+    @contextmanager
+    def activated(self):
+        """Context in which the *code_aster* modules in *sys.modules* are
+        those of this catalog. Required to import anything from it
+        (packages, commands, snapshot nodes)."""
+        with Catalogs._modules_lock:
+            active = Catalogs._active
+            if active is not self:
+                removed = unload_aster()
+                if active is not None:
+                    active._aster_modules = removed
+                restore_aster(self._aster_modules)
+                self._aster_modules = {}
+                Catalogs._active = self
+            if self._version_path is not None:
+                root_package(str(self._version_path))
+            yield
+
+    def release(self):
+        """Forget the catalog and its modules (the object is not usable
+        anymore)."""
+        with Catalogs._modules_lock:
+            if Catalogs._active is self:
+                unload_aster()
+                Catalogs._active = None
+            self.reset()
+            self._aster_modules = {}
+
     def package(self, pkg_name):
         """
         Get the package of *code_aster.Cata* by its name.
@@ -70,6 +140,8 @@ class Catalogs:
         Returnds:
             package: Package being requested.
         """
+        if pkg_name not in self._pkgs:
+            self._import_packages()
         return self._pkgs[pkg_name]
 
     @staticmethod
@@ -124,26 +196,18 @@ class Catalogs:
         debug_message("Loading catalog for {0!r}".format(version))
         import pathlib as pl
         vendored_path = pl.Path(__file__).parent.parent / "code_aster_version" / "code_aster"
-        import sys as _sys
-        def _clog(msg):
-            # Log to stderr only — stdout is the LSP JSON-RPC transport
-            # and any pollution breaks the protocol.
-            _sys.stderr.write("[catalog] " + msg + "\n")
-            _sys.stderr.flush()
-
         env_path = os.environ.get("VS_CODE_ASTER_CATA_PATH")
-        if env_path:
+        # The `code_aster` package is registered from `version_path` itself
+        # (see `root_package`), not looked up on sys.path where the vendored
+        # catalog comes first (added by python/lsp/__init__.py).
+        if self._path:
+            version_path = pl.Path(self._path)
+            source = "explicit"
+        elif env_path:
             candidate = pl.Path(env_path)
             if candidate.is_dir() and (candidate / "Cata").is_dir():
                 version_path = candidate
                 source = "env"
-                # Make the extracted `code_aster` package importable by
-                # putting its PARENT on sys.path. Without this, the loader
-                # would silently fall back to the vendored catalog already
-                # on sys.path (added by python/lsp/__init__.py).
-                parent = str(candidate.parent)
-                if parent not in _sys.path:
-                    _sys.path.insert(0, parent)
             else:
                 _clog("VS_CODE_ASTER_CATA_PATH={0!r} is not a valid code_aster directory, falling back to vendored".format(env_path))
                 version_path = vendored_path
@@ -155,30 +219,148 @@ class Catalogs:
 
         # Enable marker
         AsterStudySession.set_cata()
-        # try:
-        self._pkgs = import_aster(version_path)
-        commands = self._pkgs["Commands"].__dict__
-        # except ImportError as exc:
-        #     info_message("Can not import version {0!r}\nReason: {1}"
-        #                  .format(version_path, exc))
-        #     commands = {}
-
-        if commands:
-            self._add_conversion_commands()
-        for key, value in list(commands.items()):
-            if get_cata_typeid(value) == IDS.command:
-                self._catalogs[key] = value
 
+        with self.activated():
+            # Modules of a previous catalog must not be reused (a snapshot
+            # refers to the data structures of this one)
+            unload_aster()
+            self._version_path = version_path
+        self._load(version, version_path)
+
+    def _load(self, version, version_path):
+        """Read the commands from the snapshot of the catalog, or import
+        them (and write the snapshot).
+
+        The modules lock is only held to import the commands and to build
+        the snapshot: reading or writing it does not block the other
+        catalogs."""
+        use_snapshot = os.environ.get("VS_CODE_ASTER_CATA_SNAPSHOT") != "0"
+        snapshot_path = None
+        if use_snapshot:
+            snapshot_path = catalog_snapshot.snapshot_path(version_path)
+            snapshot = catalog_snapshot.load(snapshot_path)
+            if snapshot is not None:
+                commands = snapshot["commands"]
+                self._catalogs = catalog_snapshot.SnapshotCommands(
+                    catalog_snapshot.SnapshotOwner(self),
+                    {name: entry[3] for name, entry in commands.items()})
+                self._modules = {name: entry[0]
+                                 for name, entry in commands.items()}
+                self._docstrings = {name: entry[1]
+                                    for name, entry in commands.items()}
+                self.result_types.clear({name: entry[2]
+                                         for name, entry in commands.items()})
+                self._categories = snapshot["categories"]
+                self._command_to_category = snapshot["command_to_category"]
+                self._command_to_subcategory = \
+                    snapshot["command_to_subcategory"]
+                self._version = version
+                _clog("Loaded catalog snapshot {0}".format(snapshot_path))
+                return
+
+        with self.activated():
+            self._catalogs = self._import_commands()
         self._fill_categories()
         self._version = version
+        if snapshot_path:
+            try:
+                with self.activated():
+                    snapshot = catalog_snapshot.build(self)
+                catalog_snapshot.save(snapshot_path, snapshot)
+            except Exception as exc: # pylint: disable=broad-except
+                _clog("Can not write catalog snapshot {0}: {1!r}"
+                      .format(snapshot_path, exc))
         # TO DO : A remettre si on veut recuperer l'url de la doc d'une commande:
         # self._read_dockeys()
 
+    def _import_packages(self):
+        """Import the packages of the catalog, but not the commands.
+        The modules already imported (the data structures referenced by a
+        snapshot) are kept so that their classes stay the same."""
+        with self.activated():
+            if not self._pkgs:
+                self._pkgs = import_aster(self._version_path, reload=False,
+                                          commands=False)
+
+    def _import_commands(self):
+        """Import all the commands, one module after the other, and
+        remember the module of each command.
+
+        Returns:
+            dict: Commands by name.
+        """
+        self._import_packages()
+        package = self._pkgs["Commands"]
+        catalogs = {}
+        self._add_conversion_commands(catalogs)
+        for modname in command_modules(package):
+            module = import_command(package, modname)
+            for name in dir(module):
+                value = getattr(module, name)
+                if get_cata_typeid(value) != IDS.command:
+                    continue
+                # Commands are also imported by others modules: prefer
+                # the module named after the command
+                if name not in catalogs or modname == name.lower():
+                    catalogs[name] = value
+                    self._modules[name] = modname
+        return catalogs
+
+    def _import_command(self, name):
+        """Import the real command behind a snapshot node, with only the
+        module that defines it.
+
+        Arguments:
+            name (str): Command name.
+
+        Returns:
+            Command: Real command object.
+        """
+        with self.activated():
+            command = self._catalogs[name]
+            if not isinstance(command, catalog_snapshot.SnapshotNode):
+                return command
+            self._import_packages()
+            modname = self._modules.get(name)
+            if modname is None:
+                fake = {}
+                self._add_conversion_commands(fake)
+                command = fake[name]
+            else:
+                module = import_command(self._pkgs["Commands"], modname)
+                command = getattr(module, name)
+            self._catalogs[name] = command
+            return command
+
+    def real_object(self, path):
+        """Return a real catalog object, importing its command if it was
+        read from a snapshot.
+
+        Arguments:
+            path (tuple[str]): Command name, then the keys of the keywords
+                down to the object.
+
+        Returns:
+            PartOfSyntax: Command, keyword or BLOC.
+        """
+        obj = self._catalogs[path[0]]
+        if isinstance(obj, catalog_snapshot.SnapshotNode):
+            obj = self._import_command(path[0])
+        for key in path[1:]:
+            obj = obj.definition[key]
+        return obj
+
     @property
     def version(self):
         """str: Attribute that holds current catalog's version."""
         return self._version
 
+    @property
+    def path(self):
+        """str: Path of the *code_aster* package the catalog is read
+        from."""
+        return str(self._version_path) if self._version_path else None
+
     @property
     def version_number(self):
         """str: Attribute that holds current catalog's version number."""
@@ -191,7 +373,7 @@ class Catalogs:
                 from exc
         return vers.VERSION_MAJOR, vers.VERSION_MINOR, vers.VERSION_PATCH
 
-    def _add_conversion_commands(self):
+    def _add_conversion_commands(self, catalogs):
         """Add fake commands."""
         stx = self.package("Syntax")
         oper = stx.OPER
@@ -215,7 +397,7 @@ class Catalogs:
                 '_CONVERT_COMMENT': comment,
                 '_RESULT_OF_MACRO': hidden}
 
-        self._catalogs.update(fake)
+        catalogs.update(fake)
 
     # TODO Add a category for special "commands": _CONVERT_*
     def _fill_categories(self):
@@ -318,6 +500,8 @@ class Catalogs:
         Returns:
             bool: *True* if the command must return a result, *False* otherwise.
         """
+        if isinstance(command, catalog_snapshot.SnapshotNode):
+            command = command.resolve()
         need = isinstance(command, (self.package("Syntax").Operator,
                                     self.package("Syntax").Formule))
         if not need and isinstance(command, self.package("Syntax").Macro):
@@ -516,7 +700,10 @@ class Catalogs:
         Returns:
             str: Command's docstring.
         """
-        return self.get_catalog(command).udocstring
+        doc = self._docstrings.get(command)
+        if doc is None:
+            doc = self.get_catalog(command).udocstring
+        return doc
     
     def get_command_definition(self, command_name, context):
         """
@@ -569,15 +756,22 @@ class Catalogs:
                     lines.append(line)
 
         # Recherche de la commande dans le catalogue
-        for name, command_obj in self.iteritems():
-            if name == command_name:
-                lines.append(f"'{command_name}' : {self.get_command_docstring(command_name)}")
-                lines.append(f"Liste des arguments :")
-                _print_kwd(command_obj.definition, context = context)  
-                return "\n".join(lines)
-        return ""
+        command_obj = self._catalogs.get(command_name)
+        if command_obj is None:
+            return ""
+        lines.append(f"'{command_name}' : {self.get_command_docstring(command_name)}")
+        lines.append(f"Liste des arguments :")
+        _print_kwd(command_obj.definition, context = context)
+        return "\n".join(lines)
 
     def parse_kwd(self, definition, context):
+        """Liste des paramètres d'une définition (mots-clés simples,
+        facteurs et BLOCs avec leurs enfants). Avec un `context`, les BLOCs
+        inactifs sont omis.
+
+        Le résultat est figé (tuples et `MappingProxyType`) : il est
+        partagé par le cache de `parse_command`.
+        """
         params = []
 
         def _format_type(typ):
@@ -608,7 +802,7 @@ class Catalogs:
                 "val_min": kwd.definition.get("val_min"),
                 "val_max": kwd.definition.get("val_max"),
                 "doc": (getattr(kwd, "udocstring", "") or "").strip(),
-                "children": [],
+                "children": (),
                 "bloc": None
             }
 
@@ -620,34 +814,92 @@ class Catalogs:
                             continue
                 param["children"] = self.parse_kwd(kwd.definition, context=context)
 
-            params.append(param)
+            params.append(MappingProxyType(param))
+
+        return tuple(params)
 
-        return params
-    
     def get_command_obj(self, command_name):
-        for name, command_obj in self.iteritems():
-            if name == command_name:
-                return command_obj
+        return self._catalogs.get(command_name)
 
+    # Nombre de vues filtrées par contexte (BLOCs) gardées par parse_command
+    PARSED_VIEWS_SIZE = 128
 
-    def parse_command(self, command_obj,context= None):
-        return {
+    def parse_command(self, command_obj, context=None):
+        """Définition analysée d'une commande : nom, docstring et
+        paramètres (voir `parse_kwd`).
+
+        Sans contexte, le résultat est calculé une fois par commande. Les
+        vues filtrées par un contexte sont gardées dans un cache LRU indexé
+        par le contexte normalisé ; un contexte non hashable n'est pas mis
+        en cache. Le résultat est partagé : ne pas le modifier.
+        """
+        name = command_obj.name
+        if context is None:
+            parsed = self._parsed.get(name)
+            if parsed is None:
+                parsed = self._parsed[name] = self._parse_command(command_obj, None)
+            return parsed
+
+        try:
+            key = (name, _freeze_context(context))
+            hash(key)
+        except TypeError:
+            return self._parse_command(command_obj, context)
+        parsed = self._parsed_views.get(key)
+        if parsed is not None:
+            self._parsed_views.move_to_end(key)
+            return parsed
+        parsed = self._parsed_views[key] = self._parse_command(command_obj, context)
+        if len(self._parsed_views) > self.PARSED_VIEWS_SIZE:
+            self._parsed_views.popitem(last=False)
+        return parsed
+
+    def keyword_index(self, command_obj):
+        """Index des mots-clés d'une commande (voir `KeywordIndex`),
+        construit au premier usage puis partagé.
+        """
+        name = command_obj.name
+        index = self._indexes.get(name)
+        if index is None:
+            params = self.parse_command(command_obj)["params"]
+            index = self._indexes.setdefault(
+                name, KeywordIndex(command_obj.definition, params))
+        return index
+
+    def _parse_command(self, command_obj, context):
+        return MappingProxyType({
                 "name": command_obj.name,
                 "doc": self.get_command_docstring(command_obj.name),
                 "params": self.parse_kwd(command_obj.definition,context)
-            }
+            })
 
     def get_commands(self) -> list[dict]:
         commands = []
-        for name, command_obj in self.iteritems():
+        for name in self:
             commands.append({
                 "name": name,
-                "doc": self.get_command_docstring(command_obj.name)
+                "doc": self.get_command_docstring(name)
             })
         return commands
 
 
 
+def _clog(msg):
+    # Log to stderr only — stdout is the LSP JSON-RPC transport
+    # and any pollution breaks the protocol.
+    sys.stderr.write("[catalog] " + msg + "\n")
+    sys.stderr.flush()
+
+def _freeze_context(value):
+    """Forme hashable et indépendante de l'ordre d'un contexte
+    d'évaluation des BLOCs (mots-clés -> valeurs)."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze_context(val))
+                            for key, val in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_context(val) for val in value)
+    return value
+
 def _hidden_prod(**kwargs):
     decl = kwargs.get("DECL")
     if decl:
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keyword index
+-------------
+
+Flattened keyword tree of a command, to find a keyword by its name
+without walking the tree.
+
+Each keyword (simple or factor) gets a `KeywordEntry`: its path in the
+definition, the factor keyword that encloses it and the BLOCs that must
+be enabled for it to be visible. Looking a keyword up is a dict access
+then the evaluation of these BLOC conditions.
+
+A `KeywordIndex` covers one scope: the command, or the content of a
+factor keyword (`KeywordEntry.scope`). The BLOCs of a scope are
+transparent: their keywords belong to the enclosing scope.
+"""
+
+
+def _is_bloc(kwd):
+    return "Bloc" in type(kwd).__name__
+
+
+def _is_factor(kwd):
+    return "FactorKeyword" in type(kwd).__name__
+
+
+def _enabled(guards, context):
+    """Tell if all the BLOCs of *guards* are enabled by *context*. A BLOC
+    condition that can not be evaluated does not hide its keywords."""
+    if context is None:
+        return True
+    for bloc in guards:
+        try:
+            if not bloc.isEnabled(context):
+                return False
+        except Exception: # pylint: disable=broad-except
+            pass
+    return True
+
+
+class KeywordEntry:
+    """A keyword of the index.
+
+    Attributes:
+        name (str): Keyword name.
+        keyword (PartOfSyntax): Catalog object of the keyword.
+        param (dict): Parsed parameter of the keyword (see
+            `Catalogs.parse_kwd`), *None* if unknown.
+        path (tuple[str]): Keys from the command down to the keyword,
+            BLOCs included.
+        factor (KeywordEntry): Enclosing factor keyword, *None* at the
+            command level.
+        guards (tuple[Bloc]): BLOCs enclosing the keyword, from the
+            command level.
+        scope (KeywordIndex): Index of the content of a factor keyword,
+            *None* for a simple keyword.
+    """
+
+    __slots__ = ("name", "keyword", "param", "path", "factor", "guards",
+                 "scope")
+
+    def __init__(self, name, keyword, param, path, factor, guards):
+        self.name = name
+        self.keyword = keyword
+        self.param = param
+        self.path = path
+        self.factor = factor
+        self.guards = guards
+        self.scope = None
+
+    def __repr__(self):
+        return "<KeywordEntry {0}>".format("/".join(self.path))
+
+
+class KeywordIndex:
+    """Keywords of a command or of a factor keyword, by name.
+
+    Arguments:
+        definition (dict): Definition of the command or factor keyword.
+        params (list[dict]): Parsed parameters of *definition* (see
+            `Catalogs.parse_kwd`) to attach to the entries, if known.
+        path (tuple[str]): Keys down to *definition*.
+        factor (KeywordEntry): Entry of the factor keyword, if any.
+        guards (tuple[Bloc]): BLOCs enclosing *definition*.
+    """
+
+    def __init__(self, definition, params=None, path=(), factor=None,
+                 guards=()):
+        # the guards of the enclosing scopes do not apply here
+        self._offset = len(guards)
+        self._entries = []
+        self._all = []
+        self._fill(definition, params, path, factor, guards)
+        self._local = _by_name(self._entries)
+        self._names = _by_name(self._all)
+
+    def _fill(self, definition, params, path, factor, guards):
+        params = {param["name"]: param for param in params or ()}
+        for key, kwd in definition.items():
+            if not hasattr(kwd, "definition"):
+                continue
+            param = params.get(key)
+            if _is_bloc(kwd):
+                children = param["children"] if param else None
+                self._fill(kwd.definition, children, path + (key,), factor,
+                           guards + (kwd,))
+                continue
+            entry = KeywordEntry(key, kwd, param, path + (key,), factor,
+                                 guards)
+            self._entries.append(entry)
+            self._all.append(entry)
+            if _is_factor(kwd):
+                children = param["children"] if param else None
+                entry.scope = KeywordIndex(kwd.definition, children,
+                                           entry.path, entry, guards)
+                self._all.extend(entry.scope._all)
+
+    @property
+    def entries(self):
+        """list[KeywordEntry]: Keywords of the scope, in definition
+        order."""
+        return self._entries
+
+    def find(self, name, context=None):
+        """Return the first keyword named *name* at any depth (factor
+        keywords included), in definition order, that is visible with
+        *context*.
+
+        Arguments:
+            name (str): Keyword name.
+            context (dict): Keywords values to evaluate the BLOCs, *None*
+                to ignore the BLOCs.
+
+        Returns:
+            KeywordEntry: Entry of the keyword, *None* if not found.
+        """
+        return self._first(self._names.get(name, ()), context)
+
+    def find_local(self, name, context=None):
+        """Same as `find` but only in this scope (not in the factor
+        keywords)."""
+        return self._first(self._local.get(name, ()), context)
+
+    def visible(self, context=None):
+        """Return the keywords of this scope visible with *context*.
+
+        Returns:
+            list[KeywordEntry]: Visible entries, in definition order.
+        """
+        if context is None:
+            return list(self._entries)
+        return [entry for entry in self._entries
+                if _enabled(entry.guards[self._offset:], context)]
+
+    def _first(self, entries, context):
+        for entry in entries:
+            if _enabled(entry.guards[self._offset:], context):
+                return entry
+        return None
+
+
+def _by_name(entries):
+    """Group entries by name, keeping their order."""
+    names = {}
+    for entry in entries:
+        names.setdefault(entry.name, []).append(entry)
+    return {name: tuple(group) for name, group in names.items()}
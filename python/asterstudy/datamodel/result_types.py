@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""
+Result types
+------------
+
+Types of the results of the commands, and compatibility between data
+structure types, computed once per catalog.
+
+`ResultTypes.of` gives the classes a command may return (`sd_prod`
+called with `__all__=True`), `compatible` tells if a result of some types
+can be passed to a keyword expecting others, and `commands_for` is the
+reverse index: the commands whose result fits an expected type.
+
+With a snapshot, the result types are known by name from the manifest
+and the commands are not read to answer.
+"""
+
+import inspect
+
+
+def command_result_types(command):
+    """Resolve `sd_prod` of a command to a tuple of concrete classes.
+
+    `sd_prod` may be a class, a callable that returns a class or a tuple
+    of classes when called with `__all__=True` (its positional arguments
+    are set to *None*), or *None*.
+
+    Arguments:
+        command (Command): Catalog object of the command.
+
+    Returns:
+        tuple[type]: Possible result classes, empty on any failure.
+    """
+    try:
+        sd_prod = command.definition.get("sd_prod")
+    except Exception: # pylint: disable=broad-except
+        return ()
+    if sd_prod is None:
+        return ()
+    if isinstance(sd_prod, type):
+        return (sd_prod,)
+    if not callable(sd_prod):
+        return ()
+    try:
+        positional = [
+            param for param in inspect.signature(sd_prod).parameters.values()
+            if param.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
+            and param.default is inspect.Parameter.empty]
+        result = sd_prod(*([None] * len(positional)), __all__=True)
+    except Exception: # pylint: disable=broad-except
+        return ()
+    if isinstance(result, type):
+        return (result,)
+    if isinstance(result, (tuple, list)):
+        return tuple(typ for typ in result if isinstance(typ, type))
+    return ()
+
+
+class ResultTypes:
+    """Result types of the commands of a `Catalogs`.
+
+    Arguments:
+        catalogs (Catalogs): Catalogs of the commands.
+    """
+
+    def __init__(self, catalogs):
+        self._catalogs = catalogs
+        self._names = {}
+        self._types = {}
+        self._matrix = None
+        self._commands = {}
+
+    def clear(self, names=None):
+        """Forget everything computed (when the catalog changes).
+
+        Arguments:
+            names (dict): Names of the result classes of each command, as
+                stored in a snapshot (*None* for a command whose types are
+                not known by name).
+        """
+        self._names = dict(names or {})
+        self._types.clear()
+        self._matrix = None
+        self._commands.clear()
+
+    def of(self, name):
+        """Return the classes a command may return.
+
+        Arguments:
+            name (str): Command name.
+
+        Returns:
+            tuple[type]: Result classes, empty if unknown.
+        """
+        types = self._types.get(name)
+        if types is None:
+            types = self._types.setdefault(name, self._resolve(name))
+        return types
+
+    def _resolve(self, name):
+        names = self._names.get(name)
+        if names is not None:
+            package = self._catalogs.package("DataStructure")
+            types = tuple(getattr(package, typ, None) for typ in names)
+            if None not in types:
+                return types
+        command = self._catalogs.get_command_obj(name)
+        if command is None:
+            return ()
+        return command_result_types(command)
+
+    def matrix(self):
+        """Return the subclass-compatibility matrix of the data structure
+        types: for each class, the set of the classes it can be passed
+        as.
+
+        Returns:
+            dict[type, frozenset[type]]: Compatible classes of each data
+            structure class.
+        """
+        if self._matrix is None:
+            package = self._catalogs.package("DataStructure")
+            base = self._catalogs.baseds
+            classes = {obj for obj in vars(package).values()
+                       if isinstance(obj, type) and issubclass(obj, base)}
+            self._matrix = {
+                typ: frozenset(other for other in classes
+                               if issubclass(typ, other))
+                for typ in classes}
+        return self._matrix
+
+    def compatible(self, types, expected):
+        """Tell if a result of one of *types* fits one of *expected*.
+
+        Arguments:
+            types (tuple[type]): Result classes.
+            expected (tuple[type]): Classes expected by a keyword.
+
+        Returns:
+            bool: *True* if one of *types* is a subclass of one of
+            *expected*.
+        """
+        if not types or not expected:
+            return False
+        matrix = self.matrix()
+        for typ in types:
+            compatible = matrix.get(typ)
+            for other in expected:
+                if compatible is not None and other in matrix:
+                    if other in compatible:
+                        return True
+                    continue
+                try:
+                    if issubclass(typ, other):
+                        return True
+                except TypeError:
+                    continue
+        return False
+
+    def commands_for(self, expected):
+        """Return the commands whose result fits one of the *expected*
+        classes.
+
+        Arguments:
+            expected (tuple[type]): Classes expected by a keyword.
+
+        Returns:
+            frozenset[str]: Names of the commands.
+        """
+        expected = tuple(expected)
+        commands = self._commands.get(expected)
+        if commands is None:
+            commands = frozenset(name for name in list(self._catalogs)
+                                 if self.compatible(self.of(name), expected))
+            commands = self._commands.setdefault(expected, commands)
+        return commands
@@ -0,0 +1,266 @@
+# Measure the cost of loading and querying the vendored code_aster catalog:
+#   * cold import of `asterstudy.datamodel.catalogs.CATA`, with and without
+#     the on-disk snapshot;
+#   * the phases of `read_catalogs` (packages, commands, conversion
+#     commands, categories);
+#   * peak RSS and number of tracked objects once the catalog is loaded;
+#   * per-call cost of `get_command_obj`, `parse_command`, `get_commands`
+#     and `Bloc.isEnabled` on a few representative commands.
+# Every measurement runs in a fresh interpreter (this script re-runs itself
+# with --child), with a private snapshot directory, so runs are reproducible
+# and need no network. The results are printed and written as JSON to track
+# startup regressions.
+# usage: python python/benchmarks/bench_catalog.py [--repeat 5] [--output catalog_bench.json]
+
+import argparse
+import gc
+import json
+import os
+import pathlib as pl
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pl.Path(__file__).parent.parent
+
+COMMANDS = [
+    "DEBUT",
+    "LIRE_MAILLAGE",
+    "AFFE_MODELE",
+    "AFFE_CHAR_MECA",
+    "STAT_NON_LINE",
+    "CALC_CHAMP",
+]
+
+# Catalog modes of the children: the server default, and a full import
+MODES = {"snapshot": "1", "import": "0"}
+
+
+def _rss_kib() -> int:
+    """Peak resident set size of this process, in KiB (Linux units)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _time_calls(func, args: list[tuple], min_time: float) -> dict:
+    """Time `func` over `args`: the first pass (cold caches) and the mean
+    of the following passes, in microseconds per call."""
+    t0 = time.perf_counter()
+    for arg in args:
+        func(*arg)
+    first = (time.perf_counter() - t0) * 1e6 / len(args)
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        for arg in args:
+            func(*arg)
+        calls += len(args)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            break
+    return {"firstUs": round(first, 3), "meanUs": round(elapsed * 1e6 / calls, 3), "calls": calls}
+
+
+def _entries(index):
+    """Every entry of a `KeywordIndex`, factor keywords content included."""
+    for entry in index.entries:
+        yield entry
+        if entry.scope is not None:
+            yield from _entries(entry.scope)
+
+
+# ------------------------------------------------------------------ children
+
+
+def child_load(min_time: float) -> dict:
+    """Import CATA, then measure memory and the per-call costs."""
+    sys.path.insert(0, str(ROOT))
+    import lsp  # noqa: F401 (sys.path setup of the server)
+
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    rss_before = _rss_kib()
+    t0 = time.perf_counter()
+    from asterstudy.datamodel.catalogs import CATA
+
+    import_ms = (time.perf_counter() - t0) * 1000
+    gc.collect()
+    result = {
+        "importMs": round(import_ms, 3),
+        "commands": len(list(CATA)),
+        "rssKiB": {"before": rss_before, "loaded": _rss_kib()},
+        "objects": {"loaded": len(gc.get_objects()) - objects_before},
+    }
+
+    names = [(name,) for name in COMMANDS if name in CATA]
+    objs = [(CATA.get_command_obj(name),) for (name,) in names]
+    calls = {
+        "get_command_obj": _time_calls(CATA.get_command_obj, names, min_time),
+        "parse_command": _time_calls(CATA.parse_command, objs, min_time),
+        "get_commands": _time_calls(CATA.get_commands, [()], min_time),
+    }
+    sys.path.insert(0, str(ROOT / "lsp"))
+    from validators import simp_defaults
+
+    blocs = []
+    for (cmd,) in objs:
+        context = simp_defaults(cmd.definition)
+        seen: set[int] = set()
+        for entry in _entries(CATA.keyword_index(cmd)):
+            for bloc in entry.guards:
+                if id(bloc) not in seen:
+                    seen.add(id(bloc))
+                    blocs.append((bloc, context))
+    if blocs:
+        calls["Bloc.isEnabled"] = _time_calls(
+            lambda bloc, context: bloc.isEnabled(context), blocs, min_time
+        )
+    result["calls"] = calls
+    result["blocs"] = len(blocs)
+
+    # Everything a long session ends up reading
+    for name in list(CATA):
+        CATA.parse_command(CATA.get_command_obj(name))
+    gc.collect()
+    result["rssKiB"]["allParsed"] = _rss_kib()
+    result["objects"]["allParsed"] = len(gc.get_objects()) - objects_before
+    return result
+
+
+def child_phases() -> dict:
+    """Time the phases of `read_catalogs` on a second catalog of the same
+    path (its modules are imported again)."""
+    sys.path.insert(0, str(ROOT))
+    import lsp  # noqa: F401
+    from asterstudy.datamodel import catalog_snapshot
+    from asterstudy.datamodel.catalogs import CATA, Catalogs
+
+    phases: dict[str, float] = {}
+
+    def timed(owner, attr, phase):
+        func = getattr(owner, attr)
+
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                phases[phase] = phases.get(phase, 0.0) + ms
+
+        setattr(owner, attr, wrapper)
+
+    timed(Catalogs, "_import_packages", "packages")
+    timed(Catalogs, "_import_commands", "commands")
+    timed(Catalogs, "_add_conversion_commands", "conversion")
+    timed(Catalogs, "_fill_categories", "categories")
+    timed(catalog_snapshot, "load", "snapshotLoad")
+    timed(catalog_snapshot, "build", "snapshotBuild")
+    timed(catalog_snapshot, "save", "snapshotSave")
+
+    t0 = time.perf_counter()
+    Catalogs(path=CATA.path)
+    total = (time.perf_counter() - t0) * 1000
+    # `_import_commands` includes the packages and the conversion commands
+    if "commands" in phases:
+        phases["commands"] -= phases.get("packages", 0.0) + phases.get("conversion", 0.0)
+    result = {phase: round(ms, 3) for phase, ms in phases.items()}
+    result["total"] = round(total, 3)
+    return result
+
+
+# ------------------------------------------------------------------ parent
+
+
+def run_child(task: str, mode: str, snapshot_dir: str, min_time: float) -> dict:
+    env = dict(os.environ)
+    env.pop("VS_CODE_ASTER_CATA_PATH", None)
+    env["VS_CODE_ASTER_CATA_SNAPSHOT"] = MODES[mode]
+    env["VS_CODE_ASTER_SNAPSHOT_DIR"] = snapshot_dir
+    cmd = [sys.executable, __file__, "--child", task, "--min-time", str(min_time)]
+    out = subprocess.run(
+        cmd, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    return json.loads(out.stdout)
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "min": round(min(values), 3),
+        "median": round(statistics.median(values), 3),
+        "max": round(max(values), 3),
+        "runs": [round(value, 3) for value in values],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog load-time and memory benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measure")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per call timing")
+    parser.add_argument("--output", default="catalog_bench.json", help="JSON results file")
+    parser.add_argument("--child", choices=["load", "phases"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "load":
+        print(json.dumps(child_load(args.min_time)))
+        return
+    if args.child == "phases":
+        print(json.dumps(child_phases()))
+        return
+
+    results: dict = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": args.repeat,
+        "modes": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="catalog-bench-") as snapshot_dir:
+        # Write the snapshot once, so the snapshot mode measures its reading
+        run_child("load", "snapshot", snapshot_dir, 0.01)
+        for mode in MODES:
+            loads = [
+                run_child("load", mode, snapshot_dir, args.min_time) for _ in range(args.repeat)
+            ]
+            phases = [run_child("phases", mode, snapshot_dir, 0.0) for _ in range(args.repeat)]
+            last = loads[-1]
+            results["modes"][mode] = {
+                "commands": last["commands"],
+                "importMs": summarize([load["importMs"] for load in loads]),
+                "phasesMs": {
+                    phase: summarize([run.get(phase, 0.0) for run in phases])
+                    for phase in sorted({phase for run in phases for phase in run})
+                },
+                "rssKiB": last["rssKiB"],
+                "objects": last["objects"],
+                "blocs": last["blocs"],
+                "calls": last["calls"],
+            }
+
+    for mode, data in results["modes"].items():
+        rss = data["rssKiB"]
+        print(f"[{mode}] {data['commands']} commands")
+        print(f"  cold import of CATA: {data['importMs']['median']:.1f} ms (median)")
+        for phase, stats in data["phasesMs"].items():
+            print(f"  read_catalogs {phase:<14} {stats['median']:>10.1f} ms")
+        print(
+            f"  peak RSS: {rss['before'] / 1024:.1f} MiB before, {rss['loaded'] / 1024:.1f} "
+            f"loaded, {rss['allParsed'] / 1024:.1f} with every command parsed"
+        )
+        print(
+            f"  objects: {data['objects']['loaded']} loaded, "
+            f"{data['objects']['allParsed']} with every command parsed"
+        )
+        print(f"  {'call':<16} {'first (us)':>11} {'mean (us)':>10}")
+        for name, stats in data["calls"].items():
+            print(f"  {name:<16} {stats['firstUs']:>11.1f} {stats['meanUs']:>10.2f}")
+
+    pl.Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
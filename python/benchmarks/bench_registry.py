@@ -0,0 +1,127 @@
+# Measure the per-keystroke cost of CommandRegistry.on_document_change on
+# synthetic .comm files of growing size. With the incremental re-parse the
+# cost per keystroke should stay flat as the document grows; with the
+# keyword position cache, a diagnostics pass after an edit only re-scans
+# the edited command.
+# usage: python python/benchmarks/bench_registry.py [--sizes 500 2000 10000]
+
+import argparse
+import pathlib as pl
+import sys
+import time
+
+sys.path.insert(0, str(pl.Path(__file__).parent.parent / "lsp"))
+
+from command_registry import CommandRegistry  # noqa: E402
+
+COMMAND_TEMPLATE = [
+    "CHAR{i} = AFFE_CHAR_MECA(",
+    "    MODELE=MODELE,",
+    "    DDL_IMPO=_F(GROUP_MA='BORD{i}', DX=0.0, DY=0.0),",
+    "    PRES_REP=_F(GROUP_MA='HAUT{i}', PRES={i}.0),",
+    ")",
+    "",
+]
+
+
+def make_document(n_lines: int) -> list[str]:
+    """Build a document of about `n_lines` lines of AFFE_CHAR_MECA calls,
+    split like `Document.lines` (line endings kept)."""
+    lines = ["DEBUT()\n", "\n"]
+    i = 0
+    while len(lines) < n_lines:
+        lines.extend(line.format(i=i) + "\n" for line in COMMAND_TEMPLATE)
+        i += 1
+    lines.append("FIN()\n")
+    return lines
+
+
+def bench_keystrokes(lines: list[str], n_keys: int) -> float:
+    """Type `n_keys` characters into a kwarg value in the middle of the
+    document and return the mean cost of one update, in milliseconds."""
+    registry = CommandRegistry()
+    registry.initialize(None, lines)
+
+    # Line `    MODELE=MODELE,` of the command in the middle of the file
+    target = len(lines) // 2
+    while not lines[target].lstrip().startswith("MODELE="):
+        target += 1
+    col = lines[target].index(",")
+
+    t0 = time.perf_counter()
+    for k in range(n_keys):
+        # Same delta as a textDocument/didChange (0-based range)
+        registry.apply_text_change(target, col, target, col, "X")
+        col += 1
+        if k % 2:
+            # Also split and re-join the line so later commands get shifted
+            registry.apply_text_change(target, col, target, col, "\n")
+            registry.apply_text_change(target, col, target + 1, 0, "")
+    elapsed = time.perf_counter() - t0
+    return elapsed * 1000 / n_keys
+
+
+def bench_keyword_positions(lines: list[str], n_keys: int) -> tuple[float, float, float]:
+    """Mimic one diagnostics pass per keystroke: keyword positions of every
+    command after typing in the middle of the document. Returns the mean
+    cost of a pass in milliseconds (cold, then after an edit) and the
+    cache hit rate."""
+    registry = CommandRegistry()
+    registry.initialize(None, lines)
+
+    t0 = time.perf_counter()
+    for cmd_info in registry.commands.values():
+        registry.parse_keyword_positions(cmd_info)
+    cold_ms = (time.perf_counter() - t0) * 1000
+
+    target = len(lines) // 2
+    while not lines[target].lstrip().startswith("MODELE="):
+        target += 1
+    col = lines[target].index(",")
+    hits, misses = registry.kwarg_cache_hits, registry.kwarg_cache_misses
+    t0 = time.perf_counter()
+    for _ in range(n_keys):
+        registry.apply_text_change(target, col, target, col, "\n")
+        for cmd_info in registry.commands.values():
+            registry.parse_keyword_positions(cmd_info)
+    warm_ms = (time.perf_counter() - t0) * 1000 / n_keys
+    hits = registry.kwarg_cache_hits - hits
+    misses = registry.kwarg_cache_misses - misses
+    return cold_ms, warm_ms, 100 * hits / (hits + misses)
+
+
+def bench_full_reparse(lines: list[str], n_runs: int) -> float:
+    """Mean cost of a full reparse, in milliseconds (the previous
+    per-keystroke cost)."""
+    registry = CommandRegistry()
+    registry.initialize(None, lines)
+    t0 = time.perf_counter()
+    for _ in range(n_runs):
+        registry.initialize(None, lines)
+    return (time.perf_counter() - t0) * 1000 / n_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CommandRegistry keystroke benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 5000, 10000])
+    parser.add_argument("--keys", type=int, default=200, help="keystrokes per size")
+    args = parser.parse_args()
+
+    print(f"{'lines':>8} {'keystroke (ms)':>16} {'full reparse (ms)':>19}")
+    for size in args.sizes:
+        lines = make_document(size)
+        key_ms = bench_keystrokes(list(lines), args.keys)
+        full_ms = bench_full_reparse(lines, 5)
+        print(f"{len(lines):>8} {key_ms:>16.3f} {full_ms:>19.3f}")
+
+    print()
+    print(f"{'commands':>8} {'cold pass (ms)':>16} {'pass after edit (ms)':>22} {'hit rate':>9}")
+    for size in args.sizes:
+        lines = make_document(size)
+        n_commands = (len(lines) - 3) // len(COMMAND_TEMPLATE)
+        cold_ms, warm_ms, rate = bench_keyword_positions(list(lines), 20)
+        print(f"{n_commands:>8} {cold_ms:>16.3f} {warm_ms:>22.3f} {rate:>8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
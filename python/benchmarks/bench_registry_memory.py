@@ -0,0 +1,71 @@
+# Measure the memory held by a CommandRegistry built over the sample .comm
+# files of python/data, concatenated and repeated to simulate large studies.
+# Reports the traced allocation size of the registry (commands, range index,
+# per-line tokens) and the per-command cost.
+# usage: python python/benchmarks/bench_registry_memory.py [--scales 1 10 100]
+
+import argparse
+import gc
+import pathlib as pl
+import sys
+import time
+import tracemalloc
+
+ROOT = pl.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "lsp"))
+
+from command_registry import CommandRegistry  # noqa: E402
+
+DATA_DIR = ROOT / "data"
+
+
+def load_samples() -> list[str]:
+    """All sample files, one after the other, split like `Document.lines`."""
+    lines: list[str] = []
+    for path in sorted(DATA_DIR.glob("*.comm")):
+        lines.extend(path.read_text(encoding="utf-8", errors="replace").splitlines(True))
+    return lines
+
+
+def measure(lines: list[str]) -> tuple[CommandRegistry, int, float]:
+    """Build a registry over `lines`. Returns it with the bytes still
+    allocated once built and the build time in milliseconds."""
+    gc.collect()
+    tracemalloc.start()
+    base, _peak = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    registry = CommandRegistry()
+    registry.initialize(None, lines)
+    for cmd_info in registry.commands.values():
+        registry.parse_keyword_positions(cmd_info)
+    elapsed = (time.perf_counter() - t0) * 1000
+    gc.collect()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return registry, current - base, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CommandRegistry memory benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    sample = load_samples()
+    print(
+        f"{'scale':>6} {'lines':>9} {'commands':>9} {'registry (MiB)':>15} "
+        f"{'bytes/command':>14} {'build (ms)':>11}"
+    )
+    for scale in args.scales:
+        lines = sample * scale
+        registry, size, elapsed = measure(lines)
+        n_commands = len(registry.commands)
+        per_command = size / n_commands if n_commands else 0
+        print(
+            f"{scale:>6} {len(lines):>9} {n_commands:>9} {size / 2**20:>15.2f} "
+            f"{per_command:>14.0f} {elapsed:>11.0f}"
+        )
+        del registry
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Catalogs of several code_aster versions in one server
+
+`CatalogPool` keeps the catalogs loaded so far, keyed by the path of
+their `code_aster` package, and tells which one a document uses. The
+catalog the server started with (`CATA`) always stays; the others are
+loaded on demand and, beyond `VS_CODE_ASTER_CATALOG_POOL_SIZE` catalogs
+(3 by default), evicted least recently used first. A catalog used by an
+open document, a workspace folder or as the default is never evicted.
+
+A document uses, in that order:
+  * the version of a `.export` file next to it that lists it as its
+    `comm` file (`P version <version>`: a catalog path, or a version
+    extracted under ~/.cache/vs-code-aster/catalogs);
+  * the catalog selected for its workspace folder;
+  * the default catalog.
+
+The binding is computed when the document is opened (`bind`), and again
+for the open documents when a catalog is selected (`codeaster/selectCatalog`).
+Catalogs are loaded out of the pool's lock, which only guards its maps, so
+that the documents of the loaded catalogs are served meanwhile.
+"""
+
+import os
+import os.path as osp
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from asterstudy.datamodel.catalogs import Catalogs
+from pygls.uris import to_fs_path
+
+_EXPORT_VERSION = re.compile(r"^\s*P\s+version\s+(\S+)", re.M)
+_EXPORT_COMM = re.compile(r"^\s*F\s+comm\s+(\S+)\s+D\b", re.M)
+
+
+def _log(msg: str) -> None:
+    sys.stderr.write(f"[catalog] {msg}\n")
+    sys.stderr.flush()
+
+
+def catalog_key(path: str) -> str:
+    """Normalized path, to compare catalogs and documents."""
+    return osp.normcase(osp.abspath(str(path)))
+
+
+def version_path(version: str) -> str | None:
+    """Path of the `code_aster` package of a version: the version itself
+    if it is such a directory, or the catalog extracted for it by the
+    extension."""
+    if osp.isdir(osp.join(version, "Cata")):
+        return version
+    path = osp.join(
+        osp.expanduser("~"), ".cache", "vs-code-aster", "catalogs", version, "code_aster"
+    )
+    if osp.isdir(osp.join(path, "Cata")):
+        return path
+    return None
+
+
+def export_version(doc_path: str) -> str | None:
+    """Version set by a `.export` file of the document's directory that
+    lists the document as its `comm` file."""
+    folder = osp.dirname(doc_path)
+    try:
+        names = sorted(name for name in os.listdir(folder) if name.endswith(".export"))
+    except OSError:
+        return None
+    key = catalog_key(doc_path)
+    for name in names:
+        try:
+            with open(osp.join(folder, name), encoding="utf-8", errors="replace") as file:
+                text = file.read()
+        except OSError:
+            continue
+        version = _EXPORT_VERSION.search(text)
+        if version is None:
+            continue
+        for comm in _EXPORT_COMM.findall(text):
+            if catalog_key(osp.join(folder, comm)) == key:
+                return version.group(1)
+    return None
+
+
+def _export_catalog(doc_path: str) -> str | None:
+    """Path of the catalog of the `.export` version of a document."""
+    version = export_version(doc_path)
+    if not version:
+        return None
+    found = version_path(version)
+    if found is None:
+        _log(f"no catalog for version {version!r} of {doc_path}")
+    return found
+
+
+def _doc_path(doc_uri: str) -> str | None:
+    try:
+        return to_fs_path(doc_uri)
+    except Exception:
+        return None
+
+
+class CatalogPool:
+    """Loaded catalogs and the catalog of each document."""
+
+    def __init__(self, default: Catalogs, size: int | None = None):
+        if size is None:
+            try:
+                size = int(os.environ.get("VS_CODE_ASTER_CATALOG_POOL_SIZE", "3"))
+            except ValueError:
+                size = 3
+        self._size = max(1, size)
+        self._lock = threading.RLock()
+        # Held while a catalog is loaded, so that it is loaded once
+        self._load_lock = threading.Lock()
+        self._pinned = catalog_key(default.path or "")
+        self._catalogs: OrderedDict[str, Catalogs] = OrderedDict({self._pinned: default})
+        self._default = self._pinned
+        # workspace folder path -> catalog key
+        self._scopes: dict[str, str] = {}
+        # document URI -> catalog key
+        self._documents: dict[str, str] = {}
+
+    # ====== Catalogs ======
+
+    def get(self, path: str, use=None) -> Catalogs | None:
+        """Catalog read from `path`, loaded if needed. None if it can't
+        be loaded. `use(key)` is called under the lock once the catalog
+        is in the pool, before any eviction."""
+        key = catalog_key(path)
+        with self._lock:
+            catalogs = self._hit(key, use)
+        if catalogs is not None:
+            return catalogs
+        with self._load_lock:
+            with self._lock:
+                catalogs = self._hit(key, use)
+            if catalogs is not None:
+                return catalogs
+            if not osp.isdir(osp.join(path, "Cata")):
+                _log(f"{path} is not a code_aster directory")
+                return None
+            _log(f"loading catalog {path}")
+            try:
+                catalogs = Catalogs(path=path)
+            except Exception as exc:
+                _log(f"can not load catalog {path}: {exc!r}")
+                return None
+            with self._lock:
+                self._catalogs[key] = catalogs
+                if use is not None:
+                    use(key)
+                self._evict(key)
+            return catalogs
+
+    def _hit(self, key: str, use) -> Catalogs | None:
+        catalogs = self._catalogs.get(key)
+        if catalogs is not None:
+            self._catalogs.move_to_end(key)
+            if use is not None:
+                use(key)
+        return catalogs
+
+    def default(self) -> Catalogs:
+        """Catalog of the documents without any other binding."""
+        with self._lock:
+            return self._catalogs[self._default]
+
+    def loaded(self) -> list[str]:
+        """Paths of the loaded catalogs, least recently used first."""
+        with self._lock:
+            return [catalogs.path or key for key, catalogs in self._catalogs.items()]
+
+    def _evict(self, loaded: str) -> None:
+        used = {self._pinned, self._default, loaded}
+        used.update(self._scopes.values())
+        used.update(self._documents.values())
+        for key in list(self._catalogs):
+            if len(self._catalogs) <= self._size:
+                return
+            if key in used:
+                continue
+            _log(f"releasing catalog {key}")
+            self._catalogs.pop(key).release()
+
+    # ====== Selection ======
+
+    def set_default(self, path: str | None) -> bool:
+        """Use the catalog at `path` (the initial one if None) for the
+        documents without any other binding. False if it can't be
+        loaded."""
+        if not path:
+            with self._lock:
+                self._default = self._pinned
+            return True
+
+        def use(key):
+            self._default = key
+
+        return self.get(path, use) is not None
+
+    def set_scope(self, folder_uri: str, path: str | None) -> bool:
+        """Use the catalog at `path` for the documents of a workspace
+        folder (remove the folder's catalog if None)."""
+        folder = _doc_path(folder_uri)
+        if folder is None:
+            return False
+        folder = catalog_key(folder)
+        if not path:
+            with self._lock:
+                self._scopes.pop(folder, None)
+            return True
+
+        def use(key):
+            self._scopes[folder] = key
+
+        return self.get(path, use) is not None
+
+    # ====== Documents ======
+
+    def bind(self, doc_uri: str, load: bool = True) -> Catalogs:
+        """Compute, remember and return the catalog of a document. With
+        `load` False, the catalog of its `.export` version is only used
+        if it is already loaded (see `unloaded`)."""
+        path = _doc_path(doc_uri)
+        found = _export_catalog(path) if path is not None else None
+
+        def use(key):
+            self._documents[doc_uri] = key
+
+        if found is not None and load:
+            catalogs = self.get(found, use)
+            if catalogs is not None:
+                return catalogs
+        with self._lock:
+            key = self._resolve(path, found)
+            self._documents[doc_uri] = key
+            return self._catalogs[key]
+
+    def unloaded(self, doc_uri: str) -> str | None:
+        """Path of the catalog of the `.export` version of a document, if
+        it isn't loaded yet."""
+        path = _doc_path(doc_uri)
+        version = export_version(path) if path is not None else None
+        found = version_path(version) if version else None
+        if found is None:
+            return None
+        with self._lock:
+            return None if catalog_key(found) in self._catalogs else found
+
+    def unbind(self, doc_uri: str) -> None:
+        """Forget a closed document."""
+        with self._lock:
+            self._documents.pop(doc_uri, None)
+
+    def for_document(self, doc_uri: str) -> Catalogs:
+        """Catalog of a document, bound on first use."""
+        with self._lock:
+            key = self._documents.get(doc_uri)
+            catalogs = self._catalogs.get(key) if key is not None else None
+        if catalogs is None:
+            return self.bind(doc_uri, load=False)
+        return catalogs
+
+    def _resolve(self, path: str | None, found: str | None) -> str:
+        if path is None:
+            return self._default
+        if found is not None and catalog_key(found) in self._catalogs:
+            return catalog_key(found)
+        key = catalog_key(path)
+        scope = max(
+            (folder for folder in self._scopes if key.startswith(folder + os.sep)),
+            key=len,
+            default=None,
+        )
+        if scope is not None and self._scopes[scope] in self._catalogs:
+            return self._scopes[scope]
+        return self._default
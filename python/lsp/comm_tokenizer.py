@@ -0,0 +1,82 @@
+"""
+Single-pass tokenizer for `.comm` source lines
+
+Every consumer that used to walk the text character by character (command
+boundaries, level 1 parameters, keyword positions, completion context)
+reads the same token stream, so string, comment and escape rules are
+defined once, here.
+
+Tokens are produced per line: Python strings in `.comm` files never span
+lines, and per-line lists let the registry re-tokenize only the lines an
+edit touched. A token doesn't store its line — that's the index of the
+list it lives in — so inserting lines doesn't rewrite the tokens after.
+"""
+
+import re
+import sys
+from typing import NamedTuple
+
+# Token kinds
+IDENT = "ident"  # `\w+`: names, keywords, numbers' digit runs
+STRING = "string"  # quoted string closed on the same line
+OPEN_STRING = "open_string"  # quote left open, runs to end of line
+LPAREN = "("
+RPAREN = ")"
+EQUALS = "="  # a lone `=`, never part of `==`, `<=`, `>=`, `!=`
+COMMA = ","
+COMMENT = "comment"  # `#` up to end of line
+OP = "op"  # anything else (`.`, `-`, `==`, `[`, ...)
+
+_TOKEN_RE = re.compile(
+    r"(?P<ws>\s+)"
+    r"|(?P<comment>#[^\r\n]*)"
+    r"|(?P<string>'(?:[^'\\\r\n]|\\.)*'|\"(?:[^\"\\\r\n]|\\.)*\")"
+    r"|(?P<open_string>['\"][^\r\n]*)"
+    r"|(?P<ident>\w+)"
+    r"|(?P<op>==|<=|>=|!=|[^\s\w()=,'\"#])"
+    r"|(?P<single>[()=,])"
+)
+
+
+class Token(NamedTuple):
+    """One token of a line. `col` is the 0-based column of its first
+    character."""
+
+    kind: str
+    text: str
+    col: int
+
+    @property
+    def end(self) -> int:
+        """Column just past the token."""
+        return self.col + len(self.text)
+
+
+def tokenize_line(line: str) -> list[Token]:
+    """Split one line into tokens, dropping whitespace."""
+    tokens: list[Token] = []
+    for match in _TOKEN_RE.finditer(line):
+        kind = match.lastgroup
+        if kind is None or kind == "ws":
+            continue
+        text = match.group()
+        if kind == "single":
+            kind = text
+        elif kind == IDENT:
+            # Keyword and command names repeat across the whole file
+            text = sys.intern(text)
+        tokens.append(Token(kind, text, match.start()))
+    return tokens
+
+
+def paren_balance(tokens: list[Token]) -> tuple[int, int]:
+    """`(net, min_prefix)` paren balance of a run of tokens."""
+    depth = low = 0
+    for tok in tokens:
+        if tok.kind == LPAREN:
+            depth += 1
+        elif tok.kind == RPAREN:
+            depth -= 1
+            if depth < low:
+                low = depth
+    return (depth, low)
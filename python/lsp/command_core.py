@@ -1,4 +1,8 @@
 import sys
+import weakref
+
+from catalog_pool import CatalogPool
+from fuzzy import NameIndex
 
 try:
     from asterstudy.datamodel.catalogs import CATA
@@ -11,7 +15,7 @@ except ImportError as exc:
 class CommandCore:
     """
     Singleton managing global objects and utilities:
-    - CATA reference
+    - CATA reference, and the catalogs of the documents (CatalogPool)
     - Document registries (CommandRegistry per doc)
     - Langage server utilities
     """
@@ -22,6 +26,8 @@ class CommandCore:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.CATA = CATA
+            cls._instance.catalogs = CatalogPool(CATA)
+            cls._instance._command_indexes = weakref.WeakKeyDictionary()
             cls._instance.document_registries = {}
         return cls._instance
 
@@ -42,22 +48,43 @@ class CommandCore:
 
     # ====== CATA ======
 
-    def get_CATA(self):
-        """Get the CATA object"""
-        return self.CATA
-
-    def get_CATA_commands(self):
-        return self.CATA.get_commands()
-
-    def get_docstring(self, command_name):
-        return self.CATA.get_command_definition(command_name, context=None)
-
-    def get_command_def(self, command_name):
-        cmd_obj = self.CATA.get_command_obj(command_name)
+    def get_CATA(self, doc_uri=None):
+        """Get the catalog of a document, or the default one"""
+        if doc_uri is None:
+            return self.catalogs.default()
+        return self.catalogs.for_document(doc_uri)
+
+    def get_command_index(self, cata=None):
+        """Fuzzy-match index over the catalog's command names, built once
+        per catalog and version"""
+        if cata is None:
+            cata = self.get_CATA()
+        cached = self._command_indexes.get(cata)
+        if cached is None or cached[0] != cata.version:
+            cached = self._command_indexes[cata] = (cata.version, NameIndex(cata))
+        return cached[1]
+
+    def get_CATA_commands(self, doc_uri=None):
+        return self.get_CATA(doc_uri).get_commands()
+
+    def get_docstring(self, command_name, doc_uri=None):
+        return self.get_CATA(doc_uri).get_command_definition(command_name, context=None)
+
+    def get_command_def(self, command_name, doc_uri=None):
+        cata = self.get_CATA(doc_uri)
+        cmd_obj = cata.get_command_obj(command_name)
         if cmd_obj:
-            cmd_def = self.CATA.parse_command(cmd_obj)
+            cmd_def = cata.parse_command(cmd_obj)
             return cmd_def
 
+    def get_keyword_index(self, command_name, doc_uri=None):
+        """Flattened keyword index of a command (see `KeywordIndex`), built
+        once per command"""
+        cata = self.get_CATA(doc_uri)
+        cmd_obj = cata.get_command_obj(command_name)
+        if cmd_obj:
+            return cata.keyword_index(cmd_obj)
+
     # ====== Document registries ======
 
     def get_registry(self, doc_uri):
@@ -4,10 +4,28 @@ Updated on each keystroke, error isolation, optimistic parsing
 """
 
 import re
-from dataclasses import dataclass, field
-
-
-@dataclass
+import sys
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Iterator
+from dataclasses import dataclass, field, replace
+
+from comm_tokenizer import (
+    COMMA,
+    COMMENT,
+    EQUALS,
+    IDENT,
+    LPAREN,
+    RPAREN,
+    STRING,
+    Token,
+    paren_balance,
+    tokenize_line,
+)
+
+_COMMAND_NAME_RE = re.compile(r"[A-Z_][A-Z0-9_]*")
+
+
+@dataclass(slots=True)
 class CommandInfo:
     """Information about a detected command"""
 
@@ -19,9 +37,28 @@ class CommandInfo:
     zone_end: int  # End of the zone (next command or EOF)
     is_complete: bool
     parsed_params: dict[str, str] = field(default_factory=dict)
+    # Registry-assigned id, the key of `CommandRegistry.commands`. Stays the
+    # same while the command is shifted by edits around it.
+    cmd_id: int = -1
+    # Names this command declares with `CO("name")`, as indexed by the
+    # registry (see `co_declarations`)
+    co_names: list[str] = field(default_factory=list, repr=False)
+    # Cached `parse_keyword_positions` result `(text_hash, line, positions)`,
+    # valid while the zone's text hashes to `text_hash`. `line` is the start
+    # line it was parsed at, so a command that only moved can be rebased.
+    # One tuple, so a reader on another thread never sees half an update.
+    kwargs_cache: "tuple[int, int, list[KwargPosition]] | None" = field(default=None, repr=False)
+
+    def copy(self) -> "CommandInfo":
+        """Shallow copy (`copy.copy` is several times slower on a slotted
+        dataclass)."""
+        new = object.__new__(CommandInfo)
+        for name in _COMMAND_FIELDS:
+            setattr(new, name, getattr(self, name))
+        return new
 
     def get_key(self) -> str:
-        """Returns the unique key of the command"""
+        """Returns the display key of the command (`NAME:line`)"""
         return f"{self.name}:{self.start_line}"
 
     def contains_line(self, line: int) -> bool:
@@ -29,7 +66,14 @@ class CommandInfo:
         return self.start_line <= line <= self.zone_end
 
 
-@dataclass
+_COMMAND_FIELDS = CommandInfo.__slots__
+
+
+def _start_line(cmd_info: CommandInfo) -> int:
+    return cmd_info.start_line
+
+
+@dataclass(slots=True)
 class KwargPosition:
     """A top-level `KEY=VALUE` pair as it appears in the source.
 
@@ -55,9 +99,42 @@ class CommandRegistry:
     """
 
     def __init__(self):
-        self.commands: dict[str, CommandInfo] = {}
-        # Sorted ranges for binary search: (start, end, cmd_key)
-        self.ranges: list[tuple[int, int, str | None]] = []
+        self.commands: dict[int, CommandInfo] = {}
+        # Sorted ranges for binary search: (start, end, cmd_id)
+        self.ranges: list[tuple[int, int, int | None]] = []
+        self._next_id = 0
+        # Per-variable indexes, each list in document order: commands
+        # assigning the name (`NAME = CMD(...)`) and commands declaring it
+        # with `CO("NAME")`. Kept up to date by the same splice as `ranges`;
+        # the commands' start lines shift in place, so the lists stay
+        # sorted without being touched.
+        self._assignments: dict[str, list[CommandInfo]] = {}
+        self._co_declarations: dict[str, list[CommandInfo]] = {}
+        # What changed since the last `take_changes()`: ids of the commands
+        # added, removed or re-parsed, and the names whose index entries
+        # moved. `None` ids after a full reparse: everything changed.
+        self._changed_ids: set[int] | None = None
+        self._changed_names: set[str] = set()
+        # Line count the registry was last parsed against, used to derive
+        # the line delta of an edit.
+        self._line_count = 0
+        # Token stream of the document, one list per line. Re-tokenized
+        # only for the lines an edit touches; every scan below (and the
+        # completion / diagnostics managers) reads it instead of the text.
+        self.line_tokens: list[list[Token]] = []
+        # Per-line paren balance `(net, min_prefix)`. Lets an edit check
+        # whether it moved a closing paren across a zone boundary without
+        # rescanning the document.
+        self._line_parens: list[tuple[int, int]] = []
+        # Own copy of the document lines, kept in sync by
+        # `apply_text_change` so incremental updates never need the
+        # whole text from the client.
+        self.lines: list[str] = []
+        # Live registry this one is a snapshot of (see `snapshot`)
+        self.source: CommandRegistry | None = None
+        # Keyword position cache counters (see `parse_keyword_positions`)
+        self.kwarg_cache_hits = 0
+        self.kwarg_cache_misses = 0
 
     def initialize(self, ls, lines: list[str]):
         """
@@ -67,72 +144,121 @@ class CommandRegistry:
             lines: All document lines
         """
         self.ls = ls
-        self.commands = {}
-
-        # 1. Detect all commands with the existing parser
-        raw_commands = self._parse_all_commands(lines)
+        self.lines = list(lines)
+        self._full_reparse(self.lines)
 
-        # 2. Create CommandInfo with zones
-        for cmd_data in raw_commands:
-            cmd_info = CommandInfo(
-                name=cmd_data["name"],
-                var_name=cmd_data["var_name"],
-                start_line=cmd_data["start_line"],
-                end_line=cmd_data["end_line"],
-                zone_end=cmd_data["zone_end"],
-                end_char=cmd_data["end_char"],
-                is_complete=cmd_data["is_complete"],
-            )
-
-            # 3. Parse level 1 parameters
-            cmd_info.parsed_params = self._parse_params_level1(
-                lines, cmd_info.start_line, cmd_info.zone_end
-            )
-
-            self.commands[cmd_info.get_key()] = cmd_info
+    def apply_text_change(
+        self, start_line: int, start_char: int, end_line: int, end_char: int, text: str
+    ) -> None:
+        """
+        Apply one `textDocument/didChange` range delta to the stored lines
+        and update the registry incrementally
 
-        # 4. Build the range index
-        self._rebuild_ranges()
+        Args:
+            start_line, start_char: Start of the replaced range (0-based,
+                UTF-16 columns as sent by the client)
+            end_line, end_char: End of the replaced range (0-based)
+            text: Replacement text
+        """
+        lines = self.lines
+        # A position past the last line addresses the empty line after a
+        # trailing newline.
+        first = lines[start_line] if start_line < len(lines) else ""
+        last = lines[end_line] if end_line < len(lines) else ""
+        segment = (
+            first[: _utf16_to_index(first, start_char)]
+            + text
+            + last[_utf16_to_index(last, end_char) :]
+        )
+        lines[start_line : end_line + 1] = segment.splitlines(True)
+        self.on_document_change(lines, start_line + 1, text, end_line + 1)
 
     def on_document_change(
-        self, lines: list[str], change_start_line: int, text_change: str
+        self,
+        lines: list[str],
+        change_start_line: int,
+        text_change: str,
+        change_end_line: int | None = None,
     ) -> None:
         """
         Incremental update on a change
 
+        Only the command zone(s) touched by the edit are re-parsed; the
+        commands after it are shifted by the edit's line delta. A full
+        reparse is used only when the edit moves a closing parenthesis
+        across a zone boundary.
+
         Args:
             lines: New complete document lines
             change_start_line: Line where change starts (1-based)
             text_change: Inserted text or empty
+            change_end_line: Last line replaced by the change, in the
+                coordinates of the previous version (1-based). Defaults to
+                `change_start_line`.
         """
-
-        # 2. Find the affected command
-        affected_cmd_key = self._find_command_at_line(change_start_line)
-
-        if affected_cmd_key is None:
-            # The change is on a line that wasn't part of any tracked
-            # command — most commonly the user is just starting to type a
-            # NEW command on an empty line. Re-parse the whole document so
-            # the new call gets tracked.
+        self.lines = lines
+        if change_end_line is None:
+            change_end_line = change_start_line
+        delta = len(lines) - self._line_count
+        if change_end_line + delta < change_start_line - 1 or not self._reparse_window(
+            lines, change_start_line, change_end_line, delta
+        ):
             self._full_reparse(lines)
-            return
-
-        self._reparse_command(lines, affected_cmd_key)
-        # Whether or not we just touched a tracked command, the user may
-        # also have invalidated its end paren on this keystroke (e.g. typed
-        # past it, or deleted into a sibling). Cheap safety net: rebuild
-        # the global ranges so a new top-level command typed *after* an
-        # existing one becomes findable.
-        self._full_reparse(lines)
 
     def _full_reparse(self, lines: list[str]) -> None:
         """Re-run _parse_all_commands and rebuild the range index."""
-        raw_commands = self._parse_all_commands(lines)
-        new_commands: dict[str, CommandInfo] = {}
+        self.line_tokens = [tokenize_line(line) for line in lines]
+        self._line_parens = [paren_balance(tokens) for tokens in self.line_tokens]
+        self._line_count = len(lines)
+        self.commands = {}
+        self._assignments = {}
+        self._co_declarations = {}
+        self._changed_ids = None
+        self._changed_names = set()
+        for cmd_info in self._build_commands(self._parse_all_commands(lines)):
+            cmd_info.cmd_id = self._new_id()
+            self.commands[cmd_info.cmd_id] = cmd_info
+            self._index_add(cmd_info)
+        self._rebuild_ranges()
+
+    def snapshot(self) -> "CommandRegistry":
+        """Frozen copy of the registry, for a reader on another thread
+        while this one keeps applying edits. It owns copies of the
+        commands (edits shift them in place) and of the line lists, but
+        shares the line strings and token lists, which edits replace rather
+        than mutate. Carries the pending `take_changes()`."""
+        snap = CommandRegistry()
+        snap.source = self
+        snap.lines = list(self.lines)
+        snap.line_tokens = list(self.line_tokens)
+        snap._line_parens = list(self._line_parens)
+        snap._line_count = self._line_count
+        snap.ranges = list(self.ranges)
+        snap.commands = {cid: cmd_info.copy() for cid, cmd_info in self.commands.items()}
+        snap._assignments = {
+            name: [snap.commands[c.cmd_id] for c in entries]
+            for name, entries in self._assignments.items()
+        }
+        snap._co_declarations = {
+            name: [snap.commands[c.cmd_id] for c in entries]
+            for name, entries in self._co_declarations.items()
+        }
+        snap._changed_ids, snap._changed_names = self.take_changes()
+        return snap
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _build_commands(self, raw_commands: list[dict]) -> list[CommandInfo]:
+        """Turn `_parse_commands` output into `CommandInfo`s with their
+        level 1 parameters parsed."""
+        out = []
         for cmd_data in raw_commands:
+            var_name = cmd_data["var_name"]
             cmd_info = CommandInfo(
-                name=cmd_data["name"],
-                var_name=cmd_data["var_name"],
+                name=sys.intern(cmd_data["name"]),
+                var_name=sys.intern(var_name) if var_name else None,
                 start_line=cmd_data["start_line"],
                 end_line=cmd_data["end_line"],
                 zone_end=cmd_data["zone_end"],
@@ -140,11 +266,245 @@ class CommandRegistry:
                 is_complete=cmd_data["is_complete"],
             )
             cmd_info.parsed_params = self._parse_params_level1(
-                lines, cmd_info.start_line, cmd_info.zone_end
+                cmd_info.start_line, cmd_info.zone_end
             )
-            new_commands[cmd_info.get_key()] = cmd_info
-        self.commands = new_commands
-        self._rebuild_ranges()
+            out.append(cmd_info)
+        return out
+
+    def _reparse_window(self, lines: list[str], first: int, last_old: int, delta: int) -> bool:
+        """Re-parse the zones touched by an edit of lines `first..last_old`
+        (1-based, previous version) that changed the line count by
+        `delta`. Returns False when the edit can't be handled locally and
+        the caller must fall back to a full reparse."""
+        if not self.ranges:
+            return False
+
+        # 1. Widen the edit to whole entries of the range index, then up to
+        #    the next command start, so the window begins and ends where the
+        #    top-level parser is between commands.
+        lo = self._range_index_at(min(first, self._line_count))
+        hi = self._range_index_at(min(last_old, self._line_count))
+        if lo is None or hi is None:
+            return False
+        if lo > 0 and self.ranges[lo - 1][2] is None:
+            lo -= 1
+        while hi + 1 < len(self.ranges) and self.ranges[hi + 1][2] is None:
+            hi += 1
+        win_start = self.ranges[lo][0]
+        has_next = hi + 1 < len(self.ranges)
+        win_end_old = self.ranges[hi + 1][0] - 1 if has_next else self._line_count
+        win_end = win_end_old + delta
+        if win_end < win_start - 1:
+            return False
+
+        # 2. Refresh the per-line paren balance of the edited lines and
+        #    compare the window's balance before and after. An edit that
+        #    lowers it could close a command left open earlier in the file.
+        old_net, old_min = self._fold_parens(self._line_parens[win_start - 1 : win_end_old])
+        new_tokens = [tokenize_line(line) for line in lines[first - 1 : last_old + delta]]
+        self.line_tokens[first - 1 : last_old] = new_tokens
+        self._line_parens[first - 1 : last_old] = [paren_balance(tokens) for tokens in new_tokens]
+        self._line_count = len(lines)
+        new_net, new_min = self._fold_parens(self._line_parens[win_start - 1 : win_end])
+        if new_net < old_net or new_min < old_min:
+            if any(
+                not self.commands[cid].is_complete
+                for _s, _e, cid in self.ranges[:lo]
+                if cid is not None
+            ):
+                return False
+
+        # 3. Parse the window on its own. A command still open at the window
+        #    end either stays open until EOF (fine) or closes inside a later
+        #    zone, which would swallow it.
+        raw = self._parse_commands(win_start - 1, win_end)
+        unclosed = [cmd for cmd in raw if not cmd["is_complete"]]
+        if unclosed and has_next:
+            _net, suffix_min = self._fold_parens(self._line_parens[win_end:])
+            for cmd in unclosed:
+                if self._depth_after(cmd, win_end) + suffix_min <= 0:
+                    return False
+        new_cmds = self._build_commands(raw)
+
+        # 4. Splice the window into the indexes and shift what follows.
+        #    Old entries leave the variable indexes before the shift, while
+        #    those are still sorted.
+        old_ids = [cid for _s, _e, cid in self.ranges[lo : hi + 1] if cid is not None]
+        for cid in old_ids:
+            self._index_remove(self.commands[cid])
+        prev_id = self.ranges[lo - 1][2] if lo > 0 else None
+        prev = self.commands[prev_id] if prev_id is not None else None
+        if prev is not None and not prev.is_complete:
+            self._index_remove(prev)
+        else:
+            prev = None
+        tail = self.ranges[hi + 1 :]
+        if delta:
+            for _start, _end, tail_id in tail:
+                if tail_id is None:
+                    continue
+                cmd_info = self.commands[tail_id]
+                cmd_info.start_line += delta
+                cmd_info.zone_end += delta
+                if cmd_info.end_line is not None:
+                    cmd_info.end_line += delta
+            tail = [(start + delta, end + delta, cid) for start, end, cid in tail]
+
+        # An open command right before the window keeps its zone up to the
+        # next command start.
+        if prev is not None:
+            following = new_cmds[0].start_line if new_cmds else win_end + 1
+            prev.zone_end = following - 1
+            prev.parsed_params = self._parse_params_level1(prev.start_line, prev.zone_end)
+            self.ranges[lo - 1] = (prev.start_line, prev.zone_end, prev.cmd_id)
+            self._index_add(prev)
+            win_start = following
+
+        same_count = len(new_cmds) == len(old_ids)
+        if same_count:
+            # The new commands take over the ids (and the place in
+            # `commands`) of the ones they replace.
+            for cid, cmd_info in zip(old_ids, new_cmds, strict=True):
+                cmd_info.cmd_id = cid
+                self.commands[cid] = cmd_info
+        else:
+            for cid in old_ids:
+                del self.commands[cid]
+            for cmd_info in new_cmds:
+                cmd_info.cmd_id = self._new_id()
+                self.commands[cmd_info.cmd_id] = cmd_info
+        for cmd_info in new_cmds:
+            self._index_add(cmd_info)
+        entries = self._zone_entries(new_cmds, win_start, win_end)
+        if delta:
+            self.ranges[lo:] = entries + tail
+        else:
+            self.ranges[lo : hi + 1] = entries
+        if not same_count:
+            # Keep `commands` in document order
+            self.commands = {
+                cid: self.commands[cid] for _s, _e, cid in self.ranges if cid is not None
+            }
+        return True
+
+    def _index_add(self, cmd_info: CommandInfo) -> None:
+        """Add a command to the per-variable indexes."""
+        cmd_info.co_names = self.co_declarations(cmd_info)
+        self._record_change(cmd_info)
+        if cmd_info.var_name:
+            self._index_insert(self._assignments, cmd_info.var_name, cmd_info)
+        for name in cmd_info.co_names:
+            self._index_insert(self._co_declarations, name, cmd_info)
+
+    def _index_remove(self, cmd_info: CommandInfo) -> None:
+        """Drop a command from the per-variable indexes."""
+        self._record_change(cmd_info)
+        if cmd_info.var_name:
+            self._index_delete(self._assignments, cmd_info.var_name, cmd_info)
+        for name in cmd_info.co_names:
+            self._index_delete(self._co_declarations, name, cmd_info)
+
+    def _record_change(self, cmd_info: CommandInfo) -> None:
+        if self._changed_ids is None:
+            return
+        self._changed_ids.add(cmd_info.cmd_id)
+        if cmd_info.var_name:
+            self._changed_names.add(cmd_info.var_name)
+        self._changed_names.update(cmd_info.co_names)
+
+    def take_changes(self) -> tuple[set[int] | None, set[str]]:
+        """Return and reset what changed since the previous call: the ids
+        of the commands added, removed or re-parsed (`None` if the whole
+        document was re-parsed) and the variable names whose assignments
+        or `CO(...)` declarations moved. Commands outside the returned ids
+        kept their text; they may only have been shifted. Meant for a
+        single consumer, the diagnostics manager."""
+        changes = (self._changed_ids, self._changed_names)
+        self._changed_ids = set()
+        self._changed_names = set()
+        return changes
+
+    @staticmethod
+    def _index_insert(
+        index: dict[str, list[CommandInfo]], name: str, cmd_info: CommandInfo
+    ) -> None:
+        entries = index.setdefault(name, [])
+        if not entries or entries[-1].start_line < cmd_info.start_line:
+            entries.append(cmd_info)
+        else:
+            insort(entries, cmd_info, key=_start_line)
+
+    @staticmethod
+    def _index_delete(
+        index: dict[str, list[CommandInfo]], name: str, cmd_info: CommandInfo
+    ) -> None:
+        entries = index.get(name)
+        if not entries:
+            return
+        # A name declared twice by one command is indexed twice
+        pos = bisect_left(entries, cmd_info.start_line, key=_start_line)
+        while pos < len(entries) and entries[pos] is not cmd_info:
+            pos += 1
+        if pos < len(entries):
+            del entries[pos]
+        if not entries:
+            del index[name]
+
+    def assignments(self, var_name: str) -> list[CommandInfo]:
+        """Commands assigning `var_name`, in document order."""
+        return self._assignments.get(var_name, [])
+
+    def assigned_names(self) -> Iterator[str]:
+        """Every name assigned by a command."""
+        return iter(self._assignments)
+
+    def declared_names(self) -> Iterator[str]:
+        """Every name declared with `CO("name")`."""
+        return iter(self._co_declarations)
+
+    def nearest_assignment(self, var_name: str, line: int) -> CommandInfo | None:
+        """Last command assigning `var_name` that starts on or before
+        `line` (1-based)."""
+        return self._nearest(self._assignments, var_name, line)
+
+    def nearest_co_declaration(self, var_name: str, line: int) -> CommandInfo | None:
+        """Last command declaring `CO("var_name")` that starts on or before
+        `line` (1-based)."""
+        return self._nearest(self._co_declarations, var_name, line)
+
+    def first_definition(self, var_name: str) -> CommandInfo | None:
+        """Earliest command that assigns `var_name` or declares it with
+        `CO(...)`. An assignment wins over a declaration in the same
+        command."""
+        assigned = self._assignments.get(var_name)
+        declared = self._co_declarations.get(var_name)
+        if not declared:
+            return assigned[0] if assigned else None
+        if not assigned or declared[0].start_line < assigned[0].start_line:
+            return declared[0]
+        return assigned[0]
+
+    @staticmethod
+    def _nearest(index: dict[str, list[CommandInfo]], name: str, line: int) -> CommandInfo | None:
+        entries = index.get(name)
+        if not entries:
+            return None
+        pos = bisect_right(entries, line, key=_start_line)
+        return entries[pos - 1] if pos else None
+
+    def _range_index_at(self, line: int) -> int | None:
+        """Index in `self.ranges` of the entry containing `line`."""
+        left, right = 0, len(self.ranges) - 1
+        while left <= right:
+            mid = (left + right) // 2
+            start, end, _key = self.ranges[mid]
+            if start <= line <= end:
+                return mid
+            elif line < start:
+                right = mid - 1
+            else:
+                left = mid + 1
+        return None
 
     def get_command_at_line(self, line: int) -> CommandInfo | None:
         """
@@ -156,10 +516,10 @@ class CommandRegistry:
         Returns:
             CommandInfo or None
         """
-        cmd_key = self._find_command_at_line(line)
-        if cmd_key is None:
+        cmd_id = self._find_command_at_line(line)
+        if cmd_id is None:
             return None
-        return self.commands.get(cmd_key)
+        return self.commands.get(cmd_id)
 
     def get_all_commands(self) -> dict[str, str]:
         """
@@ -169,7 +529,8 @@ class CommandRegistry:
             Dict {cmdName:line: "start-end" or "start"}
         """
         result = {}
-        for cmd_key, cmd_info in self.commands.items():
+        for cmd_info in self.commands.values():
+            cmd_key = cmd_info.get_key()
             if cmd_info.is_complete:
                 result[cmd_key] = f"{cmd_info.start_line}-{cmd_info.end_line}"
             else:
@@ -197,7 +558,7 @@ class CommandRegistry:
         Returns all expanded commands
         """
         lines = []
-        for cmd_key, cmd_info in self.commands.items():
+        for cmd_info in self.commands.values():
             if cmd_info.is_complete:
                 lines.append(f"For the complete command: {cmd_info.name}")
                 lines.append(
@@ -240,27 +601,37 @@ class CommandRegistry:
 
     def _parse_all_commands(self, lines: list[str]) -> list[dict]:
         """Parse all commands in the document"""
+        return self._parse_commands(0, len(lines))
+
+    def _parse_commands(self, start_idx: int, stop_idx: int) -> list[dict]:
+        """Parse the commands starting in lines `start_idx` to `stop_idx` (0-based,
+        exclusive).
+
+        `start_idx` must be a line the top-level parser would visit (not
+        inside a complete command). Command ends are only searched up to
+        `stop_idx`; a command still open there is reported incomplete with
+        its zone running to `stop_idx`.
+        """
         commands = []
-        re.compile(r"^\s*(?:(\w+)\s*=\s*)?(?!_F\b)([A-Z_][A-Z0-9_]*)\s*\(", re.MULTILINE)
 
-        i = 0
-        while i < len(lines):
-            line = lines[i]
+        i = start_idx
+        while i < stop_idx:
+            tokens = self.line_tokens[i]
 
-            # Skip comments
-            if self._is_comment_line(line):
+            # Skip blank and comment lines
+            if not tokens or tokens[0].kind == COMMENT:
                 i += 1
                 continue
 
-            match = self._find_command_start(line)
+            match = self._find_command_start(tokens)
             if match:
                 start_line = i + 1  # 1-based
 
                 # Find command end
-                result = self._find_command_end(lines, i, match["open_paren_pos"])
+                result = self._find_command_end(i, match["open_paren_pos"], stop_idx)
 
                 # Calculate zone_end (adjusted later)
-                zone_end = result["end_line"] if result["complete"] else len(lines)
+                zone_end = result["end_line"] if result["complete"] else stop_idx
 
                 commands.append(
                     {
@@ -269,6 +640,7 @@ class CommandRegistry:
                         "start_line": start_line,
                         "end_line": result["end_line"] if result["complete"] else None,
                         "end_char": result.get("end_char"),
+                        "open_paren_pos": match["open_paren_pos"],
                         "zone_end": zone_end,
                         "is_complete": result["complete"],
                     }
@@ -290,18 +662,15 @@ class CommandRegistry:
                 cmd["zone_end"] = commands[idx + 1]["start_line"] - 1
             else:
                 # Last command: zone until the end
-                cmd["zone_end"] = len(lines)
+                cmd["zone_end"] = stop_idx
 
         return commands
 
-    def _parse_params_level1(
-        self, lines: list[str], start_line: int, zone_end: int
-    ) -> dict[str, str]:
+    def _parse_params_level1(self, start_line: int, zone_end: int) -> dict[str, str]:
         """
         Parse level 1 parameters (without entering _F)
 
         Args:
-            lines: All lines
             start_line: Start line (1-based)
             zone_end: Zone end line (1-based)
 
@@ -310,77 +679,56 @@ class CommandRegistry:
         """
         params: dict[str, str] = {}
 
-        # Extract zone content
-        zone_lines = lines[start_line - 1 : zone_end]
-        content = "\n".join(zone_lines)
-
-        # Find first opening parenthesis
-        match = re.search(r"\(", content)
-        if not match:
+        # Start right after the first opening parenthesis
+        tokens = self.iter_tokens(start_line - 1, 0, zone_end)
+        for _line_idx, tok in tokens:
+            if tok.kind == LPAREN:
+                break
+        else:
             return params
 
-        # Parse from parenthesis
-        content = content[match.end() :]
-
-        # Regex for param=value at level 1
-        # Stop at comma or closing parenthesis
-        i = 0
         paren_depth = 0
         current_param = None
-        value_start = None
+        value_start: tuple[int, int] | None = None
+        prev: tuple[int, Token] | None = None
 
-        while i < len(content):
-            char = content[i]
-
-            # Skip strings
-            if char in ('"', "'"):
-                quote = char
-                i += 1
-                while i < len(content) and content[i] != quote:
-                    if content[i] == "\\":
-                        i += 2
-                    else:
-                        i += 1
-                i += 1
+        for line_idx, tok in tokens:
+            kind = tok.kind
+            if kind == COMMENT:
                 continue
 
             # Parenthesis management
-            if char == "(":
+            if kind == LPAREN:
                 paren_depth += 1
-            elif char == ")":
+            elif kind == RPAREN:
                 paren_depth -= 1
                 if paren_depth < 0:
                     # End of command - save current param before exiting
                     if current_param and value_start is not None:
-                        value = content[value_start:i].strip().rstrip(",")
-                        value = self.clean_value(content[value_start:i])
-                        params[current_param] = value
+                        params[current_param] = self.clean_value(
+                            self._source_text(value_start, (line_idx, tok.col))
+                        )
                     break
-
-            # Detect param=
-            if paren_depth == 0:
-                param_match = re.match(r"\s*(\w+)\s*=\s*", content[i:])
-                if param_match:
+            elif paren_depth == 0:
+                # Detect param=
+                if kind == EQUALS and prev is not None and prev[1].kind == IDENT:
                     if current_param and value_start is not None:
                         # Save previous param
-                        value = content[value_start:i].strip().rstrip(",")
-                        value = self.clean_value(content[value_start:i])
-                        params[current_param] = value
-
-                    current_param = param_match.group(1)
-                    i += param_match.end()
-                    value_start = i
-                    continue
+                        params[current_param] = self.clean_value(
+                            self._source_text(value_start, (prev[0], prev[1].col))
+                        )
+                    current_param = prev[1].text
+                    value_start = (line_idx, tok.end)
 
                 # Detect end of value (comma at level 0)
-                if char == "," and current_param and value_start is not None:
-                    value = content[value_start:i].strip()
-                    value = self.clean_value(content[value_start:i])
-                    params[current_param] = value
+                elif kind == COMMA and current_param and value_start is not None:
+                    params[current_param] = self.clean_value(
+                        self._source_text(value_start, (line_idx, tok.col))
+                    )
                     current_param = None
                     value_start = None
 
-            i += 1
+            prev = (line_idx, tok)
 
         # Note: Last param is NOT saved here because either:
         # - It was saved during break (paren_depth < 0)
@@ -395,206 +743,156 @@ class CommandRegistry:
 
         return params
 
-    def parse_keyword_positions(
-        self, lines: list[str], cmd_info: CommandInfo
-    ) -> list[KwargPosition]:
-        """Walk the call's character stream tracking line/column to
-        produce per-kwarg ranges. Top-level only (skips inside `_F(...)`
-        and other nested calls). String- and comment-aware.
+    def parse_keyword_positions(self, cmd_info: CommandInfo) -> list[KwargPosition]:
+        """Walk the call's token stream to produce per-kwarg ranges.
+        Top-level only (skips inside `_F(...)` and other nested calls).
+
+        The result is cached on `cmd_info` and reused while the text of
+        its zone is unchanged, even if the command moved. On a snapshot it
+        is also cached on the live command it was copied from. The returned
+        list is shared: don't mutate it.
 
         Returns an empty list on any parse failure so diagnostics never
         crash the LSP."""
-        try:
-            return self._parse_keyword_positions(lines, cmd_info)
-        except Exception:
-            return []
-
-    def _parse_keyword_positions(
-        self, lines: list[str], cmd_info: CommandInfo
-    ) -> list[KwargPosition]:
+        content_hash = hash(tuple(self.lines[max(0, cmd_info.start_line - 1) : cmd_info.zone_end]))
+        cached = cmd_info.kwargs_cache
+        if cached is not None and cached[0] == content_hash:
+            self.kwarg_cache_hits += 1
+            _hash, line, positions = cached
+            delta = cmd_info.start_line - line
+            if not delta:
+                return positions
+            positions = [
+                replace(kw, name_line=kw.name_line + delta, value_line=kw.value_line + delta)
+                for kw in positions
+            ]
+        else:
+            self.kwarg_cache_misses += 1
+            try:
+                positions = self._parse_keyword_positions(cmd_info)
+            except Exception:
+                return []
+        cmd_info.kwargs_cache = (content_hash, cmd_info.start_line, positions)
+        if self.source is not None:
+            # The live command may since have moved or been replaced: the
+            # hash and line checks above still hold for it.
+            live = self.source.commands.get(cmd_info.cmd_id)
+            if live is not None:
+                live.kwargs_cache = cmd_info.kwargs_cache
+        return positions
+
+    def _parse_keyword_positions(self, cmd_info: CommandInfo) -> list[KwargPosition]:
         out: list[KwargPosition] = []
+        lines = self.lines
         start_idx = max(0, cmd_info.start_line - 1)
         end_idx = min(len(lines) - 1, cmd_info.zone_end - 1)
         if start_idx > end_idx:
             return out
 
-        # Find the call's opening `(`.
-        line_idx = start_idx
-        col = 0
-        found_open = False
-        while line_idx <= end_idx:
-            line = lines[line_idx]
-            paren_pos = line.find("(", col)
-            if paren_pos != -1:
-                col = paren_pos + 1
-                found_open = True
+        # Start right after the call's opening `(`.
+        tokens = self.iter_tokens(start_idx, 0, end_idx + 1)
+        for _line_idx, tok in tokens:
+            if tok.kind == LPAREN:
                 break
-            line_idx += 1
-            col = 0
-        if not found_open:
+        else:
             return out
 
         depth = 0  # depth INSIDE the call (excluding the call's own `(`)
-        in_string: str | None = None
+        prev: tuple[int, Token] | None = None
 
-        # Scanner state for the current pending kwarg (we collect chars
-        # one at a time and snapshot ranges at delimiter boundaries).
-        pending_name = ""
-        pending_name_start = (-1, -1)  # (line, col)
+        # State of the current kwarg; ranges are snapshot at delimiters.
         kwarg_name: str | None = None
         kwarg_name_range: tuple[int, int, int] | None = None  # (line, col_start, col_end)
         value_start: tuple[int, int] | None = None  # (line, col)
-        value_chars: list[str] = []  # accumulated source chars of the current value
 
-        def flush_kwarg(end_line: int, end_col: int) -> None:
-            nonlocal kwarg_name, kwarg_name_range, value_start, value_chars
+        def flush_kwarg(end_line: int, end_col: int, value_end: tuple[int, int]) -> None:
+            nonlocal kwarg_name, kwarg_name_range, value_start
             if kwarg_name and value_start and kwarg_name_range:
-                value = "".join(value_chars).strip().rstrip(",").strip()
+                value = self._source_text(value_start, value_end, skip_comments=True)
                 vl, vc = value_start
-                # Trim trailing whitespace from the value's column range
-                # so squiggles don't include the comma the user just typed.
-                vc_end = end_col
                 out.append(
                     KwargPosition(
                         name=kwarg_name,
-                        value=value,
+                        value=value.strip().rstrip(",").strip(),
                         name_line=kwarg_name_range[0],
                         name_col_start=kwarg_name_range[1],
                         name_col_end=kwarg_name_range[2],
                         value_line=vl,
                         value_col_start=vc,
-                        value_col_end=vc_end,
+                        value_col_end=end_col,
                     )
                 )
             kwarg_name = None
             kwarg_name_range = None
             value_start = None
-            value_chars = []
-
-        while line_idx <= end_idx:
-            line = lines[line_idx]
-            while col < len(line):
-                ch = line[col]
-
-                if in_string:
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    if ch == in_string and (col == 0 or line[col - 1] != "\\"):
-                        in_string = None
-                    col += 1
-                    continue
-
-                if ch in ("'", '"'):
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    in_string = ch
-                    col += 1
-                    continue
-
-                if ch == "#":
-                    # Inline comment runs to end of line.
-                    break  # break inner while; outer advances line
-
-                if ch == "(":
-                    depth += 1
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    col += 1
-                    continue
-
-                if ch == ")":
-                    if depth == 0:
-                        # End of the call.
-                        flush_kwarg(line_idx, col)
-                        return out
-                    depth -= 1
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    col += 1
-                    continue
-
-                if ch == "," and depth == 0:
-                    flush_kwarg(line_idx, col)
-                    pending_name = ""
-                    pending_name_start = (-1, -1)
-                    col += 1
-                    continue
-
-                if depth > 0:
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    col += 1
-                    continue
 
-                # Top-level scope: track identifiers and `=`.
-                if ch.isalnum() or ch == "_":
-                    if pending_name == "":
-                        pending_name_start = (line_idx, col)
-                    pending_name += ch
-                    if value_start is not None:
-                        value_chars.append(ch)
-                    col += 1
-                    continue
+        for line_idx, tok in tokens:
+            kind = tok.kind
+            if kind == COMMENT:
+                continue
 
-                if ch == "=" and pending_name and (col + 1 >= len(line) or line[col + 1] != "="):
+            if kind == LPAREN:
+                depth += 1
+            elif kind == RPAREN:
+                if depth == 0:
+                    # End of the call.
+                    flush_kwarg(line_idx, tok.col, (line_idx, tok.col))
+                    return out
+                depth -= 1
+            elif depth == 0:
+                if kind == COMMA:
+                    flush_kwarg(line_idx, tok.col, (line_idx, tok.col))
+                elif kind == EQUALS and prev is not None and prev[1].kind == IDENT:
                     # `KEY=` boundary — flush any prior kwarg, start a new one.
-                    flush_kwarg(line_idx, col)
-                    kwarg_name = pending_name
-                    kwarg_name_range = (
-                        pending_name_start[0],
-                        pending_name_start[1],
-                        pending_name_start[1] + len(pending_name),
-                    )
-                    pending_name = ""
-                    pending_name_start = (-1, -1)
-                    col += 1
+                    name_line, name_tok = prev
+                    flush_kwarg(line_idx, tok.col, (name_line, name_tok.col))
+                    kwarg_name = name_tok.text
+                    kwarg_name_range = (name_line, name_tok.col, name_tok.end)
                     # skip whitespace before value
+                    line = lines[line_idx]
+                    col = tok.end
                     while col < len(line) and line[col].isspace():
                         col += 1
                     value_start = (line_idx, col)
-                    value_chars = []
-                    continue
 
-                # any other char (whitespace, operator…) — keep value running
-                if value_start is not None:
-                    value_chars.append(ch)
-                if ch.isspace():
-                    pending_name = ""
-                    pending_name_start = (-1, -1)
-                col += 1
-
-            # next line
-            line_idx += 1
-            col = 0
-            if value_start is not None:
-                value_chars.append("\n")
-            pending_name = ""
-            pending_name_start = (-1, -1)
+            prev = (line_idx, tok)
 
         # Document ended before the call closed — flush whatever we have.
-        flush_kwarg(line_idx if line_idx <= end_idx else end_idx, 0)
+        flush_kwarg(end_idx, 0, (end_idx + 1, 0))
         return out
 
-    def _reparse_command(self, lines: list[str], cmd_key: str):
-        """Re-parse a specific command after modification"""
-        cmd_info = self.commands[cmd_key]
-
-        cmd_info.parsed_params = self._parse_params_level1(
-            lines, cmd_info.start_line, cmd_info.zone_end
-        )
-
-        # TODO: update last character
-
-    def _find_command_at_line(self, line: int) -> str | None:
+    def co_declarations(self, cmd_info: CommandInfo) -> list[str]:
+        """Names declared by `CO("name")` inside a command's call: macro
+        outputs that become variables once the command has run."""
+        end = cmd_info.end_line if cmd_info.end_line is not None else cmd_info.zone_end
+        names = []
+        window: list[Token] = []
+        for _line_idx, tok in self.iter_tokens(max(0, cmd_info.start_line - 1), 0, end):
+            if tok.kind == COMMENT:
+                continue
+            window = [*window[-2:], tok]
+            if (
+                len(window) == 3
+                and window[0].kind == IDENT
+                and window[0].text == "CO"
+                and window[1].kind == LPAREN
+                and window[2].kind == STRING
+            ):
+                name = window[2].text[1:-1]
+                if name.isidentifier():
+                    names.append(name)
+        return names
+
+    def _find_command_at_line(self, line: int) -> int | None:
         """Binary search to find the command at a line"""
         left, right = 0, len(self.ranges) - 1
 
         while left <= right:
             mid = (left + right) // 2
-            start, end, cmd_key = self.ranges[mid]
+            start, end, cmd_id = self.ranges[mid]
 
             if start <= line <= end:
-                return cmd_key
+                return cmd_id
             elif line < start:
                 right = mid - 1
             else:
@@ -604,101 +902,130 @@ class CommandRegistry:
 
     def _rebuild_ranges(self):
         """Rebuild the range index for binary search"""
-        self.ranges = []
-
-        sorted_cmds = sorted(self.commands.values(), key=lambda c: c.start_line)
-
-        current_line = 1
+        # `commands` is kept in document order
+        self.ranges = self._zone_entries(list(self.commands.values()), 1, self._line_count)
+
+    @staticmethod
+    def _zone_entries(
+        sorted_cmds: list[CommandInfo], start: int, end: int
+    ) -> list[tuple[int, int, int | None]]:
+        """Range index entries covering lines `start..end`: one per command
+        zone, plus `None` entries for the empty zones between them."""
+        entries: list[tuple[int, int, int | None]] = []
+        current_line = start
         for cmd_info in sorted_cmds:
             # Add empty zone before this command if needed
             if current_line < cmd_info.start_line:
-                self.ranges.append((current_line, cmd_info.start_line - 1, None))
+                entries.append((current_line, cmd_info.start_line - 1, None))
 
             # Add the command
-            self.ranges.append((cmd_info.start_line, cmd_info.zone_end, cmd_info.get_key()))
+            entries.append((cmd_info.start_line, cmd_info.zone_end, cmd_info.cmd_id))
             current_line = cmd_info.zone_end + 1
 
-        # Add final empty zone if needed
-        if self.ranges and self.ranges[-1][1] < float("inf"):
-            # We cannot know the exact end, leave open
-            pass
+        # Empty zone after the last command
+        if current_line <= end:
+            entries.append((current_line, end, None))
+        return entries
 
     # ============ Parsing utilities ============
 
-    def _is_comment_line(self, line: str) -> bool:
-        stripped = line.lstrip()
-        return stripped.startswith("#") or stripped == ""
-
-    def _find_command_start(self, line: str) -> dict | None:
-        line_clean = self._remove_inline_comment(line)
-        pattern = re.compile(r"^\s*(?:(\w+)\s*=\s*)?(?!_F\b)([A-Z_][A-Z0-9_]*)\s*\(")
-        match = pattern.search(line_clean)
-        if match:
-            return {
-                "variable": match.group(1),
-                "command": match.group(2),
-                "open_paren_pos": match.end() - 1,
-            }
-        return None
-
-    def _find_open_paren_pos(self, line: str) -> int:
-        """Find the position of the opening parenthesis"""
-        return line.find("(")
-
-    def _remove_inline_comment(self, line: str) -> str:
-        in_string = False
-        string_char = None
-
-        for i, char in enumerate(line):
-            if char in ('"', "'"):
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                elif char == string_char and (i == 0 or line[i - 1] != "\\"):
-                    in_string = False
-                    string_char = None
-
-            if char == "#" and not in_string:
-                return line[:i]
-
-        return line
+    def iter_tokens(
+        self, line_idx: int, col: int = 0, stop_idx: int | None = None
+    ) -> Iterator[tuple[int, Token]]:
+        """Yield `(line_idx, token)` from the token stream, starting at
+        `line_idx`/`col` (0-based) and stopping before line `stop_idx`
+        (defaults to the end of the document)."""
+        line_tokens = self.line_tokens
+        if stop_idx is None or stop_idx > len(line_tokens):
+            stop_idx = len(line_tokens)
+        for idx in range(line_idx, stop_idx):
+            for tok in line_tokens[idx]:
+                if idx == line_idx and tok.col < col:
+                    continue
+                yield idx, tok
 
-    def _find_command_end(self, lines: list[str], start_idx: int, start_char_pos: int) -> dict:
-        """Find the end of a command (parser version)"""
-        paren_count = 1
-        i = start_idx
-        char_pos = start_char_pos + 1
-
-        while i < len(lines) and paren_count > 0:
-            line = lines[i]
-            line_clean = self._remove_inline_comment(line)
-
-            in_string = False
-            string_char = None
-
-            while char_pos < len(line_clean):
-                char = line_clean[char_pos]
-
-                if char in ('"', "'"):
-                    if not in_string:
-                        in_string = True
-                        string_char = char
-                    elif char == string_char and (
-                        char_pos == 0 or line_clean[char_pos - 1] != "\\"
-                    ):
-                        in_string = False
-                        string_char = None
-
-                if not in_string:
-                    if char == "(":
-                        paren_count += 1
-                    elif char == ")":
-                        paren_count -= 1
-                        if paren_count == 0:
-                            return {"end_line": i + 1, "end_char": char_pos, "complete": True}
-                char_pos += 1
-
-            i += 1
-            char_pos = 0
-
-        return {"end_line": len(lines), "complete": False}
+    def _find_command_start(self, tokens: list[Token]) -> dict | None:
+        """Match `[VAR =] COMMAND (` at the start of a line's tokens."""
+        idx = 2 if len(tokens) > 2 and tokens[1].kind == EQUALS else 0
+        if len(tokens) < idx + 2 or tokens[0].kind != IDENT:
+            return None
+        name_tok, paren_tok = tokens[idx], tokens[idx + 1]
+        if (
+            name_tok.kind != IDENT
+            or paren_tok.kind != LPAREN
+            or name_tok.text == "_F"
+            or not _COMMAND_NAME_RE.fullmatch(name_tok.text)
+        ):
+            return None
+        return {
+            "variable": tokens[0].text if idx else None,
+            "command": name_tok.text,
+            "open_paren_pos": paren_tok.col,
+        }
+
+    def _find_command_end(
+        self, start_idx: int, start_char_pos: int, stop_idx: int | None = None
+    ) -> dict:
+        """Find the parenthesis closing the one at `start_idx`/`start_char_pos`,
+        looking no further than `stop_idx` (exclusive, defaults to the end
+        of the document)"""
+        if stop_idx is None:
+            stop_idx = len(self.line_tokens)
+        paren_count = 0
+        for line_idx, tok in self.iter_tokens(start_idx, start_char_pos, stop_idx):
+            if tok.kind == LPAREN:
+                paren_count += 1
+            elif tok.kind == RPAREN:
+                paren_count -= 1
+                if paren_count == 0:
+                    return {"end_line": line_idx + 1, "end_char": tok.col, "complete": True}
+
+        return {"end_line": stop_idx, "complete": False}
+
+    def _source_text(
+        self, start: tuple[int, int], end: tuple[int, int], skip_comments: bool = False
+    ) -> str:
+        """Source text between two `(line, col)` positions (0-based, end
+        exclusive), optionally without the `#` comments."""
+        (start_line, start_col), (end_line, end_col) = start, end
+        parts = []
+        for idx in range(start_line, min(end_line + 1, len(self.lines))):
+            line = self.lines[idx]
+            lo = start_col if idx == start_line else 0
+            hi = end_col if idx == end_line else len(line)
+            tokens = self.line_tokens[idx]
+            if skip_comments and tokens and tokens[-1].kind == COMMENT and tokens[-1].col < hi:
+                parts.append(line[lo : tokens[-1].col] + "\n")
+                continue
+            parts.append(line[lo:hi])
+        return "".join(parts)
+
+    @staticmethod
+    def _fold_parens(balances: list[tuple[int, int]]) -> tuple[int, int]:
+        """Combine consecutive per-line balances into one `(net, min)`."""
+        net = low = 0
+        for line_net, line_low in balances:
+            low = min(low, net + line_low)
+            net += line_net
+        return (net, low)
+
+    def _depth_after(self, cmd: dict, stop_idx: int) -> int:
+        """Paren depth of an unclosed command at the end of line `stop_idx`."""
+        start_idx = cmd["start_line"] - 1
+        first = [tok for tok in self.line_tokens[start_idx] if tok.col >= cmd["open_paren_pos"]]
+        net, _low = paren_balance(first)
+        return net + self._fold_parens(self._line_parens[start_idx + 1 : stop_idx])[0]
+
+
+def _utf16_to_index(text: str, units: int) -> int:
+    """Convert a UTF-16 column into an index in `text`, clamped to its
+    length without the line terminator."""
+    end = len(text.rstrip("\r\n"))
+    if text.isascii():
+        return min(units, end)
+    count = 0
+    for idx, char in enumerate(text[:end]):
+        if count >= units:
+            return idx
+        count += 2 if ord(char) > 0xFFFF else 1
+    return end
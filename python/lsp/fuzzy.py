@@ -0,0 +1,143 @@
+"""
+Fuzzy name matching for the "Did you mean ...?" suggestions
+
+`nearest` ranks a short list of candidates (the keywords visible in a
+command) with a bounded Levenshtein distance that gives up as soon as a
+candidate can't beat the matches found so far. `NameIndex` holds a fixed
+vocabulary — the catalog's command names — prepared once, measures all
+of it in a few vectorized steps, and remembers its last `MEMO_SIZE`
+answers: the same typo tends to repeat through a file.
+
+Matching is case-insensitive and only suggests names within
+`max_distance(target)` edits.
+"""
+
+from bisect import insort
+from collections import OrderedDict
+
+import numpy as np
+
+# Lookups remembered by a `NameIndex`, the least recently used dropped first
+MEMO_SIZE = 256
+
+
+def max_distance(target: str) -> int:
+    """Largest edit distance still worth suggesting for `target`: half its
+    length, at least 2."""
+    return max(2, len(target) // 2)
+
+
+def levenshtein(a: str, b: str, bound: int | None = None) -> int:
+    """Edit distance between `a` and `b`. With `bound`, stops as soon as
+    the distance is known to exceed it and returns `bound + 1`; only the
+    diagonal band of `bound` cells each side is computed."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if bound is None:
+        bound = len(a)
+    elif len(a) - len(b) > bound:
+        return bound + 1
+    if not b:
+        return len(a)
+    over = bound + 1
+    width = len(b)
+    prev = [j if j <= bound else over for j in range(width + 1)]
+    for i, ca in enumerate(a, 1):
+        lo = i - bound if i > bound else 1
+        hi = i + bound if i + bound < width else width
+        cur = [over] * (width + 1)
+        if i <= bound:
+            cur[0] = i
+        row_min = cur[0]
+        for j in range(lo, hi + 1):
+            d = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] < d:
+                d = prev[j] + 1
+            if cur[j - 1] < d:
+                d = cur[j - 1] + 1
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > bound:
+            return over
+        prev = cur
+    return min(prev[width], over)
+
+
+def nearest(target: str, candidates, n: int = 3) -> list[str]:
+    """Up to `n` candidates closest to `target`, closest first (ties in
+    name order)."""
+    target = (target or "").upper()
+    pairs = [(c.upper(), c) for c in candidates if isinstance(c, str)]
+    return _best(target, pairs, n)
+
+
+def _best(target: str, pairs, n: int) -> list[str]:
+    """`n` best of `(upper-cased name, name)` pairs. Once `n` matches are
+    known, the distance bound drops to the worst of them, so the other
+    names are given up on after a few characters."""
+    bound = max_distance(target)
+    best: list[tuple[int, str]] = []
+    for upper, name in pairs:
+        d = levenshtein(target, upper, bound)
+        if d > bound:
+            continue
+        insort(best, (d, name))
+        if len(best) > n:
+            best.pop()
+        if len(best) == n:
+            bound = best[-1][0]
+    return [name for _d, name in best]
+
+
+class NameIndex:
+    """A fixed set of names (the catalog's commands) for repeated `nearest`
+    lookups. The names are packed once into a padded code-point matrix, and
+    a lookup runs the Levenshtein recurrence for all of them at the same
+    time, one row per character of the target."""
+
+    def __init__(self, names):
+        self._names = sorted({name for name in names if isinstance(name, str)})
+        width = max((len(name) for name in self._names), default=0)
+        self._codes = np.zeros((len(self._names), width), dtype=np.int32)
+        for row, name in enumerate(self._names):
+            self._codes[row, : len(name)] = [ord(ch) for ch in name.upper()]
+        self._lengths = np.array([len(name) for name in self._names], dtype=np.intp)
+        self._columns = np.arange(width + 1)
+        # Last lookups, least recently used first
+        self._memo: OrderedDict[tuple[str, int], list[str]] = OrderedDict()
+
+    def nearest(self, target: str, n: int = 3) -> list[str]:
+        """Same result as `nearest(target, names, n)`."""
+        key = (target or "", n)
+        found = self._memo.get(key)
+        if found is None:
+            found = self._memo[key] = self._search(key[0].upper(), n)
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        else:
+            self._memo.move_to_end(key)
+        return list(found)
+
+    def _search(self, target: str, n: int) -> list[str]:
+        if not self._names:
+            return []
+        columns = self._columns
+        # Row i of the DP table for every name at once. Padding cells past
+        # the end of a name never feed the cells before it.
+        row = np.broadcast_to(columns, (len(self._names), len(columns))).copy()
+        for i, ch in enumerate(target, 1):
+            nxt = np.empty_like(row)
+            nxt[:, 0] = i
+            np.minimum(row[:, :-1] + (self._codes != ord(ch)), row[:, 1:] + 1, out=nxt[:, 1:])
+            # Insertions chain along the row: a running minimum of
+            # `cell - column`, shifted back.
+            row = np.minimum.accumulate(nxt - columns, axis=1) + columns
+        distances = row[np.arange(len(self._names)), self._lengths]
+        # Names are sorted, so a stable sort on the distance breaks ties
+        # by name.
+        order = np.argsort(distances, kind="stable")[:n]
+        bound = max_distance(target)
+        return [self._names[k] for k in order if distances[k] <= bound]
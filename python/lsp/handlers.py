@@ -2,7 +2,12 @@
 
 import asyncio
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import instrumentation
+from command_core import CommandCore
+from instrumentation import timed, timer
 from lsprotocol.types import (
     CodeActionKind,
     CodeActionParams,
@@ -10,12 +15,14 @@ from lsprotocol.types import (
     CompletionParams,
     DidChangeTextDocumentParams,
     DidChangeWatchedFilesParams,
+    DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
     Hover,
     HoverParams,
     InitializeParams,
     SignatureHelp,
     SignatureHelpParams,
+    TextDocumentSyncKind,
 )
 from pygls.server import LanguageServer
 
@@ -28,6 +35,64 @@ managers = ManagerContainer()
 _diag_tasks: dict[str, asyncio.Task] = {}
 _DEBOUNCE_S = 0.2
 
+# Validation runs on one worker thread so completion and hover requests
+# are served while a large file is checked. Each run gets an event, set
+# when a newer version of the document supersedes it.
+_diag_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagnostics")
+_diag_cancel: dict[str, threading.Event] = {}
+
+
+_DIAG_METHOD = "textDocument/publishDiagnostics"
+
+
+def _param(params, name, default=None):
+    """Field of the params of a custom request (a dict or an object)."""
+    if hasattr(params, "get"):
+        return params.get(name, default)
+    return getattr(params, name, default)
+
+
+def _select_catalog(ls: LanguageServer, path, scope) -> dict:
+    """Switch the default catalog, or the catalog of a workspace folder,
+    then bind the open documents again."""
+    pool = CommandCore().catalogs
+    ok = pool.set_scope(scope, path) if scope else pool.set_default(path)
+    if ok:
+        for doc_uri in list(ls.workspace.text_documents):
+            pool.bind(doc_uri)
+    return {"ok": ok, "path": pool.default().path, "loaded": pool.loaded()}
+
+
+def _bind_catalog(ls: LanguageServer, doc_uri: str) -> None:
+    """Bind a document to the catalog of its `.export` version, loaded
+    meanwhile, unless it was closed."""
+    pool = CommandCore().catalogs
+    if doc_uri in ls.workspace.text_documents:
+        pool.bind(doc_uri)
+
+
+async def _bind_catalog_async(ls: LanguageServer, doc_uri: str) -> None:
+    """Load the catalog of a document on the diagnostics worker, as
+    `codeaster/selectCatalog` does, then validate it again."""
+    try:
+        loop = asyncio.get_running_loop()
+        with timer("textDocument/didOpen", "catalog"):
+            await loop.run_in_executor(_diag_executor, _bind_catalog, ls, doc_uri)
+    except Exception as exc:
+        sys.stderr.write(f"[catalog] can not bind {doc_uri}: {exc!r}\n")
+        sys.stderr.flush()
+        return
+    if doc_uri in ls.workspace.text_documents:
+        _schedule_diagnostics(ls, doc_uri, delay=0)
+        ls.send_notification("reloadStatusBar", {})
+
+
+def _validate_timed(doc_uri, snapshot, is_cancelled):
+    """`DiagnosticsManager.validate` on the worker thread, timed as the
+    `validate` phase (cancelled runs included)."""
+    with timer(_DIAG_METHOD, "validate"):
+        return managers.diagnostics.validate(doc_uri, snapshot, is_cancelled)
+
 
 def _publish_diagnostics(ls: LanguageServer, doc_uri: str) -> None:
     """Run validation and ship diagnostics to the client. Wrapped so
@@ -44,17 +109,49 @@ def _publish_diagnostics(ls: LanguageServer, doc_uri: str) -> None:
             pass
 
 
-def _schedule_diagnostics(ls: LanguageServer, doc_uri: str) -> None:
-    """Debounce: cancel any in-flight task for this URI and queue a new
-    one to fire after `_DEBOUNCE_S` seconds."""
+async def _publish_diagnostics_async(
+    ls: LanguageServer, doc_uri: str, cancel: threading.Event
+) -> None:
+    """Validate a snapshot of the document on the worker thread, then
+    publish unless a newer version cancelled the run meanwhile."""
+    try:
+        doc = ls.workspace.get_document(doc_uri)
+        version = doc.version
+        with timer(_DIAG_METHOD, "snapshot"):
+            snapshot = managers.diagnostics.snapshot(doc_uri)
+        loop = asyncio.get_running_loop()
+        diags = await loop.run_in_executor(
+            _diag_executor, _validate_timed, doc_uri, snapshot, cancel.is_set
+        )
+        if diags is None or cancel.is_set():
+            return  # stale
+        with timer(_DIAG_METHOD, "publish"):
+            ls.publish_diagnostics(doc_uri, diags, version=version)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        sys.stderr.write(f"[diagnostics] publish failed: {exc!r}\n")
+        sys.stderr.flush()
+    finally:
+        if _diag_cancel.get(doc_uri) is cancel:
+            del _diag_cancel[doc_uri]
+
+
+def _schedule_diagnostics(ls: LanguageServer, doc_uri: str, delay: float = _DEBOUNCE_S) -> None:
+    """Debounce: cancel any pending or running validation for this URI
+    and queue a new one to fire after `delay` seconds."""
     prev = _diag_tasks.pop(doc_uri, None)
     if prev is not None and not prev.done():
         prev.cancel()
+    running = _diag_cancel.pop(doc_uri, None)
+    if running is not None:
+        running.set()
+    cancel = _diag_cancel[doc_uri] = threading.Event()
 
     async def _delayed():
         try:
-            await asyncio.sleep(_DEBOUNCE_S)
-            _publish_diagnostics(ls, doc_uri)
+            await asyncio.sleep(delay)
+            await _publish_diagnostics_async(ls, doc_uri, cancel)
         except asyncio.CancelledError:
             return
 
@@ -62,6 +159,7 @@ def _schedule_diagnostics(ls: LanguageServer, doc_uri: str) -> None:
         _diag_tasks[doc_uri] = asyncio.ensure_future(_delayed())
     except RuntimeError:
         # No running loop (e.g. unit-test path) — fall back to synchronous.
+        _diag_cancel.pop(doc_uri, None)
         _publish_diagnostics(ls, doc_uri)
 
 
@@ -71,7 +169,7 @@ def register_handlers(server: LanguageServer):
     def on_initialize(ls: LanguageServer, params: InitializeParams):
         return {
             "capabilities": {
-                "textDocumentSync": 1,
+                "textDocumentSync": TextDocumentSyncKind.Incremental,
                 "completionProvider": {
                     "resolveProvider": False,
                     "triggerCharacters": ["(", ",", "="],
@@ -85,24 +183,45 @@ def register_handlers(server: LanguageServer):
         }
 
     @server.feature("textDocument/didOpen")
+    @timed("textDocument/didOpen")
     def on_document_open(ls: LanguageServer, params: DidOpenTextDocumentParams):
         """Initialisation du registre à l'ouverture du document"""
         doc_uri = params.text_document.uri
         doc = ls.workspace.get_document(doc_uri)
 
+        # The catalog of a version that isn't loaded yet is loaded off the
+        # event loop: the document uses the default one meanwhile
+        pool = CommandCore().catalogs
+        pool.bind(doc_uri, load=False)
         managers.update.init_registry(doc, doc_uri)
-        _publish_diagnostics(ls, doc_uri)
+        if pool.unloaded(doc_uri) is None:
+            _schedule_diagnostics(ls, doc_uri, delay=0)
+            return
+        try:
+            asyncio.ensure_future(_bind_catalog_async(ls, doc_uri))
+        except RuntimeError:
+            # No running loop (e.g. unit-test path) — bind synchronously.
+            pool.bind(doc_uri)
+            _schedule_diagnostics(ls, doc_uri, delay=0)
+
+    @server.feature("textDocument/didClose")
+    def on_document_close(ls: LanguageServer, params: DidCloseTextDocumentParams):
+        """Release the document's catalog binding"""
+        CommandCore().catalogs.unbind(params.text_document.uri)
 
     @server.feature("textDocument/didChange")
+    @timed("textDocument/didChange")
     def on_text_change(ls: LanguageServer, params: DidChangeTextDocumentParams):
         """Mise à jour incrémentale à chaque frappe"""
         doc_uri = params.text_document.uri
         doc = ls.workspace.get_document(doc_uri)
 
-        managers.update.update_registry(doc, doc_uri, params.content_changes)
+        with timer("textDocument/didChange", "registry"):
+            managers.update.update_registry(doc, doc_uri, params.content_changes)
         _schedule_diagnostics(ls, doc_uri)
 
     @server.feature("textDocument/completion")
+    @timed("textDocument/completion")
     def completion(ls: LanguageServer, params: CompletionParams) -> CompletionList:
         """Auto-complétion basée sur le contexte de la commande"""
         doc_uri = params.text_document.uri
@@ -111,6 +230,7 @@ def register_handlers(server: LanguageServer):
         return managers.completion.completion(doc_uri, position)
 
     @server.feature("textDocument/signatureHelp")
+    @timed("textDocument/signatureHelp")
     def signature_help(ls: LanguageServer, params: SignatureHelpParams) -> SignatureHelp:
         doc_uri = params.text_document.uri
         position = params.position
@@ -118,6 +238,7 @@ def register_handlers(server: LanguageServer):
         return managers.signature.help(doc_uri, position)
 
     @server.feature("textDocument/hover")
+    @timed("textDocument/hover")
     def hover(ls: LanguageServer, params: HoverParams) -> Hover:
         doc_uri = params.text_document.uri
         position = params.position
@@ -125,6 +246,7 @@ def register_handlers(server: LanguageServer):
         return managers.hover.display(doc_uri, position)
 
     @server.feature("textDocument/codeAction")
+    @timed("textDocument/codeAction")
     def code_action(ls: LanguageServer, params: CodeActionParams):
         """Quick fixes for diagnostics. The diagnostics carry the
         candidate replacements in their `data` field, so this handler
@@ -155,3 +277,61 @@ def register_handlers(server: LanguageServer):
     def getCompleteFamilies(ls, params):
 
         return managers.status_bar.get_complete_families()
+
+    @server.feature("codeaster/perfStats")
+    def perf_stats(ls, params):
+        """Latency histograms of the handlers, per method and phase.
+
+        Optional params: `reset` (clear the histograms after reading
+        them), `logLevel` ("info" or "debug") and `profile` ("start" or
+        "stop"; "stop" returns the cProfile report under `profile`).
+        """
+
+        def param(name, default=None):
+            return _param(params, name, default)
+
+        level = param("logLevel")
+        if level:
+            try:
+                instrumentation.set_log_level(level)
+            except ValueError as exc:
+                sys.stderr.write(f"[perfStats] {exc}\n")
+                sys.stderr.flush()
+
+        result = instrumentation.stats()
+        profile = param("profile")
+        if profile == "start":
+            instrumentation.start_profile()
+            result["profiling"] = True
+        elif profile == "stop":
+            result["profile"] = instrumentation.stop_profile()
+            result["profiling"] = False
+        if param("reset", False):
+            instrumentation.reset()
+        return result
+
+    @server.feature("codeaster/selectCatalog")
+    async def select_catalog(ls, params):
+        """Use another catalog without restarting the server.
+
+        Params: `path` (the `code_aster` package to read; empty for the
+        catalog the server started with) and optional `scope` (URI of the
+        workspace folder it applies to, instead of the default). Returns
+        `ok`, the default catalog `path` and the `loaded` catalogs.
+
+        The catalog is loaded on the diagnostics worker, so that it isn't
+        read while a validation runs.
+        """
+        path = _param(params, "path") or None
+        scope = _param(params, "scope") or None
+        loop = asyncio.get_running_loop()
+        with timer("codeaster/selectCatalog", "load"):
+            result = await loop.run_in_executor(_diag_executor, _select_catalog, ls, path, scope)
+        if result["ok"]:
+            for doc_uri in list(ls.workspace.text_documents):
+                _schedule_diagnostics(ls, doc_uri, delay=0)
+            ls.send_notification("reloadStatusBar", {})
+        else:
+            sys.stderr.write(f"[catalog] can not select {path!r} (scope {scope!r})\n")
+            sys.stderr.flush()
+        return result
@@ -0,0 +1,175 @@
+"""
+Latency instrumentation and log verbosity for the language server
+
+Handlers and managers time themselves with `timer(method, phase)` (or the
+`timed(method)` decorator for a whole handler). Each `(method, phase)`
+pair feeds a fixed-bucket histogram; `stats()` is what the
+`codeaster/perfStats` request returns. Recording costs two
+`perf_counter()` calls and a lock, so it stays on in production.
+
+`start_profile()` / `stop_profile()` wrap cProfile for an opt-in capture.
+It only sees the thread that started it (the event loop), not the
+diagnostics worker.
+
+Per-request debug lines (completion context, registry dumps, ...) are
+only built and written when `debug_enabled()`: set
+`VS_CODE_ASTER_LOG_LEVEL=debug` or switch it at runtime through
+`codeaster/perfStats`.
+"""
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets, in milliseconds (the last bucket
+# is unbounded)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_LOG_LEVELS = ("info", "debug")
+_log_level = os.environ.get("VS_CODE_ASTER_LOG_LEVEL", "info").lower()
+
+
+def debug_enabled() -> bool:
+    """Whether per-request debug lines should be logged."""
+    return _log_level == "debug"
+
+
+def set_log_level(level: str) -> None:
+    global _log_level
+    level = level.lower()
+    if level not in _LOG_LEVELS:
+        raise ValueError(f"unknown log level {level!r}, expected one of {_LOG_LEVELS}")
+    _log_level = level
+
+
+class Histogram:
+    """Wall times of one `(method, phase)` pair."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of the
+        samples (`max` for the unbounded bucket)."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "totalMs": round(self.total, 3),
+            "meanMs": round(self.total / self.count, 3) if self.count else 0.0,
+            "maxMs": round(self.max, 3),
+            "p50Ms": self.percentile(0.5),
+            "p95Ms": self.percentile(0.95),
+            "buckets": list(self.counts),
+        }
+
+
+_lock = threading.Lock()
+_histograms: dict[tuple[str, str], Histogram] = {}
+_profiler: cProfile.Profile | None = None
+
+
+def record(method: str, phase: str, ms: float) -> None:
+    """Add one measurement, in milliseconds."""
+    with _lock:
+        histogram = _histograms.get((method, phase))
+        if histogram is None:
+            histogram = _histograms[(method, phase)] = Histogram()
+        histogram.add(ms)
+
+
+@contextmanager
+def timer(method: str, phase: str = "total") -> Iterator[None]:
+    """Time the body of a `with` block as `phase` of `method`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(method, phase, (time.perf_counter() - start) * 1000)
+
+
+def timed(method: str) -> Callable:
+    """Decorator timing every call of a handler as the `total` phase of
+    `method`."""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(method, "total", (time.perf_counter() - start) * 1000)
+
+        return wrapper
+
+    return decorate
+
+
+def stats() -> dict:
+    """`{method: {phase: histogram}}` of everything recorded so far."""
+    out: dict[str, dict[str, dict]] = {}
+    with _lock:
+        for (method, phase), histogram in sorted(_histograms.items()):
+            out.setdefault(method, {})[phase] = histogram.to_dict()
+    return {
+        "bucketsMs": list(BUCKETS_MS),
+        "methods": out,
+        "logLevel": _log_level,
+        "profiling": _profiler is not None,
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+
+
+def start_profile() -> None:
+    """Start a cProfile capture of the calling thread (no-op if one is
+    already running)."""
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profile(limit: int = 40) -> str:
+    """Stop the capture and return its `limit` most expensive functions
+    by cumulative time, as pstats text ("" if none was running)."""
+    global _profiler
+    if _profiler is None:
+        return ""
+    profiler, _profiler = _profiler, None
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
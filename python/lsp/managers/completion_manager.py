@@ -1,7 +1,9 @@
 import sys
 import traceback
 
+from comm_tokenizer import COMMA, COMMENT, EQUALS, IDENT, LPAREN, OPEN_STRING, RPAREN, STRING
 from command_core import CommandCore
+from instrumentation import debug_enabled, timer
 from lsprotocol.types import (
     Command,
     CompletionItem,
@@ -21,6 +23,9 @@ def _retrigger_command() -> Command:
     return Command(title="Trigger suggest", command="editor.action.triggerSuggest")
 
 
+_METHOD = "textDocument/completion"
+
+
 def _log(msg: str) -> None:
     """Write to stderr so the line surfaces in the LSP's Output channel
     (Python Language Server), same place the [catalog] lines land."""
@@ -37,10 +42,11 @@ class CompletionManager:
       * inside a `_F(...)` factor frame → that factor's sub-keywords
       * otherwise inside a call → remaining top-level keywords
 
-    All dispatch decisions come from a single forward scan over the document
-    bytes between the enclosing command's opening `(` and the cursor. Forward
-    scanning (rather than backwards) makes mid-edit unmatched quotes / parens
-    a non-issue: strings open and close left-to-right.
+    All dispatch decisions come from a single forward scan over the
+    registry's token stream between the enclosing command's start and the
+    cursor. Forward scanning (rather than backwards) makes mid-edit
+    unmatched quotes / parens a non-issue: strings open and close
+    left-to-right.
     """
 
     def __init__(self):
@@ -59,36 +65,45 @@ class CompletionManager:
         registry = self.core.get_registry(doc_uri)
         doc = self.core.get_doc_from_uri(doc_uri)
         if registry is None or doc is None:
-            _log(
-                f"[completion] line={position.line} col={position.character} "
-                f"registry={registry is not None} doc={doc is not None} → empty"
-            )
+            if debug_enabled():
+                _log(
+                    f"[completion] line={position.line} col={position.character} "
+                    f"registry={registry is not None} doc={doc is not None} → empty"
+                )
             return CompletionList(is_incomplete=True, items=[])
 
         cmd_info = registry.get_command_at_line(position.line + 1)
         if not cmd_info:
-            result = self._suggest_commands()
-            _log(
-                f"[completion] line={position.line} col={position.character} "
-                f"cmd=None registry_size={len(registry.commands)} "
-                f"ranges={registry.ranges} items={len(result.items)} kind=Function"
-            )
+            with timer(_METHOD, "render"):
+                result = self._suggest_commands(doc_uri)
+            if debug_enabled():
+                _log(
+                    f"[completion] line={position.line} col={position.character} "
+                    f"cmd=None registry_size={len(registry.commands)} "
+                    f"items={len(result.items)} kind=Function"
+                )
             return result
 
-        cmd_def = self.core.get_command_def(cmd_info.name)
+        with timer(_METHOD, "catalog"):
+            cmd_def = self.core.get_command_def(cmd_info.name, doc_uri)
         if not cmd_def or "params" not in cmd_def:
             _log(f"[completion] cmd={cmd_info.name} but parse_command returned no params → empty")
             return CompletionList(is_incomplete=True, items=[])
 
-        scan = _scan_forward(doc.lines, cmd_info, position)
+        with timer(_METHOD, "scan"):
+            scan = _scan_forward(registry, cmd_info, position)
 
         # Descend into the factor path to scope the visible parameters.
         params_list = cmd_def["params"]
+        index = self.core.get_keyword_index(cmd_info.name, doc_uri)
         for factor_name in scan.factor_path:
-            entry = _find_param(params_list, factor_name)
-            if not entry or not entry["children"]:
+            entry = index.find_local(factor_name)
+            if entry is None or entry.scope is None or not entry.param:
                 break
-            params_list = entry["children"]
+            if not entry.param["children"]:
+                break
+            params_list = entry.param["children"]
+            index = entry.scope
 
         # Value position takes precedence over keyword listing.
         if scan.value_keyword is not None:
@@ -96,23 +111,27 @@ class CompletionManager:
             # duplicate-named SIMPs in different BLOCs (e.g. ALGO_RESO_GEOM
             # in DEFI_CONTACT) resolve to the one actually active.
             value_ctx = cmd_info.parsed_params if not scan.factor_path else None
-            target = _find_param(params_list, scan.value_keyword, value_ctx)
+            found = index.find_local(scan.value_keyword, value_ctx)
+            target = found.param if found is not None else None
             items: list[CompletionItem] = []
             if target is not None:
-                remaining = _remaining_keyword_count(
-                    params_list, scan.written_keys | {scan.value_keyword}
-                )
-                more = remaining > 0
-                if target.get("allowed"):
-                    items.extend(_value_items(target, scan.inside_quotes, append_comma=more))
-                items.extend(
-                    _variable_items(registry, self.core, target, position, append_comma=more)
+                with timer(_METHOD, "render"):
+                    remaining = _remaining_keyword_count(
+                        params_list, scan.written_keys | {scan.value_keyword}
+                    )
+                    more = remaining > 0
+                    if target.get("allowed"):
+                        items.extend(_value_items(target, scan.inside_quotes, append_comma=more))
+                    cata = self.core.get_CATA(doc_uri)
+                    items.extend(
+                        _variable_items(registry, cata, target, position, append_comma=more)
+                    )
+            if debug_enabled():
+                _log(
+                    f"[completion] cmd={cmd_info.name} factor_path={scan.factor_path} "
+                    f"value_keyword={scan.value_keyword} inside_quotes={scan.inside_quotes} "
+                    f"items={len(items)} kind=Value"
                 )
-            _log(
-                f"[completion] cmd={cmd_info.name} factor_path={scan.factor_path} "
-                f"value_keyword={scan.value_keyword} inside_quotes={scan.inside_quotes} "
-                f"items={len(items)} kind=Value"
-            )
             return CompletionList(is_incomplete=True, items=items)
 
         # Keyword-arg list at the current scope. The forward scan tracks
@@ -128,21 +147,23 @@ class CompletionManager:
         else:
             context = None
 
-        result = self._suggest_parameters(params_list, written, context)
-        _log(
-            f"[completion] cmd={cmd_info.name} factor_path={scan.factor_path} "
-            f"value_keyword=None inside_quotes={scan.inside_quotes} "
-            f"written={sorted(written)} "
-            f"available={[p['name'] for p in params_list if not p.get('bloc')]} "
-            f"items={len(result.items)} kind=Property"
-        )
+        with timer(_METHOD, "render"):
+            result = self._suggest_parameters(params_list, written, context)
+        if debug_enabled():
+            _log(
+                f"[completion] cmd={cmd_info.name} factor_path={scan.factor_path} "
+                f"value_keyword=None inside_quotes={scan.inside_quotes} "
+                f"written={sorted(written)} "
+                f"available={[p['name'] for p in params_list if not p.get('bloc')]} "
+                f"items={len(result.items)} kind=Property"
+            )
         return result
 
     # ----------------------------------------------- top-level command list
 
-    def _suggest_commands(self) -> CompletionList:
+    def _suggest_commands(self, doc_uri: str) -> CompletionList:
         items = []
-        for cmd in self.core.get_CATA_commands():
+        for cmd in self.core.get_CATA_commands(doc_uri):
             if cmd["name"] == "DEBUT":
                 insert = "DEBUT()\n$0\nFIN()"
                 retrigger = None
@@ -199,28 +220,6 @@ class CompletionManager:
 # ===================== helpers ============================================
 
 
-def _find_param(params, name, context=None):
-    """Find a parsed-param dict by name, descending into BLOC children.
-    When `context` is given, BLOCs whose condition is not satisfied by
-    `context` are skipped — this is essential for catalogs (e.g.
-    DEFI_CONTACT) where the same SIMP name is declared under
-    mutually-exclusive BLOCs with different `into=(...)` lists."""
-    for p in params:
-        if p.get("name") == name:
-            return p
-        if p.get("bloc"):
-            if context is not None:
-                try:
-                    if not p["bloc"].isEnabled(context):
-                        continue
-                except Exception:
-                    pass
-            inner = _find_param(p.get("children", []), name, context)
-            if inner:
-                return inner
-    return None
-
-
 def _md(text: str) -> MarkupContent | None:
     text = (text or "").strip()
     if not text:
@@ -298,45 +297,6 @@ def _value_items(param, inside_quotes: bool, append_comma: bool = True) -> list[
     return out
 
 
-def _command_return_types(cmd_obj) -> tuple:
-    """Resolve a command's `sd_prod` to a tuple of concrete output classes.
-
-    `sd_prod` may be (a) a class, (b) a callable that returns a class or
-    tuple of classes when invoked with `__all__=True` (the convention
-    used in code_aster catalogs — see e.g. `lire_maillage_sdprod` which
-    returns `(maillage_sdaster, maillage_p)`), or (c) None. Callable form
-    typically requires positional args (like `FORMAT, PARTITIONNEUR`) so
-    we introspect the signature and pad the call with `None`s before
-    setting `__all__=True`.
-    """
-    sd = cmd_obj.definition.get("sd_prod") if hasattr(cmd_obj, "definition") else None
-    if sd is None:
-        return ()
-    if isinstance(sd, type):
-        return (sd,)
-    if not callable(sd):
-        return ()
-
-    import inspect
-
-    try:
-        sig = inspect.signature(sd)
-        positional = [
-            p
-            for p in sig.parameters.values()
-            if p.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
-            and p.default is inspect.Parameter.empty
-        ]
-        result = sd(*([None] * len(positional)), __all__=True)
-    except Exception:
-        return ()
-    if isinstance(result, type):
-        return (result,)
-    if isinstance(result, (tuple, list)):
-        return tuple(t for t in result if isinstance(t, type))
-    return ()
-
-
 def _expected_classes(param) -> tuple:
     """Pull the raw type(s) the SIMP keyword expects."""
     typ = param.get("type_obj")
@@ -349,21 +309,8 @@ def _expected_classes(param) -> tuple:
     return ()
 
 
-def _types_compatible(var_types, expected) -> bool:
-    if not var_types or not expected:
-        return False
-    for vt in var_types:
-        for et in expected:
-            try:
-                if issubclass(vt, et):
-                    return True
-            except TypeError:
-                continue
-    return False
-
-
 def _variable_items(
-    registry, core, param, position, append_comma: bool = True
+    registry, cata, param, position, append_comma: bool = True
 ) -> list[CompletionItem]:
     """Suggest already-declared variables whose type is compatible with
     the SIMP keyword the cursor is filling in."""
@@ -372,24 +319,22 @@ def _variable_items(
         return []
     cursor_line_1based = position.line + 1
     out: list[CompletionItem] = []
-    seen: set[str] = set()
-    cata = core.get_CATA()
-    # Iterate in the registry's natural order so we can list earliest
-    # assignments first, but skip duplicates (var reassigned later).
-    for cmd_info in sorted(registry.commands.values(), key=lambda c: c.start_line):
-        var = getattr(cmd_info, "var_name", None)
-        if not var or var in seen:
-            continue
-        # Don't suggest a variable whose assignment is below the cursor.
-        if cmd_info.start_line >= cursor_line_1based:
-            continue
-        cmd_obj = cata.get_command_obj(cmd_info.name)
-        if cmd_obj is None:
-            continue
-        var_types = _command_return_types(cmd_obj)
-        if not _types_compatible(var_types, expected):
-            continue
-        seen.add(var)
+    result_types = cata.result_types
+    # Commands whose result fits, so each assignment is a set lookup
+    producers = result_types.commands_for(expected)
+    # Earliest compatible assignment of each variable above the cursor,
+    # listed in document order.
+    found: list[tuple] = []
+    for var in registry.assigned_names():
+        for cmd_info in registry.assignments(var):
+            if cmd_info.start_line >= cursor_line_1based:
+                break
+            if cmd_info.name in producers:
+                found.append((cmd_info, result_types.of(cmd_info.name)))
+                break
+    found.sort(key=lambda item: item[0].start_line)
+    for cmd_info, var_types in found:
+        var = cmd_info.var_name
         type_name = ", ".join(t.__name__ for t in var_types) or "?"
         suffix = ", " if append_comma else ""
         out.append(
@@ -430,9 +375,6 @@ def _keyword_item(param) -> CompletionItem:
 # ----------------- forward cursor-context scan ----------------------------
 
 
-_IDENT_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
-
-
 class _Scan:
     """Result of the forward scan."""
 
@@ -449,9 +391,11 @@ class _Scan:
         self.written_keys: set[str] = set()
 
 
-def _scan_forward(doc_lines, cmd_info, position) -> _Scan:
-    """Walk forward from `cmd_info.start_line` to the cursor, classifying
-    where we are. Strings open/close monotonically, paren depth ditto."""
+def _scan_forward(registry, cmd_info, position) -> _Scan:
+    """Walk the registry's token stream forward from `cmd_info.start_line`
+    to the cursor, classifying where we are. Paren depth only moves
+    left-to-right, and strings never span lines, so unmatched quotes or
+    parens mid-edit are a non-issue."""
     cursor_line = position.line  # 0-based
     cursor_col = position.character
     start_idx = max(0, cmd_info.start_line - 1)
@@ -466,7 +410,7 @@ def _scan_forward(doc_lines, cmd_info, position) -> _Scan:
     # outermost scope (top-level call) when no factor is open.
     seen_stack: list[set[str]] = [set()]
     depth = 0
-    in_string: str | None = None
+    in_string = False
     # `last_kw` is the last identifier seen at the current scope that was
     # immediately followed by `=`. Reset on commas, closing parens, or any
     # significant non-whitespace token after the `=` is consumed.
@@ -474,131 +418,97 @@ def _scan_forward(doc_lines, cmd_info, position) -> _Scan:
     # `value_pos` is True when we've seen `KEY=` and not yet seen any
     # significant token (anything other than whitespace or an opening quote).
     value_pos: bool = False
-    # Identifier accumulator for parsing names left-to-right.
+    # Last identifier, while it can still be the name of a `NAME=` or `NAME(`.
     pending_name: str | None = None
 
-    for line_idx in range(start_idx, cursor_line + 1):
-        if line_idx >= len(doc_lines):
+    for line_idx, tok in registry.iter_tokens(start_idx, 0, cursor_line + 1):
+        if line_idx == cursor_line and tok.col >= cursor_col:
             break
-        line = doc_lines[line_idx]
-        col_end = cursor_col if line_idx == cursor_line else len(line)
-        i = 0
-        while i < col_end:
-            c = line[i]
-
-            if in_string:
-                # Consume the string body. Closing quote terminates.
-                if c == in_string and (i == 0 or line[i - 1] != "\\"):
-                    in_string = None
-                    # Exiting a string is a "significant token" — clear
-                    # value_pos so a later `KEY=` is required to reactivate.
-                    value_pos = False
-                    last_kw = None
-                i += 1
-                continue
+        kind = tok.kind
 
-            if c in ("'", '"'):
-                # Opening a string. If we were in value_pos, we stay there
-                # so the cursor inside the string still resolves to
-                # value_keyword=last_kw.
-                in_string = c
-                i += 1
-                continue
+        if kind in (STRING, OPEN_STRING):
+            if line_idx == cursor_line and (kind == OPEN_STRING or tok.end > cursor_col):
+                # The cursor is inside this string. If we were in value_pos,
+                # we stay there so it still resolves to value_keyword=last_kw.
+                in_string = True
+                break
+            # A whole string is a "significant token" — clear value_pos so
+            # a later `KEY=` is required to reactivate.
+            pending_name = None
+            value_pos = False
+            last_kw = None
+            continue
 
-            # Outside a string. Identifier accumulation.
-            if c in _IDENT_CHARS:
-                if pending_name is None:
-                    pending_name = c
-                else:
-                    pending_name += c
-                i += 1
-                continue
+        if kind == IDENT:
+            if line_idx == cursor_line and tok.end > cursor_col:
+                pending_name = tok.text[: cursor_col - tok.col]
+            else:
+                pending_name = tok.text
+            continue
+
+        if kind == EQUALS:
+            # `KEY=` is a kwarg only when we're inside a call (depth>0).
+            # At depth 0 it's a Python statement assignment (`VAR =
+            # CMD(...)`) and the LHS should not be treated as a
+            # keyword name.
+            if depth > 0 and pending_name is not None:
+                last_kw = pending_name
+                value_pos = True
+                # Mark this key as already-written in the current
+                # scope (top of seen_stack, parallel to call stack).
+                seen_stack[-1].add(pending_name)
             else:
-                # Non-identifier: see if pending_name + this char is `NAME=`
-                # (kwarg) or `NAME(` (call). If `=`, mark value_pos. If `(`,
-                # push a stack frame. Otherwise just discard pending_name.
-                # Skip whitespace inline first.
-                if c.isspace():
-                    if pending_name is not None:
-                        # finalize: still pending; allow whitespace then `=`/`(`
-                        pass
-                    i += 1
-                    continue
-
-                if c == "=":
-                    # `KEY=` is a kwarg only when we're inside a call (depth>0).
-                    # At depth 0 it's a Python statement assignment (`VAR =
-                    # CMD(...)`) and the LHS should not be treated as a
-                    # keyword name.
-                    if (
-                        depth > 0
-                        and pending_name is not None
-                        and (i + 1 >= len(line) or line[i + 1] != "=")
-                    ):
-                        last_kw = pending_name
-                        value_pos = True
-                        # Mark this key as already-written in the current
-                        # scope (top of seen_stack, parallel to call stack).
-                        seen_stack[-1].add(pending_name)
-                        pending_name = None
-                    else:
-                        pending_name = None
-                        value_pos = False
-                        last_kw = None
-                    i += 1
-                    continue
-
-                if c == "(":
-                    # `KEY=_F(...)` — the factor's identity in the catalog
-                    # is KEY, not the literal `_F`. Push the kwarg name so
-                    # the descent in `params_list` resolves correctly.
-                    if value_pos and last_kw is not None:
-                        stack.append((last_kw, depth))
-                    elif pending_name is not None:
-                        stack.append((pending_name, depth))
-                    pending_name = None
-                    depth += 1
-                    seen_stack.append(set())
-                    value_pos = False
-                    last_kw = None
-                    i += 1
-                    continue
-
-                if c == ")":
-                    depth -= 1
-                    while stack and stack[-1][1] >= depth:
-                        stack.pop()
-                    if len(seen_stack) > 1:
-                        seen_stack.pop()
-                    pending_name = None
-                    value_pos = False
-                    last_kw = None
-                    i += 1
-                    continue
-
-                if c == ",":
-                    pending_name = None
-                    value_pos = False
-                    last_kw = None
-                    i += 1
-                    continue
-
-                if c == "#":
-                    # Comment runs to end of line.
-                    break
-
-                # Any other char (digits, dots, operators, etc.) — clears
-                # the identifier accumulator but NOT the value-position
-                # state. The user typing `APLAT=0.5` is still in
-                # APLAT's value scope until a `,` or `)`.
-                pending_name = None
-                i += 1
-
-        # End of this line slice. If we end inside a string, that's part of
-        # the cursor's state we need to remember.
+                value_pos = False
+                last_kw = None
+            pending_name = None
+            continue
+
+        if kind == LPAREN:
+            # `KEY=_F(...)` — the factor's identity in the catalog
+            # is KEY, not the literal `_F`. Push the kwarg name so
+            # the descent in `params_list` resolves correctly.
+            if value_pos and last_kw is not None:
+                stack.append((last_kw, depth))
+            elif pending_name is not None:
+                stack.append((pending_name, depth))
+            pending_name = None
+            depth += 1
+            seen_stack.append(set())
+            value_pos = False
+            last_kw = None
+            continue
+
+        if kind == RPAREN:
+            depth -= 1
+            while stack and stack[-1][1] >= depth:
+                stack.pop()
+            if len(seen_stack) > 1:
+                seen_stack.pop()
+            pending_name = None
+            value_pos = False
+            last_kw = None
+            continue
+
+        if kind == COMMA:
+            pending_name = None
+            value_pos = False
+            last_kw = None
+            continue
+
+        if kind == COMMENT:
+            continue
+
+        # Any other token (dots, operators, etc.) clears the identifier but
+        # NOT the value-position state: the user typing `APLAT=0.5` is
+        # still in APLAT's value scope until a `,` or `)`. Comparisons
+        # (`==`, `<=`, ...) do end it.
+        pending_name = None
+        if "=" in tok.text:
+            value_pos = False
+            last_kw = None
 
     out = _Scan()
-    out.inside_quotes = in_string is not None
+    out.inside_quotes = in_string
     if value_pos and last_kw is not None:
         out.value_keyword = last_kw
     # Drop the outer command frame from the stack to get the factor path.
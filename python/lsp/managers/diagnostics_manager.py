@@ -4,15 +4,28 @@ Walks each command in the registry, validates against CATA, and emits
 LSP `Diagnostic` objects. Every per-command and per-keyword check is
 wrapped to swallow exceptions so a CATA quirk can never block hover,
 completion, or formatting.
+
+Results are cached per command. After an edit only the commands the
+registry re-parsed, plus the ones referencing a variable whose
+definition moved, are validated again; the others are reused, shifted
+to their new lines.
+
+The server runs validation on a worker thread, against a snapshot of
+the registry (`snapshot`), and may cancel it when the document changes.
 """
 
 from __future__ import annotations
 
-import re
+import copy
 import sys
 import traceback
+import weakref
+from collections.abc import Callable
+from dataclasses import dataclass, field
 
 from command_core import CommandCore
+from fuzzy import nearest
+from instrumentation import debug_enabled
 from lsprotocol.types import (
     Diagnostic,
     DiagnosticSeverity,
@@ -20,13 +33,11 @@ from lsprotocol.types import (
     Range,
 )
 from validators import (
-    command_return_types,
     expected_classes,
     find_keyword,
     is_bare_identifier,
     required_keywords,
     simp_defaults,
-    types_compatible,
     value_in_into,
     visible_keywords,
 )
@@ -59,9 +70,49 @@ _RULE_TEMPLATES = {
 }
 
 
+@dataclass(slots=True)
+class _CommandDiagnostics:
+    """Cached diagnostics of one command."""
+
+    line: int  # its start line at the time
+    diags: list[Diagnostic]
+    refs: set[str]  # variable names the command references
+
+
+@dataclass(slots=True)
+class _DocumentDiagnostics:
+    """Diagnostics cache of one document, by command id."""
+
+    cata: object = None  # catalog the entries were computed with
+    entries: dict[int, _CommandDiagnostics] = field(default_factory=dict)
+    # variable name -> ids of the commands referencing it
+    consumers: dict[str, set[int]] = field(default_factory=dict)
+
+    def store(self, cmd_id: int, entry: _CommandDiagnostics) -> None:
+        self.drop(cmd_id)
+        self.entries[cmd_id] = entry
+        for name in entry.refs:
+            self.consumers.setdefault(name, set()).add(cmd_id)
+
+    def drop(self, cmd_id: int) -> None:
+        entry = self.entries.pop(cmd_id, None)
+        if entry is None:
+            return
+        for name in entry.refs:
+            ids = self.consumers.get(name)
+            if ids is not None:
+                ids.discard(cmd_id)
+                if not ids:
+                    del self.consumers[name]
+
+
 class DiagnosticsManager:
     def __init__(self):
         self.core = CommandCore()
+        # Per-document caches, dropped with the registry they belong to.
+        # Only touched by `validate`, which the server runs on a single
+        # worker thread.
+        self._documents: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
         try:
             from asterstudy.datamodel.dict_categories import DEPRECATED as _DEP
 
@@ -71,53 +122,89 @@ class DiagnosticsManager:
 
     # -------------------------------------------------------- entry
 
-    def validate(self, doc_uri: str) -> list[Diagnostic]:
-        """Validate the whole document. Always returns a (possibly empty)
-        list — never raises."""
+    def snapshot(self, doc_uri: str):
+        """Snapshot of the document's registry to validate off the event
+        loop, or None if the document has no registry."""
+        registry = self.core.get_registry(doc_uri)
+        return registry.snapshot() if registry is not None else None
+
+    def validate(
+        self,
+        doc_uri: str,
+        registry=None,
+        is_cancelled: Callable[[], bool] | None = None,
+    ) -> list[Diagnostic] | None:
+        """Validate the whole document: its live registry, or `registry`
+        (a `snapshot`). Returns None if `is_cancelled()` turned true
+        before the end, otherwise a (possibly empty) list — never
+        raises."""
         try:
-            return self._validate(doc_uri)
+            return self._validate(doc_uri, registry, is_cancelled)
         except Exception as exc:
             _log(f"[diagnostics] validate({doc_uri}) crashed: {exc!r}\n{traceback.format_exc()}")
+            # The registry changes were consumed; start over next time
+            self._documents.clear()
             return []
 
-    def _validate(self, doc_uri: str) -> list[Diagnostic]:
-        registry = self.core.get_registry(doc_uri)
-        doc = self.core.get_doc_from_uri(doc_uri)
-        if registry is None or doc is None:
+    def _validate(
+        self, doc_uri: str, registry, is_cancelled: Callable[[], bool] | None
+    ) -> list[Diagnostic] | None:
+        if registry is None:
+            registry = self.core.get_registry(doc_uri)
+        if registry is None:
             return []
-        cata = self.core.get_CATA()
+        # The registry's copy of the lines matches the client's document and
+        # comes with the token stream the checks below read.
+        lines = registry.lines
+        cata = self.core.get_CATA(doc_uri)
         diags: list[Diagnostic] = []
 
-        # Build a `var_name → (start_line_1based, command_name)` index for
-        # variable-reference / type-compat checks. The earliest assignment
-        # wins on duplicates (we'll re-evaluate later if needed).
-        var_index: dict[str, tuple[int, str]] = {}
-        for ci in registry.commands.values():
-            try:
-                if ci.var_name and ci.var_name not in var_index:
-                    var_index[ci.var_name] = (ci.start_line, ci.name)
-            except Exception:
-                continue
-            # `CO("name")` inside a macro declares a future output bound
-            # to `name`. Register those so later references resolve.
-            try:
-                end = ci.end_line if ci.end_line is not None else ci.zone_end
-                start_idx = max(0, ci.start_line - 1)
-                end_idx = min(len(doc.lines), end)
-                body = "\n".join(doc.lines[start_idx:end_idx])
-                for m in re.finditer(r"\bCO\s*\(\s*['\"]([A-Za-z_]\w*)['\"]", body):
-                    name = m.group(1)
-                    if name not in var_index:
-                        var_index[name] = (ci.start_line, ci.name)
-            except Exception:
-                pass
-
+        # Forget the results of the commands the registry re-parsed, and of
+        # those referencing a name whose definition moved. Done first, so a
+        # cancelled run leaves a cache the next run can still trust.
+        changed_ids, changed_names = registry.take_changes()
+        key = registry.source or registry
+        state = self._documents.get(key)
+        if state is None or changed_ids is None or state.cata is not cata:
+            state = self._documents[key] = _DocumentDiagnostics(cata)
+        else:
+            for name in changed_names:
+                for cmd_id in list(state.consumers.get(name, ())):
+                    state.drop(cmd_id)
+            for cmd_id in changed_ids:
+                state.drop(cmd_id)
+
+        hits, misses = registry.kwarg_cache_hits, registry.kwarg_cache_misses
+        validated = 0
         for ci in registry.commands.values():
-            try:
-                diags.extend(self._validate_command(doc.lines, registry, ci, cata, var_index))
-            except Exception as exc:
-                _log(f"[diagnostics] cmd={ci.name} crashed: {exc!r}")
-        _log(f"[diagnostics] {doc_uri}: {len(diags)} issue(s)")
+            entry = state.entries.get(ci.cmd_id)
+            if entry is None:
+                if is_cancelled is not None and is_cancelled():
+                    if debug_enabled():
+                        _log(f"[diagnostics] {doc_uri}: cancelled after {validated} command(s)")
+                    return None
+                refs: set[str] = set()
+                try:
+                    cmd_diags = self._validate_command(lines, registry, ci, cata, refs)
+                except Exception as exc:
+                    _log(f"[diagnostics] cmd={ci.name} crashed: {exc!r}")
+                    cmd_diags = []
+                entry = _CommandDiagnostics(ci.start_line, cmd_diags, refs)
+                state.store(ci.cmd_id, entry)
+                validated += 1
+            elif entry.line != ci.start_line:
+                # Moved by an edit above it
+                delta = ci.start_line - entry.line
+                entry.diags = [_shift_diagnostic(d, delta) for d in entry.diags]
+                entry.line = ci.start_line
+            diags.extend(entry.diags)
+        if debug_enabled():
+            _log(
+                f"[diagnostics] {doc_uri}: {len(diags)} issue(s); validated {validated} of "
+                f"{len(registry.commands)} command(s); keyword positions reused for "
+                f"{registry.kwarg_cache_hits - hits} command(s), re-scanned for "
+                f"{registry.kwarg_cache_misses - misses}"
+            )
         return diags
 
     # -------------------------------------------------------- per command
@@ -128,7 +215,7 @@ class DiagnosticsManager:
         registry,
         ci,
         cata,
-        var_index: dict[str, tuple[int, str]],
+        refs: set[str],
     ) -> list[Diagnostic]:
         diags: list[Diagnostic] = []
 
@@ -146,9 +233,15 @@ class DiagnosticsManager:
         if ci.name in self._deprecated:
             diags.append(self._diag_deprecated(lines, ci))
 
+        try:
+            index = cata.keyword_index(cmd_obj)
+        except Exception as exc:
+            _log(f"[diagnostics] keyword index of {ci.name} failed: {exc!r}")
+            return diags
+
         # Position-aware kwarg parse.
         try:
-            pairs = registry.parse_keyword_positions(lines, ci)
+            pairs = registry.parse_keyword_positions(ci)
         except Exception:
             pairs = []
 
@@ -165,13 +258,13 @@ class DiagnosticsManager:
         for pair in pairs:
             try:
                 typed_names.add(pair.name)
-                self._check_pair(pair, cmd_obj, context, var_index, ci, diags)
+                self._check_pair(pair, index, cata, context, registry, ci, diags, refs)
             except Exception as exc:
                 _log(f"[diagnostics] pair {pair.name} in {ci.name} crashed: {exc!r}")
 
         # -- 4. required keywords missing in active scope ----------------
         try:
-            for required in required_keywords(cmd_obj.definition, context):
+            for required in required_keywords(index, context):
                 if required not in typed_names:
                     diags.append(self._diag_required_missing(lines, ci, required))
         except Exception:
@@ -194,11 +287,11 @@ class DiagnosticsManager:
 
     # -------------------------------------------------------- per pair
 
-    def _check_pair(self, pair, cmd_obj, context, var_index, ci, diags) -> None:
+    def _check_pair(self, pair, index, cata, context, registry, ci, diags, refs) -> None:
         # -- 2. unknown keyword -----------------------------------------
-        kwd = find_keyword(cmd_obj.definition, pair.name, context)
+        kwd = find_keyword(index, pair.name, context)
         if kwd is None:
-            visible_names = [n for n, _ in visible_keywords(cmd_obj.definition, context)]
+            visible_names = [n for n, _ in visible_keywords(index, context)]
             diags.append(self._diag_unknown_kwarg(pair, visible_names))
             return  # rest of the pair's checks don't apply
 
@@ -220,10 +313,13 @@ class DiagnosticsManager:
         # -- 6/7. variable reference checks -----------------------------
         if is_bare_identifier(pair.value):
             ref_name = pair.value.strip().rstrip(",").strip()
-            if ref_name not in var_index:
+            refs.add(ref_name)
+            # The earliest assignment or `CO("name")` declaration wins
+            definition = registry.first_definition(ref_name)
+            if definition is None:
                 diags.append(self._diag_undefined_var(pair, ref_name))
                 return
-            assigned_line, src_cmd = var_index[ref_name]
+            assigned_line, src_cmd = definition.start_line, definition.name
             if assigned_line >= ci.start_line:
                 diags.append(self._diag_undefined_var(pair, ref_name, used_before_def=True))
                 return
@@ -231,17 +327,10 @@ class DiagnosticsManager:
             try:
                 expected = expected_classes(kwd)
                 if expected:
-                    src_obj = None
-                    try:
-                        src_obj = self.core.get_CATA().get_command_obj(src_cmd)
-                    except Exception:
-                        src_obj = None
-                    if src_obj is not None:
-                        var_types = command_return_types(src_obj)
-                        if var_types and not types_compatible(var_types, expected):
-                            diags.append(
-                                self._diag_type_mismatch(pair, ref_name, var_types, expected)
-                            )
+                    result_types = cata.result_types
+                    var_types = result_types.of(src_cmd)
+                    if var_types and not result_types.compatible(var_types, expected):
+                        diags.append(self._diag_type_mismatch(pair, ref_name, var_types, expected))
             except Exception:
                 pass
 
@@ -253,19 +342,21 @@ class DiagnosticsManager:
             return lines[idx]
         return ""
 
-    def _diag_unknown_command(self, lines, ci, cata) -> Diagnostic:
-        # Locate the command name on its start line.
+    def _name_range(self, lines, ci) -> Range:
+        """Range of the command name on its start line, or of the whole
+        line if it isn't there."""
         idx = max(0, ci.start_line - 1)
         line = self._line_text(lines, idx)
-        m = re.search(rf"\b{re.escape(ci.name)}\b", line)
-        if m:
-            rng = Range(Position(idx, m.start()), Position(idx, m.end()))
-        else:
-            rng = Range(Position(idx, 0), Position(idx, max(0, len(line))))
+        col = _find_word(line, ci.name)
+        if col < 0:
+            return Range(Position(idx, 0), Position(idx, max(0, len(line))))
+        return Range(Position(idx, col), Position(idx, col + len(ci.name)))
+
+    def _diag_unknown_command(self, lines, ci, cata) -> Diagnostic:
+        rng = self._name_range(lines, ci)
         candidates = []
         try:
-            all_cmds = [c["name"] for c in cata.get_commands()]
-            candidates = nearest(ci.name, all_cmds, n=3)
+            candidates = self.core.get_command_index(cata).nearest(ci.name, n=3)
         except Exception:
             candidates = []
         msg = f"Unknown code_aster command `{ci.name}`."
@@ -312,15 +403,8 @@ class DiagnosticsManager:
         )
 
     def _diag_required_missing(self, lines, ci, required: str) -> Diagnostic:
-        idx = max(0, ci.start_line - 1)
-        line = self._line_text(lines, idx)
-        m = re.search(rf"\b{re.escape(ci.name)}\b", line)
-        if m:
-            rng = Range(Position(idx, m.start()), Position(idx, m.end()))
-        else:
-            rng = Range(Position(idx, 0), Position(idx, max(0, len(line))))
         return Diagnostic(
-            range=rng,
+            range=self._name_range(lines, ci),
             severity=DiagnosticSeverity.Error,
             code=CODE_REQUIRED_MISSING,
             source="code_aster",
@@ -360,17 +444,8 @@ class DiagnosticsManager:
         rest = ", ".join(f"`{a}`" for a in args[1:]) if len(args) > 1 else ""
         joined = ", ".join(f"`{a}`" for a in args) if args else ""
         msg = template.format(args=joined, first=first, rest=rest)
-
-        idx = max(0, ci.start_line - 1)
-        line = self._line_text(lines, idx)
-        m = re.search(rf"\b{re.escape(ci.name)}\b", line)
-        rng = (
-            Range(Position(idx, m.start()), Position(idx, m.end()))
-            if m
-            else Range(Position(idx, 0), Position(idx, max(0, len(line))))
-        )
         return Diagnostic(
-            range=rng,
+            range=self._name_range(lines, ci),
             severity=DiagnosticSeverity.Error,
             code=CODE_RULE_VIOLATION,
             source="code_aster",
@@ -412,16 +487,8 @@ class DiagnosticsManager:
         )
 
     def _diag_deprecated(self, lines, ci) -> Diagnostic:
-        idx = max(0, ci.start_line - 1)
-        line = self._line_text(lines, idx)
-        m = re.search(rf"\b{re.escape(ci.name)}\b", line)
-        rng = (
-            Range(Position(idx, m.start()), Position(idx, m.end()))
-            if m
-            else Range(Position(idx, 0), Position(idx, max(0, len(line))))
-        )
         return Diagnostic(
-            range=rng,
+            range=self._name_range(lines, ci),
             severity=DiagnosticSeverity.Information,
             code=CODE_DEPRECATED,
             source="code_aster",
@@ -430,6 +497,17 @@ class DiagnosticsManager:
         )
 
 
+def _shift_diagnostic(diag: Diagnostic, delta: int) -> Diagnostic:
+    """Copy of `diag` moved down by `delta` lines."""
+    start, end = diag.range.start, diag.range.end
+    moved = copy.copy(diag)
+    moved.range = Range(
+        Position(start.line + delta, start.character),
+        Position(end.line + delta, end.character),
+    )
+    return moved
+
+
 def is_factor_value(raw: str) -> bool:
     """Heuristic: a value beginning with `_F(` is a factor block, not a
     SIMP scalar — `into` validation doesn't apply to it."""
@@ -437,41 +515,21 @@ def is_factor_value(raw: str) -> bool:
     return s.startswith("_F(") or s.startswith("(_F(") or s.startswith("(") and "_F(" in s
 
 
-# ---- fuzzy match (simple Levenshtein, top-N) -------------------------------
-
-
-def nearest(target: str, candidates, n: int = 3) -> list[str]:
-    target = (target or "").upper()
-    scored = []
-    for c in candidates:
-        if not isinstance(c, str):
-            continue
-        d = _levenshtein(target, c.upper())
-        scored.append((d, c))
-    scored.sort()
-    # Only suggest if at least somewhat close; cap edit distance to half-length.
-    cutoff = max(2, len(target) // 2)
-    out = [c for d, c in scored if d <= cutoff][:n]
-    return out
-
-
-def _levenshtein(a: str, b: str) -> int:
-    if a == b:
-        return 0
-    if not a:
-        return len(b)
-    if not b:
-        return len(a)
-    prev = list(range(len(b) + 1))
-    for i, ca in enumerate(a, 1):
-        cur = [i]
-        for j, cb in enumerate(b, 1):
-            cur.append(
-                min(
-                    cur[j - 1] + 1,
-                    prev[j] + 1,
-                    prev[j - 1] + (0 if ca == cb else 1),
-                )
-            )
-        prev = cur
-    return prev[-1]
+def _find_word(text: str, word: str) -> int:
+    """Column of the first occurrence of `word` in `text` that isn't glued
+    to other word characters, or -1."""
+    if not word:
+        return -1
+    start = text.find(word)
+    while start >= 0:
+        end = start + len(word)
+        before = text[start - 1] if start else ""
+        after = text[end] if end < len(text) else ""
+        if not _is_word_char(before) and not _is_word_char(after):
+            return start
+        start = text.find(word, start + 1)
+    return -1
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
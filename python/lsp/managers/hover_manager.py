@@ -17,6 +17,7 @@ import re
 
 from command_core import CommandCore
 from lsprotocol.types import Hover, MarkupContent, MarkupKind
+from validators import find_keyword
 
 try:
     from asterstudy.datamodel.dict_categories import DEPRECATED as _DEPRECATED_LIST
@@ -168,7 +169,7 @@ class HoverManager:
         registry = self.core.get_registry(doc_uri)
         cmd_info = registry.get_command_at_line(position.line + 1) if registry else None
         context = cmd_info.parsed_params if cmd_info else None
-        cata = self.core.get_CATA()
+        cata = self.core.get_CATA(doc_uri)
 
         # (3) `_F` factor marker — standalone card; cheap check first.
         if word == "_F":
@@ -181,18 +182,19 @@ class HoverManager:
         if cmd_info:
             cmd_obj = cata.get_command_obj(cmd_info.name)
             if cmd_obj is not None:
+                index = cata.keyword_index(cmd_obj)
                 # (2) Allowed-value literal: cursor is on a word inside a
                 # `KEY=<value>` assignment within this command call. Only fire
                 # when the word is actually listed in the keyword's `into`.
                 kw_name = _enclosing_keyword_name(line_text, position.character)
                 if kw_name:
-                    target = _find_keyword(cmd_obj.definition, kw_name, context)
+                    target = find_keyword(index, kw_name, context)
                     if target is not None:
                         into = target.definition.get("into") or ()
                         if _matches_into_value(word, into):
-                            return _hover(_render_allowed_value(word, kw_name, cmd_obj))
+                            return _hover(_render_allowed_value(word, kw_name, cmd_obj, index))
 
-                kwd = _find_keyword(cmd_obj.definition, word, context)
+                kwd = find_keyword(index, word, context)
                 if kwd is not None:
                     return _hover(_render_keyword(word, kwd, cmd_obj))
 
@@ -205,13 +207,13 @@ class HoverManager:
         # command name hover (e.g. `LIRE_MAILLAGE`) still wins if somehow
         # reused as a variable.
         if registry is not None:
-            assignment = _nearest_assignment(registry, word, position.line + 1)
+            assignment = registry.nearest_assignment(word, position.line + 1)
             if assignment is not None:
                 return _hover(_render_variable_reference(word, assignment, cata))
 
             # `CO("name")` inside a macro body declares `name` as a future
             # output. Treat it like a regular assignment for hover purposes.
-            co_info = _nearest_co_declaration(registry, doc.lines, word, position.line + 1)
+            co_info = registry.nearest_co_declaration(word, position.line + 1)
             if co_info is not None:
                 return _hover(_render_variable_reference(word, co_info, cata, via_co=True))
 
@@ -239,43 +241,6 @@ def _escape_italic(text: str) -> str:
 # ---------- variable-reference helper -------------------------------------
 
 
-def _nearest_co_declaration(registry, doc_lines, var_name: str, cursor_line: int):
-    """Find the nearest preceding command whose body contains a
-    `CO("var_name")` declaration. Returns the CommandInfo of the macro
-    that will produce `var_name` as one of its outputs."""
-    try:
-        pattern = re.compile(r"\bCO\s*\(\s*['\"]" + re.escape(var_name) + r"['\"]")
-    except re.error:
-        return None
-    best = None
-    for info in registry.commands.values():
-        if info.start_line > cursor_line:
-            continue
-        end = info.end_line if info.end_line is not None else info.zone_end
-        start_idx = max(0, info.start_line - 1)
-        end_idx = min(len(doc_lines), end)
-        body = "\n".join(doc_lines[start_idx:end_idx])
-        if pattern.search(body):
-            if best is None or info.start_line > best.start_line:
-                best = info
-    return best
-
-
-def _nearest_assignment(registry, var_name: str, cursor_line: int):
-    """Walk all tracked commands; return the CommandInfo whose `var_name`
-    matches and whose assignment line is on or before the cursor. Prefers
-    the most recent prior assignment."""
-    best = None
-    for info in registry.commands.values():
-        if getattr(info, "var_name", None) != var_name:
-            continue
-        if info.start_line > cursor_line:
-            continue
-        if best is None or info.start_line > best.start_line:
-            best = info
-    return best
-
-
 def _render_variable_reference(name: str, info, cata, via_co: bool = False) -> str:
     cmd_obj = cata.get_command_obj(info.name) if info.name else None
     type_str = _return_type_hint(cmd_obj) if cmd_obj else None
@@ -395,7 +360,7 @@ def _matches_into_value(word: str, into) -> bool:
     return False
 
 
-def _render_allowed_value(value: str, kw_name: str, cmd_obj) -> str:
+def _render_allowed_value(value: str, kw_name: str, cmd_obj, index) -> str:
     translation = _translation_of(cmd_obj)
     parent_name = cmd_obj.name
 
@@ -409,7 +374,7 @@ def _render_allowed_value(value: str, kw_name: str, cmd_obj) -> str:
     out.append("*" + _escape_italic(_t("allowed_value", parent=parent_name, kw=kw_name)) + "*")
 
     # If the keyword has a docstring / label, include it for extra context.
-    kwd = _find_keyword(cmd_obj.definition, kw_name, context=None)
+    kwd = find_keyword(index, kw_name, context=None)
     if kwd is not None:
         doc = _udocstring(kwd, key=kw_name, translation=translation)
         if doc:
@@ -477,32 +442,6 @@ def _format_value(v) -> str:
     return repr(v)
 
 
-def _find_keyword(definition, name: str, context):
-    """Depth-first search through FACTs and BLOCs. BLOCs disabled by context
-    are skipped so context-inactive keywords are not matched."""
-    for key, kwd in definition.items():
-        if not hasattr(kwd, "definition"):
-            continue
-        if _is_bloc(kwd):
-            if context is not None:
-                try:
-                    if not kwd.isEnabled(context):
-                        continue
-                except Exception:
-                    pass
-            found = _find_keyword(kwd.definition, name, context)
-            if found is not None:
-                return found
-            continue
-        if key == name:
-            return kwd
-        if _is_factor(kwd):
-            found = _find_keyword(kwd.definition, name, context)
-            if found is not None:
-                return found
-    return None
-
-
 def _render_command(cmd_obj, context) -> str:
     name = cmd_obj.name
     return_type = _return_type_hint(cmd_obj)
@@ -31,7 +31,7 @@ class SignatureManager:
         match = re.search(r"(\w+)\s*\($", line_text)
         if match:
             cmd_name = match.group(1)
-            cmd_def = self.core.get_command_def(cmd_name)
+            cmd_def = self.core.get_command_def(cmd_name, doc_uri)
             if cmd_def:
                 signature = SignatureInformation(label=self.params_label(cmd_def["params"], {}))
                 return SignatureHelp(signatures=[signature], active_signature=0, active_parameter=0)
@@ -51,7 +51,7 @@ class SignatureManager:
                     return default_signature
 
             cmd_name = cmd_info.name
-            cmd_def = self.core.get_command_def(cmd_name)
+            cmd_def = self.core.get_command_def(cmd_name, doc_uri)
             if cmd_def:
                 signature = SignatureInformation(
                     label=self.params_label(cmd_def["params"], cmd_info.parsed_params)
@@ -23,7 +23,7 @@ class StatusBarManager:
     }
 
     def __init__(self):
-        self.cata = CommandCore().get_CATA()
+        self.core = CommandCore()
         self.family_map = self.FAMILY_MAP
 
     # ----------------------------------------------------------- per file
@@ -38,10 +38,11 @@ class StatusBarManager:
             return {v: [] for v in self.family_map.values()}
 
     def _analyze(self, uri: str) -> dict[str, list[str]]:
-        registry = CommandCore().get_registry(uri)
+        registry = self.core.get_registry(uri)
         result: dict[str, list[str]] = {v: [] for v in self.family_map.values()}
         if registry is None:
             return result
+        cata = self.core.get_CATA(uri)
         seen: set[str] = set()
         for cmd in registry.commands.values():
             try:
@@ -49,7 +50,7 @@ class StatusBarManager:
                 if name in seen:
                     continue
                 seen.add(name)
-                family_display = self.cata.get_command_category(name)
+                family_display = cata.get_command_category(name)
                 family_key = self.family_map.get(family_display)
                 if family_key:
                     result[family_key].append(name)
@@ -63,9 +64,10 @@ class StatusBarManager:
         """Return the complete list of catalog commands grouped by family.
         Used as the dictionary backing the sidebar's Command browser."""
         result: dict[str, list[str]] = {v: [] for v in self.family_map.values()}
+        cata = self.core.get_CATA()
         for display_name, key in self.family_map.items():
             try:
-                items = self.cata.get_category(display_name)
+                items = cata.get_category(display_name)
                 result[key] = list(items or [])
             except Exception:
                 result[key] = []
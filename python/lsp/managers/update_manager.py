@@ -2,6 +2,7 @@ import sys
 
 from command_core import CommandCore
 from command_registry import CommandRegistry
+from instrumentation import debug_enabled
 
 
 def _log(msg: str) -> None:
@@ -26,14 +27,19 @@ class UpdateManager:
         registry.initialize(ls, doc.lines)
         self.core.set_registry(doc_uri, registry)
 
-        commands = registry.get_all_commands()
-        _log(f"[registry] init {doc_uri}: {len(commands)} commands; ranges={registry.ranges}")
-        for key, value in commands.items():
-            _log(f"[registry]   - {key} → {value}")
+        _log(f"[registry] init {doc_uri}: {len(registry.commands)} commands")
+        if debug_enabled():
+            _log(f"[registry] ranges={registry.ranges}")
+            for key, value in registry.get_all_commands().items():
+                _log(f"[registry]   - {key} → {value}")
 
     def update_registry(self, doc, doc_uri, changes):
         """
         Incrementally update the registry on document changes.
+
+        The server uses incremental sync, so each change carries a `range`
+        and the replacement `text`; the registry applies these deltas to its
+        own copy of the lines, in order.
         """
         ls = self.core.get_ls()
         registry = self.core.get_registry(doc_uri)
@@ -41,25 +47,14 @@ class UpdateManager:
             registry = CommandRegistry()
             registry.initialize(ls, doc.lines)
             self.core.set_registry(doc_uri, registry)
+            return
 
         for change in changes:
-            if hasattr(change, "range") and change.range:
-                start_line = change.range.start.line + 1
-                end_line = change.range.end.line + 1
-                text = change.text
-
-                # Handle multi-line deletions or additions
-                if end_line - start_line > 0 or text.count("\n") > 0 or text == "(":
-                    registry.initialize(ls, doc.lines)
-                    _log(
-                        f"[registry] full reparse on multi-line change: "
-                        f"{len(registry.get_all_commands())} commands"
-                    )
-                    continue
-
-                # Update the affected command (single line change)
-                registry.on_document_change(doc.lines, start_line, text)
-
+            if getattr(change, "range", None):
+                start, end = change.range.start, change.range.end
+                registry.apply_text_change(
+                    start.line, start.character, end.line, end.character, change.text
+                )
             else:
                 registry.initialize(ls, doc.lines)
                 _log(
@@ -10,7 +10,6 @@ any exception.
 
 from __future__ import annotations
 
-import inspect
 import re
 import sys
 
@@ -23,61 +22,31 @@ def _is_bloc(kwd) -> bool:
     return "Bloc" in type(kwd).__name__
 
 
-def find_keyword(definition, name: str, context):
-    """Walk the keyword tree (descending into BLOCs and FACTs) and return
-    the first keyword whose key matches `name`. BLOC branches that are
-    disabled by `context` are skipped so a keyword only reachable via an
-    inactive branch is not returned when a context is known."""
+def find_keyword(index, name: str, context):
+    """First keyword of the command's `KeywordIndex` named `name`, factor
+    keywords included. Keywords only reachable through a BLOC disabled by
+    `context` are not returned when a context is known."""
     try:
-        for key, kwd in definition.items():
-            if not hasattr(kwd, "definition"):
-                continue
-            if _is_bloc(kwd):
-                if context is not None:
-                    try:
-                        if not kwd.isEnabled(context):
-                            continue
-                    except Exception:
-                        pass
-                found = find_keyword(kwd.definition, name, context)
-                if found is not None:
-                    return found
-                continue
-            if key == name:
-                return kwd
-            if _is_factor(kwd):
-                found = find_keyword(kwd.definition, name, context)
-                if found is not None:
-                    return found
+        entry = index.find(name, context)
     except Exception:
         return None
-    return None
+    return entry.keyword if entry is not None else None
 
 
-def visible_keywords(definition, context):
-    """Yield (name, kwd) pairs for keywords visible at this scope, with
-    BLOC filtering when `context` is known."""
+def visible_keywords(index, context):
+    """Yield (name, kwd) pairs for keywords visible at the scope of `index`,
+    with BLOC filtering when `context` is known."""
     try:
-        for key, kwd in definition.items():
-            if not hasattr(kwd, "definition"):
-                continue
-            if _is_bloc(kwd):
-                if context is not None:
-                    try:
-                        if not kwd.isEnabled(context):
-                            continue
-                    except Exception:
-                        pass
-                yield from visible_keywords(kwd.definition, context)
-                continue
-            yield (key, kwd)
+        entries = index.visible(context)
     except Exception:
         return
+    for entry in entries:
+        yield (entry.name, entry.keyword)
 
 
-def required_keywords(definition, context):
-    """Yield names of required keywords visible at this scope."""
-    for name, kwd in visible_keywords(definition, context):
+def required_keywords(index, context):
+    """Yield names of required keywords visible at the scope of `index`."""
+    for name, kwd in visible_keywords(index, context):
         try:
             if kwd.definition.get("statut") == "o":
                 yield name
@@ -126,41 +95,6 @@ def find_param(params: list[dict], name: str) -> dict | None:
 # ------------------------------------------------------- type compatibility
 
 
-def command_return_types(cmd_obj) -> tuple:
-    """Resolve `sd_prod` to a tuple of concrete output classes.
-
-    `sd_prod` may be (a) a class, (b) a callable that returns a class
-    or tuple of classes when called with `__all__=True` (the asterstudy
-    convention), or (c) None.  Returns () on any failure.
-    """
-    try:
-        sd = cmd_obj.definition.get("sd_prod") if hasattr(cmd_obj, "definition") else None
-    except Exception:
-        return ()
-    if sd is None:
-        return ()
-    if isinstance(sd, type):
-        return (sd,)
-    if not callable(sd):
-        return ()
-    try:
-        sig = inspect.signature(sd)
-        positional = [
-            p
-            for p in sig.parameters.values()
-            if p.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
-            and p.default is inspect.Parameter.empty
-        ]
-        result = sd(*([None] * len(positional)), __all__=True)
-    except Exception:
-        return ()
-    if isinstance(result, type):
-        return (result,)
-    if isinstance(result, (tuple, list)):
-        return tuple(t for t in result if isinstance(t, type))
-    return ()
-
-
 def expected_classes(source) -> tuple:
     """Pull the raw class(es) the SIMP keyword expects. Accepts either a
     parsed-param dict (with `type_obj`) or a CATA kwd object (with
@@ -182,19 +116,6 @@ def expected_classes(source) -> tuple:
     return ()
 
 
-def types_compatible(var_types, expected) -> bool:
-    if not var_types or not expected:
-        return False
-    for vt in var_types:
-        for et in expected:
-            try:
-                if issubclass(vt, et):
-                    return True
-            except TypeError:
-                continue
-    return False
-
-
 # ------------------------------------------------------- value matching
 
 
@@ -1,13 +1,34 @@
 # Convert a mesh stored in a .med file into a unique .obj file with multiple groups.
 # Each group in the .med file is converted into a group in the .obj file.
 # Supports both 3D meshes and 2D meshes (which are automatically converted to 3D).
-# usage: python med2obj.py -i input.med -o .cache_dir/output.obj
+# With `--format binary`, the same content is written as typed arrays (see
+# `write_binary`), which the viewer loads without parsing text.
+# With `--serve`, it stays up and converts the meshes requested on stdin, so
+# medcoupling is imported once for all of them (see `serve`).
+# With `--lod`, the binary output also holds decimated copies of the faces, for
+# the viewer to show huge meshes quickly (see `decimate_faces`).
+# Outputs are cached by content, so an unchanged mesh, even copied elsewhere,
+# is not converted again (see `ConversionCache`).
+# With `--progress`, progress events are printed as JSON lines (see `convert`),
+# and with `--preview`, the skin is written first to its own binary file, for
+# the viewer to show it while the groups are extracted.
+# usage: python med2obj.py -i input.med -o .cache_dir/output.obj [--format binary]
+#        python med2obj.py -i input.med -o output.m2b --format binary --lod 128,512
+#        python med2obj.py -i input.med -o output.m2b --format binary --preview skin.m2b --progress
+#        python med2obj.py --serve [--workers N]
 
 
 import argparse
+import concurrent.futures as cf
+import contextlib
+import hashlib
+import json
 import os
+import os.path as osp
 import pathlib as pl
+import shutil
 import sys
+import time
 
 python_version = sys.version_info
 
@@ -47,19 +68,75 @@ if sys.platform == "win32" and python_version >= (3, 8):
                     sys.path.append(path)
 
 import medcoupling as mc  # noqa E402
+import numpy as np  # noqa E402
 
-# Bump when the .obj output format changes in a breaking way. The extension
-# reads the `# med2obj-version:` header and regenerates on mismatch.
-MED2OBJ_VERSION = 2
+# Bump when the .obj or binary output format changes in a breaking way. The
+# extension reads the `# med2obj-version:` header (or the `version` of the
+# binary header) and regenerates on mismatch.
+MED2OBJ_VERSION = 4
+
+# First bytes of a binary output
+BINARY_MAGIC = b"M2OB"
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Convert a .med mesh file to a .obj file with groups."
     )
-    parser.add_argument("-i", "--input", type=str, required=True, help="Input .med file path.")
-    parser.add_argument("-o", "--output", type=str, required=True, help="Output .obj file path.")
-    return parser.parse_args()
+    parser.add_argument("-i", "--input", type=str, help="Input .med file path.")
+    parser.add_argument("-o", "--output", type=str, help="Output .obj file path.")
+    parser.add_argument(
+        "--format",
+        choices=["obj", "binary"],
+        default="obj",
+        help="Text .obj (default) or binary typed arrays.",
+    )
+    parser.add_argument(
+        "--lod",
+        type=lambda text: [int(res) for res in text.split(",") if res],
+        default=[],
+        help="Grid resolutions of decimated levels of the faces, e.g. 128,512 (binary only).",
+    )
+    parser.add_argument(
+        "--preview", help="Binary file to write the skin to, before the groups are extracted."
+    )
+    parser.add_argument(
+        "--progress", action="store_true", help="Print progress events (JSON lines) on stdout."
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="Convert the requests read on stdin (JSON lines)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Parallel conversions with --serve.",
+    )
+    parser.add_argument(
+        "--group-workers",
+        type=int,
+        help="Processes extracting the groups of a mesh (default: the number of CPUs, "
+        "divided by --workers with --serve).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("VS_CODE_ASTER_MESH_CACHE_DIR")
+        or str(pl.Path.home() / ".cache" / "vs-code-aster" / "meshes"),
+        help="Directory of the conversion cache.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=int(os.environ.get("VS_CODE_ASTER_MESH_CACHE_SIZE", "1024")),
+        help="Size limit of the conversion cache, in MiB.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the conversion cache.")
+    args = parser.parse_args()
+    if not args.serve and (args.input is None or args.output is None):
+        parser.error("the following arguments are required: -i/--input, -o/--output")
+    if args.lod and args.format != "binary":
+        parser.error("--lod requires --format binary")
+    return args
 
 
 END_CONNECTIVITY = {
@@ -73,73 +150,645 @@ END_CONNECTIVITY = {
 }
 
 
-def write_obj(
-    med_file,
-    skin_mesh,
-    skin_groups,
-    node_groups,
-    volume_groups,
-    edge_groups,
-    output_path,
-    skin_level=-1,
-    node_level=1,
-    edge_level=-2,
-):
-    with open(output_path, "w") as f:
+# Rows formatted per `%` operation; bounds the size of the strings built
+WRITE_CHUNK = 65536
+
+# Progress events reported per stage, at most (plus the first and the last)
+PROGRESS_STEPS = 100
+
+
+def progress_counter(progress, stage, total):
+    """Report the progress of `stage` through `progress(stage, done, total)`,
+    at most `PROGRESS_STEPS` times. Return the function advancing `done` by
+    its argument."""
+    if progress is None:
+        return lambda count=1: None
+    step = max(1, total // PROGRESS_STEPS)
+    state = {"done": 0, "next": step}
+
+    def advance(count=1):
+        state["done"] += count
+        if state["done"] >= state["next"] or state["done"] >= total:
+            state["next"] = state["done"] + step
+            progress(stage, state["done"], total)
+
+    progress(stage, 0, total)
+    return advance
+
+
+def content_size(kind, content):
+    """Number of cells, or nodes, of a group content (see `extract_group`)."""
+    if kind == "node":
+        return len(content)
+    return sum(len(rows) for rows in content)
+
+
+def _write_rows(f, template, rows):
+    """Write one `template` line per row of a 2D array, formatting many rows
+    with a single `%` operation."""
+    for start in range(0, len(rows), WRITE_CHUNK):
+        chunk = rows[start : start + WRITE_CHUNK]
+        f.write((template * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def write_vertices(f, coords):
+    """Write the nodes as `v` lines (2D coordinates get z=0)."""
+    if coords.shape[1] == 2:
+        _write_rows(f, "v %r %r 0.0\n", coords)
+    else:
+        _write_rows(f, "v %r %r %r\n", coords[:, :3])
+
+
+def corner_runs(mesh):
+    """Yield the cells of an unstructured mesh as 2D arrays of 0-based node
+    ids, one array per run of consecutive cells with the same number of
+    nodes. Quadratic cells keep their corner nodes only.
+
+    The connectivity is read in bulk: `conn` holds, for each cell, its type
+    then its nodes, starting at `index[cell]`.
+    """
+    if mesh.getNumberOfCells() == 0:
+        return
+    conn = mesh.getNodalConnectivity().toNumPyArray()
+    index = mesh.getNodalConnectivityIndex().toNumPyArray()
+    sizes = np.diff(index) - 1
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(sizes)) + 1, [len(sizes)]))
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        kept = END_CONNECTIVITY[int(sizes[start])]
+        yield conn[index[start:end, None] + 1 + np.arange(kept)]
+
+
+def write_cells(f, runs, keyword="f"):
+    """Write cells given as `corner_runs`, one `keyword` line each, OBJ
+    1-indexed."""
+    for rows in runs:
+        template = keyword + " %d" * rows.shape[1] + "\n"
+        _write_rows(f, template, rows + 1)
+
+
+# .obj keyword introducing each kind of group
+GROUP_KEYWORDS = {"volume": "vg", "face": "g", "edge": "eg", "node": "ng"}
+
+
+def write_obj(skin_mesh, groups, output_path, progress=None):
+    """Write the skin mesh, then the `groups` (as returned by
+    `extract_groups`), as a text .obj. The cells (or nodes) written are
+    reported through `progress` (see `progress_counter`)."""
+    skin = list(corner_runs(skin_mesh))
+    total = content_size("skin", skin) + sum(content_size(*group[::2]) for group in groups)
+    advance = progress_counter(progress, "writing", total)
+    with open(output_path, "w", buffering=1 << 20) as f:
         f.write(f"# med2obj-version: {MED2OBJ_VERSION}\n")
-        coords = skin_mesh.getCoords().toNumPyArray()
-        for coord in coords:
-            # Ensure 2D coordinates are converted to 3D by adding z=0 if missing
-            if len(coord) == 2:
-                f.write(f"v {coord[0]} {coord[1]} 0.0\n")
+        write_vertices(f, skin_mesh.getCoords().toNumPyArray())
+        write_cells(f, skin)
+        advance(content_size("skin", skin))
+
+        for kind, name, content in groups:
+            f.write(f"{GROUP_KEYWORDS[kind]} {name}\n")
+            if kind == "node":
+                _write_rows(f, "p %d\n", content.reshape(-1, 1) + 1)  # OBJ is 1-indexed
             else:
-                f.write(f"v {coord[0]} {coord[1]} {coord[2]}\n")
-
-        for elem in skin_mesh:
-            conn = elem.getAllConn()  # OBJ is 1-indexed
-            end_connectivity = END_CONNECTIVITY[len(conn) - 1] + 1
-            f.write(f"f {' '.join([str(x + 1) for x in conn[1:end_connectivity]])}\n")
-
-        for group_name in volume_groups:
-            vol_submesh = med_file.getGroup(0, group_name)
-            vol_skin = vol_submesh.computeSkin()
-            f.write(f"vg {group_name}\n")
-            for elem in vol_skin:
-                conn = elem.getAllConn()
-                end_connectivity = END_CONNECTIVITY[len(conn) - 1] + 1
-                f.write(f"f {' '.join([str(x + 1) for x in conn[1:end_connectivity]])}\n")
-
-        for group_name in skin_groups:
-            submesh = med_file.getGroup(skin_level, group_name)
-            f.write(f"g {group_name}\n")
-            for elem in submesh:
-                conn = elem.getAllConn()
-                end_connectivity = END_CONNECTIVITY[len(conn) - 1] + 1
-                f.write(f"f {' '.join([str(x + 1) for x in conn[1:end_connectivity]])}\n")
-
-        for group_name in edge_groups:
-            edge_submesh = med_file.getGroup(edge_level, group_name)
-            f.write(f"eg {group_name}\n")
-            for elem in edge_submesh:
-                conn = elem.getAllConn()
-                end_connectivity = END_CONNECTIVITY[len(conn) - 1] + 1
-                f.write(f"l {' '.join([str(x + 1) for x in conn[1:end_connectivity]])}\n")
-
-        for group_name in node_groups:
-            node_ids = med_file.getGroupArr(node_level, group_name).toNumPyArray()
-            f.write(f"ng {group_name}\n")
-            for node_id in node_ids:
-                f.write(f"p {node_id + 1}\n")  # OBJ is 1-indexed
+                write_cells(f, content, keyword="l" if kind == "edge" else "f")
+            advance(content_size(kind, content))
 
 
-def main():
-    args = parse_args()
-    input_path = pl.Path(args.input)
-    output_path = pl.Path(args.output)
+class _Cells:
+    """Cells gathered for the binary output: flat node ids, and the offset of
+    each cell in them."""
+
+    def __init__(self):
+        self.ids = []
+        self.sizes = []
+        self.count = 0
+
+    def add(self, runs):
+        for rows in runs:
+            self.ids.append(rows.ravel())
+            self.sizes.append(np.full(len(rows), rows.shape[1]))
+            self.count += len(rows)
+
+    def arrays(self):
+        ids = np.concatenate(self.ids) if self.ids else np.zeros(0)
+        sizes = np.concatenate(self.sizes) if self.sizes else np.zeros(0)
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        return ids.astype("<u4"), offsets.astype("<u4")
+
+
+# Meshes with fewer faces are displayed quickly enough without decimation
+LOD_MIN_FACES = 100_000
+
+# A level of detail is kept if it has at most that fraction of the triangles
+# of the full resolution faces
+LOD_MAX_RATIO = 0.5
+
+
+def cluster_vertices(coords, used, resolution):
+    """Vertex clustering: merge the `used` vertices that fall in the same cell
+    of a grid of `resolution` cells along the longest side of their bounding
+    box. Return the cluster of each vertex (-1 if unused) and the mean
+    position of each cluster."""
+    points = coords[used].astype(np.float64)
+    low = points.min(axis=0)
+    step = (points.max(axis=0) - low).max() / resolution or 1.0
+    cells = np.minimum(((points - low) / step).astype(np.int64), resolution - 1)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse)
+    positions = np.stack(
+        [np.bincount(inverse, weights=points[:, axis]) / counts for axis in range(3)], axis=1
+    )
+    cluster = np.full(len(coords), -1, dtype=np.int64)
+    cluster[used] = inverse
+    return cluster, positions
+
+
+def _triangles(runs):
+    """Fan triangulation of cells given as `corner_runs`."""
+    triangles = [
+        rows[:, [0, corner, corner + 1]]
+        for rows in runs
+        if rows.shape[1] >= 3
+        for corner in range(1, rows.shape[1] - 1)
+    ]
+    return np.concatenate(triangles) if triangles else np.zeros((0, 3), dtype=np.int64)
+
+
+def decimate_faces(coords, face_runs, resolution):
+    """Decimated copy of the faces of each group of `face_runs` (lists of
+    `corner_runs`) by `cluster_vertices`. The faces are triangulated, the
+    triangles that collapse are dropped and the duplicates removed in each
+    group, so every group keeps its own (coarser) faces.
+
+    Return the cluster positions and, for each group, its triangles as node
+    ids of these positions.
+    """
+    triangles = [_triangles(runs) for runs in face_runs]
+    used = np.unique(np.concatenate([tri.ravel() for tri in triangles]))
+    cluster, positions = cluster_vertices(coords, used, resolution)
+    decimated = []
+    for tri in triangles:
+        tri = cluster[tri]
+        tri = tri[(tri[:, 0] != tri[:, 1]) & (tri[:, 1] != tri[:, 2]) & (tri[:, 0] != tri[:, 2])]
+        _, first = np.unique(np.sort(tri, axis=1), axis=0, return_index=True)
+        decimated.append(tri[np.sort(first)])
+    return positions, decimated
+
+
+def write_binary(skin_mesh, groups, output_path, lod=(), progress=None):
+    """Write the content of `write_obj` as little-endian typed arrays.
+
+    Layout: `BINARY_MAGIC`, the byte length of the JSON header (uint32), the
+    header, padded with spaces to a multiple of 4 bytes, then the buffers. The
+    header holds the `version`, and for each buffer its `offset` (bytes from
+    the end of the header, a multiple of 4), `length` (items) and `type`:
+
+    * `vertices` (float32, x y z per node);
+    * `faces`, `lines` (uint32, 0-based node ids of the cells, one after the
+      other) and `faceOffsets`, `lineOffsets` (uint32, start of each cell in
+      them, plus the end);
+    * `nodes` (uint32, 0-based node ids of the node groups).
+
+    With `lod` grid resolutions, `lods` lists the decimated levels of the
+    faces that are kept (see `decimate_faces`, `LOD_MIN_FACES` and
+    `LOD_MAX_RATIO`), coarsest first: their `resolution`, the names of their
+    `buffers` (`vertices`, `faces` and `faceOffsets`, as above) and the
+    `[start, end]` range of each of the `faceGroups` in their faces. Lines
+    and nodes always refer to the full resolution vertices.
+
+    The groups gathered, then the levels of detail computed, are reported
+    through `progress` (see `progress_counter`).
+
+    The groups are lists of `{name, start, end}` ranges: `faceGroups` over
+    the faces (the skin first, with an empty name, then the volume and the
+    face groups, told apart by `kind`), `edgeGroups` over the lines and
+    `nodeGroups` over `nodes`.
+    """
+    coords = skin_mesh.getCoords().toNumPyArray()
+    vertices = np.zeros((len(coords), 3), dtype="<f4")
+    vertices[:, : min(3, coords.shape[1])] = coords[:, :3]
+
+    faces = _Cells()
+    face_groups = []
+
+    face_runs = []
+
+    def add_faces(kind, name, runs):
+        start = faces.count
+        faces.add(runs)
+        face_runs.append(runs)
+        face_groups.append({"kind": kind, "name": name, "start": start, "end": faces.count})
+
+    add_faces("skin", "", list(corner_runs(skin_mesh)))
+    total = faces.count + sum(content_size(*group[::2]) for group in groups)
+    advance = progress_counter(progress, "writing", total)
+    advance(faces.count)
+
+    lines = _Cells()
+    line_groups = []
+    node_ids = []
+    node_group_table = []
+    count = 0
+    for kind, name, content in groups:
+        if kind == "node":
+            node_ids.append(content)
+            node_group_table.append({"name": name, "start": count, "end": count + len(content)})
+            count += len(content)
+        elif kind == "edge":
+            start = lines.count
+            lines.add(content)
+            line_groups.append({"name": name, "start": start, "end": lines.count})
+        else:
+            add_faces(kind, name, content)
+        advance(content_size(kind, content))
+
+    face_ids, face_offsets = faces.arrays()
+    line_ids, line_offsets = lines.arrays()
+    nodes = np.concatenate(node_ids) if node_ids else np.zeros(0)
+    buffers = {
+        "vertices": vertices.ravel(),
+        "faces": face_ids,
+        "faceOffsets": face_offsets,
+        "lines": line_ids,
+        "lineOffsets": line_offsets,
+        "nodes": nodes.astype("<u4"),
+    }
+
+    lods = []
+    full = int(np.maximum(np.diff(face_offsets.astype(np.int64)) - 2, 0).sum())
+    resolutions = sorted(set(lod)) if faces.count >= LOD_MIN_FACES else []
+    advance = progress_counter(progress if resolutions else None, "lod", len(resolutions))
+    for resolution in resolutions:
+        positions, decimated = decimate_faces(vertices, face_runs, resolution)
+        kept = sum(len(tri) for tri in decimated)
+        advance()
+        if kept > LOD_MAX_RATIO * full:
+            continue
+        names = {
+            "vertices": f"lod{len(lods)}Vertices",
+            "faces": f"lod{len(lods)}Faces",
+            "faceOffsets": f"lod{len(lods)}FaceOffsets",
+        }
+        buffers[names["vertices"]] = positions.astype("<f4").ravel()
+        buffers[names["faces"]] = np.concatenate(decimated).astype("<u4").ravel()
+        buffers[names["faceOffsets"]] = np.arange(0, 3 * kept + 1, 3, dtype="<u4")
+        bounds = np.cumsum([0] + [len(tri) for tri in decimated]).tolist()
+        lods.append(
+            {
+                "resolution": resolution,
+                "buffers": names,
+                "faceGroups": [list(pair) for pair in zip(bounds[:-1], bounds[1:])],
+            }
+        )
+
+    header = {
+        "version": MED2OBJ_VERSION,
+        "buffers": {},
+        "faceGroups": face_groups,
+        "edgeGroups": line_groups,
+        "nodeGroups": node_group_table,
+    }
+    if lods:
+        header["lods"] = lods
+    offset = 0
+    for name, array in buffers.items():
+        header["buffers"][name] = {
+            "offset": offset,
+            "length": len(array),
+            "type": "float32" if array.dtype.kind == "f" else "uint32",
+        }
+        offset += array.nbytes
+    text = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    text += b" " * (-len(text) % 4)
+    with open(output_path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(np.array([len(text)], dtype="<u4").tobytes())
+        f.write(text)
+        for array in buffers.values():
+            f.write(array.tobytes())
+
+
+# ------------------------------------------------------------------ groups
+
+# Below that many groups, they are extracted in the current process
+PARALLEL_GROUPS = 16
+
+# Size of the .med files loaded at once by the group workers: each of them
+# reads the whole mesh, so a large mesh gets fewer workers. A server shares it
+# between its conversions (see `_init_worker`).
+PARALLEL_BYTES = 4 << 30
+
+# Share of `PARALLEL_BYTES` of the conversions of this process
+_parallel_bytes = PARALLEL_BYTES
 
+
+def extract_group(med_file, kind, level, name):
+    """Content of a group of `med_file`: its node ids for a "node" group,
+    else its cells as a list of `corner_runs` (the skin of the cells for a
+    "volume" group)."""
+    if kind == "node":
+        return med_file.getGroupArr(level, name).toNumPyArray()
+    mesh = med_file.getGroup(level, name)
+    if kind == "volume":
+        mesh = mesh.computeSkin()
+    return list(corner_runs(mesh))
+
+
+def _extract_chunk(path, tasks):
+    """Contents of the groups of `tasks`, in a group worker: the mesh is read
+    for them and released after."""
+    med_file = mc.MEDFileUMesh.New(path)
+    return [extract_group(med_file, *task) for task in tasks]
+
+
+# Processes extracting groups, kept for the next conversions (a server worker
+# converts many meshes, and medcoupling is imported once per process)
+_group_pool = None
+_group_pool_size = 0
+
+
+def _get_group_pool(workers):
+    global _group_pool, _group_pool_size
+    if _group_pool is None or _group_pool_size < workers:
+        if _group_pool is not None:
+            _group_pool.shutdown()
+        _group_pool = cf.ProcessPoolExecutor(max_workers=workers)
+        _group_pool_size = workers
+    return _group_pool
+
+
+def extract_groups(med_file, input_path, tasks, workers=1, progress=None):
+    """Extract the groups of `tasks`, (kind, level, name) tuples, and return
+    them as (kind, name, content) tuples in the same order. The groups done
+    are reported through `progress` (see `progress_counter`).
+
+    With several `workers` and at least `PARALLEL_GROUPS` groups, they are
+    split into one chunk per worker of a pool of processes, each reading
+    `input_path` for its chunk. The group workers of a process read at most
+    its share of `PARALLEL_BYTES` of .med files at once. The results come
+    back in the order of `tasks`, so the output does not depend on the
+    number of workers.
+    """
+    global _group_pool
+    advance = progress_counter(progress, "groups", len(tasks))
+    size = max(1, pl.Path(input_path).stat().st_size)
+    workers = min(workers, len(tasks), max(1, _parallel_bytes // size))
+    if workers <= 1 or len(tasks) < PARALLEL_GROUPS:
+        contents = []
+        for task in tasks:
+            contents.append(extract_group(med_file, *task))
+            advance()
+    else:
+        pool = _get_group_pool(workers)
+        # Interleaved, to balance groups of similar kinds and sizes
+        chunks = [range(first, len(tasks), workers) for first in range(workers)]
+        futures = {
+            pool.submit(_extract_chunk, str(input_path), [tasks[i] for i in chunk]): chunk
+            for chunk in chunks
+        }
+        contents = [None] * len(tasks)
+        try:
+            for future in cf.as_completed(futures):
+                for i, content in zip(futures[future], future.result()):
+                    contents[i] = content
+                advance(len(futures[future]))
+        except cf.BrokenExecutor:
+            # A worker died: the next conversion starts a new pool
+            _group_pool = None
+            raise
+    return [(kind, name, content) for (kind, _, name), content in zip(tasks, contents)]
+
+
+# ------------------------------------------------------------------ cache
+#
+# Outputs are stored in a cache directory under a key made of a digest of the
+# .med file content, the converter version, the output format and options, so
+# a copy of a file finds the outputs of the original. `index.json` holds the
+# size and last use of each entry, evicted least recently used first beyond
+# the size limit, and the digest of the files seen by path, size and mtime, so
+# an unchanged file is not read again.
+#
+# The index is only read and written under a lock file. Outputs are copied
+# out of the lock, which is taken over once older than `LOCK_STALE`.
+
+# Blocks read by the digest
+DIGEST_BLOCK = 1 << 20
+
+# Files whose digest is remembered, the most recently added kept
+MAX_SOURCES = 4096
+
+# A lock file older than that (seconds) was left by a killed process
+LOCK_STALE = 30.0
+
+
+def _warn(msg):
+    sys.stderr.write(f"[med2obj] {msg}\n")
+    sys.stderr.flush()
+
+
+def file_digest(path):
+    """Digest of the whole content of a file. Any change of the mesh must
+    change it (nodes moved in place leave the size unchanged), and reading
+    the file is fast compared with its conversion."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(DIGEST_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Converted meshes, keyed by content (see above). Errors of the cache
+    are reported on stderr and never fail a conversion.
+
+    Arguments:
+        directory: Cache directory, created if needed.
+        max_bytes: Size limit of the cached outputs.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = pl.Path(directory)
+        self.max_bytes = max_bytes
+        # Digests computed since the index was last written, by source
+        self._digests = {}
+
+    def key(self, input_path, variant):
+        """Cache key of the conversion of `input_path` to `variant` (format and
+        options), None if the file can't be read. A new digest is saved in the
+        index with the next `fetch` or `store`."""
+        try:
+            stat = input_path.stat()
+            source = str(input_path.resolve())
+            seen = [stat.st_size, stat.st_mtime_ns]
+            with self._index() as index:
+                known = index["sources"].get(source)
+            if known is not None and known[:2] == seen:
+                digest = known[2]
+            else:
+                digest = file_digest(input_path)
+                self._digests[source] = seen + [digest]
+        except OSError as exc:
+            _warn(f"cache disabled for {input_path}: {exc}")
+            return None
+        return f"{digest}-{MED2OBJ_VERSION}-{variant}"
+
+    def fetch(self, key, output_path):
+        """Copy the cached output of `key` to `output_path`. False if it is
+        not cached."""
+        try:
+            with self._index() as index:
+                if key not in index["entries"]:
+                    return False
+            try:
+                shutil.copyfile(self._file(key), output_path)
+            except FileNotFoundError:
+                # Evicted meanwhile
+                return False
+            with self._index() as index:
+                entry = index["entries"].get(key)
+                if entry is not None:
+                    entry["used"] = time.time()
+            return True
+        except OSError as exc:
+            _warn(f"can not read the cache: {exc}")
+            return False
+
+    def store(self, key, output_path):
+        """Add the output of `key`, then evict beyond the size limit."""
+        tmp = self._file(key).with_name(f"{key}.{os.getpid()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(output_path, tmp)
+            with self._index() as index:
+                os.replace(tmp, self._file(key))
+                size = self._file(key).stat().st_size
+                index["entries"][key] = {"bytes": size, "used": time.time()}
+                self._evict(index)
+        except OSError as exc:
+            _warn(f"can not write the cache: {exc}")
+            with contextlib.suppress(OSError):
+                tmp.unlink()
+
+    def _file(self, key):
+        return self.directory / f"{key}.m2o"
+
+    def _evict(self, index):
+        entries = index["entries"]
+        version = f"-{MED2OBJ_VERSION}-"
+        stale = [key for key in entries if version not in key]
+        total = sum(entry["bytes"] for entry in entries.values())
+        for key in sorted(entries, key=lambda key: entries[key]["used"]):
+            if total <= self.max_bytes:
+                break
+            if key not in stale:
+                stale.append(key)
+                total -= entries[key]["bytes"]
+        for key in stale:
+            del entries[key]
+            # Fails on Windows while another process copies it
+            with contextlib.suppress(OSError):
+                self._file(key).unlink()
+        # Outputs lost by the index (a process killed while storing)
+        for path in self.directory.glob("*.m2o"):
+            if path.stem not in entries:
+                with contextlib.suppress(OSError):
+                    path.unlink()
+        # Digests of the files whose outputs were evicted or that were removed
+        # (not the others, their conversion may be running)
+        evicted = {key.split("-", 1)[0] for key in stale}
+        evicted -= {key.split("-", 1)[0] for key in entries}
+        sources = [
+            (source, seen)
+            for source, seen in index["sources"].items()
+            if seen[2] not in evicted and osp.exists(source)
+        ]
+        index["sources"] = dict(sources[-MAX_SOURCES:])
+
+    @contextlib.contextmanager
+    def _index(self):
+        """Yield the index, locked, and save it after the block, with the
+        digests computed by `key`. The lock is a file created exclusively, as
+        the cache is shared by processes (the workers of a server, several
+        windows). It holds a token, so that a process whose lock was taken
+        over (as stale) does not remove the lock of the next owner."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock = self.directory / "index.lock"
+        token = f"{os.getpid()}-{os.urandom(8).hex()}".encode()
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                with contextlib.suppress(FileNotFoundError):
+                    if time.time() - lock.stat().st_mtime > LOCK_STALE:
+                        lock.unlink()
+                        continue
+                time.sleep(0.01)
+        try:
+            os.write(fd, token)
+        finally:
+            os.close(fd)
+        try:
+            path = self.directory / "index.json"
+            try:
+                index = json.loads(path.read_text(encoding="utf-8"))
+                if not isinstance(index, dict):
+                    raise ValueError("not an object")
+            except (OSError, ValueError):
+                index = {}
+            index.setdefault("entries", {})
+            index.setdefault("sources", {})
+            for source, seen in self._digests.items():
+                index["sources"].pop(source, None)
+                index["sources"][source] = seen
+            yield index
+            tmp = path.with_name(f"index.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(index), encoding="utf-8")
+            os.replace(tmp, path)
+            self._digests.clear()
+        finally:
+            with contextlib.suppress(OSError):
+                if lock.read_bytes() == token:
+                    lock.unlink()
+
+
+# ------------------------------------------------------------------ conversion
+
+
+def convert(
+    input_path,
+    output_path,
+    fmt="obj",
+    progress=None,
+    group_workers=1,
+    cache=None,
+    lod=(),
+    preview=None,
+):
+    """Convert the mesh of the .med file `input_path` into `output_path`, as
+    text .obj or binary (`fmt`, with the `lod` levels of `write_binary`),
+    extracting the groups with `group_workers` processes.
+
+    `progress(stage, done, total)` is called as the conversion goes: "reading"
+    the file, "skin" once it is computed (and written to the binary file
+    `preview`, if any), "groups" extracted, then "writing" cells and "lod"
+    levels, or "cached" when the output comes from `cache`.
+    """
+    input_path = pl.Path(input_path)
     if not input_path.exists():
         raise FileNotFoundError(f"Input file {input_path} does not exist.")
 
+    variant = fmt
+    if lod and fmt == "binary":
+        variant += "_lod" + "_".join(str(res) for res in sorted(set(lod)))
+    key = cache.key(input_path, variant) if cache is not None else None
+    if key is not None and cache.fetch(key, output_path):
+        if progress:
+            progress("cached", 1, 1)
+        return
+
+    if progress:
+        progress("reading", 0, 1)
     med_file = mc.MEDFileUMesh.New(str(input_path))
     # med_file = med_file.quadraticToLinear()
     mesh = med_file.getMeshAtLevel(0)
@@ -170,18 +819,162 @@ def main():
         if edge_level is not None and edge_level in available_levels
         else []
     )
-    write_obj(
-        med_file,
-        skin_mesh,
-        surfaces,
-        nodes,
-        volumes,
-        edges,
-        str(output_path),
-        skin_level=surface_level,
-        node_level=node_level,
-        edge_level=edge_level if edge_level is not None else -2,
-    )
+    if preview:
+        write_binary(skin_mesh, [], preview)
+    if progress:
+        progress("skin", 1, 1)
+
+    tasks = [("volume", 0, name) for name in volumes]
+    tasks += [("face", surface_level, name) for name in surfaces]
+    tasks += [("edge", edge_level, name) for name in edges]
+    tasks += [("node", node_level, name) for name in nodes]
+    groups = extract_groups(med_file, input_path, tasks, group_workers, progress)
+
+    if fmt == "binary":
+        write_binary(skin_mesh, groups, str(output_path), lod, progress)
+    else:
+        write_obj(skin_mesh, groups, str(output_path), progress)
+    if key is not None:
+        cache.store(key, output_path)
+
+
+# ------------------------------------------------------------------ server
+#
+# Requests are JSON lines on stdin: {"id", "input", "output", "format"}, and
+# optionally "groupWorkers" (see `extract_groups`), "lod" (see `write_binary`)
+# and "preview" (see `convert`).
+# Events are JSON lines on stdout, with the id of their request:
+# {"event": "progress", "stage", "done", "total"}, then {"event": "done"} or
+# {"event": "error", "message"}. The first line is {"event": "ready"}, with
+# the `version` and the number of `workers`. Conversions run in a pool of
+# worker processes, each importing medcoupling once; the server exits at the
+# end of stdin, when the pending conversions are done.
+
+# Queue of the events of a worker process and conversion cache, set by
+# `_init_worker`
+_events = None
+_cache = None
+
+
+def _init_worker(events, cache, parallel_bytes):
+    global _events, _cache, _parallel_bytes
+    _events = events
+    _cache = cache
+    _parallel_bytes = parallel_bytes
+
+
+def _serve_convert(request):
+    request_id = request.get("id")
+
+    def progress(stage, done, total):
+        event = {"id": request_id, "event": "progress", "stage": stage}
+        _events.put({**event, "done": done, "total": total})
+
+    try:
+        convert(
+            request["input"],
+            request["output"],
+            request.get("format", "obj"),
+            progress,
+            request.get("groupWorkers", 1),
+            _cache,
+            request.get("lod", ()),
+            request.get("preview"),
+        )
+    except Exception as exc:
+        message = f"{type(exc).__name__}: {exc}"
+        _events.put({"id": request_id, "event": "error", "message": message})
+    else:
+        _events.put({"id": request_id, "event": "done"})
+
+
+def serve(workers, group_workers, cache=None):
+    """Convert the requests read on stdin until its end (see above), with
+    `group_workers` processes per conversion unless requested otherwise, and
+    the conversion `cache`."""
+    import multiprocessing as mp
+    import threading
+    from concurrent.futures.process import BrokenProcessPool
+
+    lock = threading.Lock()
+
+    def send(event):
+        with lock:
+            sys.stdout.write(json.dumps(event) + "\n")
+            sys.stdout.flush()
+
+    events = mp.Queue()
+
+    def pump():
+        # Events of the workers, in the order they were emitted
+        for event in iter(events.get, None):
+            send(event)
+
+    def new_pool():
+        return cf.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(events, cache, PARALLEL_BYTES // workers),
+        )
+
+    def check(request_id, future):
+        # A worker that died (a crash in medcoupling) leaves no event
+        exc = future.exception()
+        if exc is not None:
+            send({"id": request_id, "event": "error", "message": f"{type(exc).__name__}: {exc}"})
+
+    pumping = threading.Thread(target=pump, daemon=True)
+    pumping.start()
+    pool = new_pool()
+    send({"event": "ready", "version": MED2OBJ_VERSION, "workers": workers})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("not an object")
+        except ValueError as exc:
+            send({"event": "error", "message": f"invalid request: {exc}"})
+            continue
+        request.setdefault("groupWorkers", group_workers)
+        try:
+            future = pool.submit(_serve_convert, request)
+        except BrokenProcessPool:
+            pool = new_pool()
+            future = pool.submit(_serve_convert, request)
+        future.add_done_callback(lambda f, request_id=request.get("id"): check(request_id, f))
+    pool.shutdown(wait=True)
+    events.put(None)
+    pumping.join()
+
+
+def print_progress(stage, done, total):
+    event = {"event": "progress", "stage": stage, "done": done, "total": total}
+    print(json.dumps(event), flush=True)
+
+
+def main():
+    args = parse_args()
+    cpus = os.cpu_count() or 1
+    cache = None
+    if not args.no_cache:
+        cache = ConversionCache(args.cache_dir, args.cache_size << 20)
+    if args.serve:
+        workers = max(1, args.workers)
+        serve(workers, max(1, args.group_workers or cpus // workers), cache)
+    else:
+        convert(
+            args.input,
+            args.output,
+            args.format,
+            group_workers=args.group_workers or cpus,
+            cache=cache,
+            lod=args.lod,
+            preview=args.preview,
+            progress=print_progress if args.progress else None,
+        )
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -314,7 +314,7 @@ export class CaveStatusBar {
       return;
     }
     this.refresh(vscode.window.activeTextEditor);
-    void LspServer.instance.restart();
+    void LspServer.instance.switchCatalog();
     vscode.window.showInformationMessage(`code_aster version set to ${picked.label}.`);
   }
 
@@ -349,10 +349,10 @@ export class CaveStatusBar {
       this.refresh(vscode.window.activeTextEditor);
       // If we just removed the version the LSP is currently backed by, the
       // running server is still serving a catalog from a now-deleted cache
-      // dir. Restart so it re-resolves (will fall back to bundled or to
+      // dir. Switch so it re-resolves (will fall back to bundled or to
       // whatever ~/.cave now points at).
       if (tag === current) {
-        void LspServer.instance.restart();
+        void LspServer.instance.switchCatalog();
       }
     });
   }
@@ -391,7 +391,7 @@ export class CaveStatusBar {
       return;
     }
     this.refresh(vscode.window.activeTextEditor);
-    void LspServer.instance.restart();
+    void LspServer.instance.switchCatalog();
     vscode.window.showInformationMessage(`code_aster version set to ${tag}.`);
   }
 
@@ -460,7 +460,7 @@ export class CaveStatusBar {
         );
         return;
       }
-      void LspServer.instance.restart();
+      void LspServer.instance.switchCatalog();
       return;
     }
 
@@ -547,7 +547,7 @@ export class CaveStatusBar {
               vscode.window.showInformationMessage(`code_aster ${version} installed.`);
               // Invalidate cached versions so the next picker shows it as installed.
               void this.refreshVersions();
-              // Our ~/.cave watcher already triggers an LSP restart.
+              // Our ~/.cave watcher already switches the LSP catalog.
             }
             resolve();
           });
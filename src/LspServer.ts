@@ -15,6 +15,7 @@ import {
   resolveCatalogPath,
   getCatalogChannel,
   reconcileCatalogCache,
+  ResolvedCatalog,
 } from './CatalogResolver';
 /**
  * Crude paren-balance check: are we inside an unclosed `(` at this position?
@@ -62,6 +63,7 @@ export class LspServer {
   private _context?: vscode.ExtensionContext;
   private _caveWatcher?: fs.FSWatcher;
   private _caveDebounce?: NodeJS.Timeout;
+  private _configListener?: vscode.Disposable;
   // Kept as a class field so `restart()` can mutate `options.env` before
   // bouncing the server — `LanguageClient` re-reads it on the next spawn.
   private _serverOptions?: { command: string; args: string[]; options: { env: NodeJS.ProcessEnv } };
@@ -103,6 +105,7 @@ export class LspServer {
     }
 
     this.watchCaveFile();
+    this.watchCatalogSetting(context);
 
     void vscode.window.withProgress(
       {
@@ -294,13 +297,7 @@ export class LspServer {
 
     try {
       const resolved = await resolveCatalogPath();
-      if (this._serverOptions) {
-        const env = this._serverOptions.options.env;
-        delete env.VS_CODE_ASTER_CATA_PATH;
-        if (resolved.path) {
-          env.VS_CODE_ASTER_CATA_PATH = resolved.path;
-        }
-      }
+      this.setCatalogEnv(resolved);
       getCatalogChannel().appendLine(
         `[catalog] LSP will restart with source=${resolved.source}, path=${resolved.path ?? '(vendored)'}`
       );
@@ -336,6 +333,79 @@ export class LspServer {
     );
   }
 
+  /**
+   * Points the running server at the catalog currently selected (setting
+   * or `cave use`) without restarting it. Workspace folders with their own
+   * `asterCatalogPath` get that catalog for their documents. The server
+   * keeps the catalogs it has loaded, so switching back is immediate.
+   * Falls back to a restart when the server isn't running.
+   */
+  public async switchCatalog() {
+    const client = this._client;
+    if (!client || !this._context || !client.isRunning()) {
+      await this.restart();
+      return;
+    }
+    const channel = getCatalogChannel();
+    try {
+      const resolved = await resolveCatalogPath();
+      // A later restart must start on the same catalog
+      this.setCatalogEnv(resolved);
+      const vendored = this._context.asAbsolutePath(
+        path.join('python', 'asterstudy', 'code_aster_version', 'code_aster')
+      );
+      const target = resolved.path ?? vendored;
+      const result: { ok: boolean } = await client.sendRequest('codeaster/selectCatalog', {
+        path: target,
+      });
+      if (!result?.ok) {
+        throw new Error(`server could not load ${target}`);
+      }
+      for (const folder of vscode.workspace.workspaceFolders ?? []) {
+        const folderPath =
+          vscode.workspace
+            .getConfiguration('vs-code-aster', folder.uri)
+            .inspect<string>('asterCatalogPath')
+            ?.workspaceFolderValue?.trim() ?? '';
+        const valid = folderPath !== '' && fs.existsSync(path.join(folderPath, 'Cata'));
+        await client.sendRequest('codeaster/selectCatalog', {
+          path: valid ? folderPath : '',
+          scope: folder.uri.toString(),
+        });
+      }
+      channel.appendLine(
+        `[catalog] LSP switched to source=${resolved.source}, path=${resolved.path ?? '(vendored)'}`
+      );
+      this._readyEmitter.fire();
+    } catch (err: any) {
+      channel.appendLine(`[catalog] switch failed, restarting: ${err?.message ?? err}`);
+      await this.restart();
+    }
+  }
+
+  private setCatalogEnv(resolved: ResolvedCatalog) {
+    if (this._serverOptions) {
+      const env = this._serverOptions.options.env;
+      delete env.VS_CODE_ASTER_CATA_PATH;
+      if (resolved.path) {
+        env.VS_CODE_ASTER_CATA_PATH = resolved.path;
+      }
+    }
+  }
+
+  private watchCatalogSetting(context: vscode.ExtensionContext) {
+    if (this._configListener) {
+      return;
+    }
+    this._configListener = vscode.workspace.onDidChangeConfiguration((e) => {
+      if (e.affectsConfiguration('vs-code-aster.asterCatalogPath')) {
+        getCatalogChannel().appendLine('[catalog] asterCatalogPath changed, switching catalog');
+        void this.switchCatalog();
+      }
+    });
+    context.subscriptions.push(this._configListener);
+  }
+
   private watchCaveFile() {
     if (this._caveWatcher) {
       return;
@@ -348,8 +418,8 @@ export class LspServer {
           clearTimeout(this._caveDebounce);
         }
         this._caveDebounce = setTimeout(() => {
-          channel.appendLine(`[catalog] ~/.cave changed, restarting LSP`);
-          void this.restart();
+          channel.appendLine(`[catalog] ~/.cave changed, switching catalog`);
+          void this.switchCatalog();
         }, 500);
       });
       channel.appendLine(`[catalog] watching ${cavePath}`);
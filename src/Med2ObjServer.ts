@@ -0,0 +1,232 @@
+import * as vscode from 'vscode';
+import * as path from 'path';
+import * as readline from 'readline';
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+
+// Stop the server after this long without conversions, to free its workers
+const IDLE_TIMEOUT_MS = 5 * 60_000;
+
+// Last lines of stderr kept to explain a failure
+const STDERR_LINES = 50;
+
+/**
+ * Progress of a conversion: `done` out of `total` steps of a stage
+ * ('reading', 'skin', 'groups', 'writing', 'lod' or 'cached').
+ */
+export interface ConversionProgress {
+  stage: string;
+  done: number;
+  total: number;
+}
+
+interface PendingConversion {
+  resolve: () => void;
+  reject: (err: Error) => void;
+  onProgress?: (progress: ConversionProgress) => void;
+}
+
+/**
+ * Singleton wrapper around `med2obj.py --serve`: a long-lived Python process
+ * that keeps medcoupling loaded and converts meshes in a pool of workers.
+ * Requests and events are JSON lines (see `serve` in med2obj.py). The process
+ * is started on the first conversion, restarted if it dies or if the Python
+ * executable setting changes, and stopped when idle.
+ */
+export class Med2ObjServer implements vscode.Disposable {
+  private static _instance: Med2ObjServer;
+  private _process?: ChildProcessWithoutNullStreams;
+  private _pythonPath?: string;
+  private _nextId = 0;
+  private _pending = new Map<number, PendingConversion>();
+  private _stderr: string[] = [];
+  private _idleTimer?: NodeJS.Timeout;
+
+  private constructor() {}
+
+  public static get instance(): Med2ObjServer {
+    if (!Med2ObjServer._instance) {
+      Med2ObjServer._instance = new Med2ObjServer();
+    }
+    return Med2ObjServer._instance;
+  }
+
+  /**
+   * Converts a .med file with the server, which is started if needed.
+   * @param medFilePath Path to the input .med file
+   * @param outputPath Path to the output file
+   * @param options Output format of med2obj ('obj' or 'binary'), grid
+   *   resolutions of the decimated levels of detail (binary only), and path of
+   *   a binary file of the skin alone, written before the groups are extracted
+   * @param onProgress Called as the conversion goes through its stages
+   */
+  public convert(
+    medFilePath: string,
+    outputPath: string,
+    options: { format: 'obj' | 'binary'; lod?: number[]; preview?: string },
+    onProgress?: (progress: ConversionProgress) => void
+  ): Promise<void> {
+    return new Promise((resolve, reject) => {
+      let proc: ChildProcessWithoutNullStreams;
+      try {
+        proc = this.ensureProcess();
+      } catch (err) {
+        reject(err as Error);
+        return;
+      }
+      const id = this._nextId++;
+      this._pending.set(id, { resolve, reject, onProgress });
+      this.clearIdleTimer();
+      proc.stdin.write(
+        JSON.stringify({ id, input: medFilePath, output: outputPath, ...options }) + '\n'
+      );
+    });
+  }
+
+  public dispose(): void {
+    this.clearIdleTimer();
+    const proc = this._process;
+    this._process = undefined;
+    if (proc) {
+      proc.stdin.end();
+      proc.kill();
+    }
+    this.failPending(new Error('med2obj server stopped.'));
+  }
+
+  private ensureProcess(): ChildProcessWithoutNullStreams {
+    const config = vscode.workspace.getConfiguration('vs-code-aster');
+    const pythonPath = config.get<string>('pythonExecutablePath', 'python3');
+    if (this._process && this._pythonPath === pythonPath) {
+      return this._process;
+    }
+    if (this._process) {
+      this.dispose();
+    }
+
+    const scriptPath = path.join(__dirname, '..', 'python', 'med2obj.py');
+    console.log(`[Med2ObjServer] Starting: ${pythonPath} ${scriptPath} --serve`);
+    const proc = spawn(pythonPath, [scriptPath, '--serve']);
+    this._process = proc;
+    this._pythonPath = pythonPath;
+    this._stderr = [];
+
+    proc.stdin.on('error', (err) => {
+      console.error(`[Med2ObjServer] stdin error: ${err.message}`);
+    });
+    readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+      this.onLine(line);
+    });
+    readline.createInterface({ input: proc.stderr }).on('line', (line) => {
+      console.log(`[Med2ObjServer] stderr: ${line}`);
+      this._stderr.push(line);
+      if (this._stderr.length > STDERR_LINES) {
+        this._stderr.shift();
+      }
+    });
+
+    proc.on('error', (err: NodeJS.ErrnoException) => {
+      console.error(`[Med2ObjServer] Process error: ${err.message}`);
+      if (this._process !== proc) {
+        return;
+      }
+      this._process = undefined;
+      if (err.code === 'ENOENT') {
+        this.failPending(
+          new Error(
+            `Python executable not found: "${pythonPath}". ` +
+              `Please update the "vs-code-aster.pythonExecutablePath" setting.`
+          )
+        );
+      } else {
+        this.failPending(new Error(`Failed to generate mesh file: ${err.message}`));
+      }
+    });
+
+    proc.on('close', (code) => {
+      console.log(`[Med2ObjServer] Exited with code ${code}`);
+      if (this._process !== proc) {
+        return;
+      }
+      this._process = undefined;
+      this.clearIdleTimer();
+      this.failPending(
+        new Error(`med2obj.py exited with code ${code}. ${this._stderr.join('\n')}`)
+      );
+    });
+
+    return proc;
+  }
+
+  private onLine(line: string): void {
+    let event: {
+      id?: number;
+      event?: string;
+      stage?: string;
+      done?: number;
+      total?: number;
+      message?: string;
+    };
+    try {
+      event = JSON.parse(line);
+    } catch {
+      // Not an event (e.g. a print of the Windows DLL setup)
+      console.log(`[Med2ObjServer] ${line}`);
+      return;
+    }
+    if (event.id === undefined) {
+      if (event.event === 'error') {
+        console.error(`[Med2ObjServer] ${event.message}`);
+      }
+      return;
+    }
+    const pending = this._pending.get(event.id);
+    if (!pending) {
+      return;
+    }
+    switch (event.event) {
+      case 'progress':
+        pending.onProgress?.({
+          stage: event.stage ?? '',
+          done: event.done ?? 0,
+          total: event.total ?? 1,
+        });
+        return;
+      case 'done':
+        this._pending.delete(event.id);
+        pending.resolve();
+        break;
+      case 'error':
+        this._pending.delete(event.id);
+        pending.reject(new Error(`med2obj.py failed: ${event.message}`));
+        break;
+      default:
+        return;
+    }
+    if (this._pending.size === 0) {
+      this.startIdleTimer();
+    }
+  }
+
+  private failPending(err: Error): void {
+    const pending = [...this._pending.values()];
+    this._pending.clear();
+    for (const conversion of pending) {
+      conversion.reject(err);
+    }
+  }
+
+  private startIdleTimer(): void {
+    this.clearIdleTimer();
+    this._idleTimer = setTimeout(() => {
+      console.log('[Med2ObjServer] Idle, stopping');
+      this.dispose();
+    }, IDLE_TIMEOUT_MS);
+  }
+
+  private clearIdleTimer(): void {
+    if (this._idleTimer) {
+      clearTimeout(this._idleTimer);
+      this._idleTimer = undefined;
+    }
+  }
+}
@@ -85,7 +85,18 @@ export class MedEditorProvider implements vscode.CustomReadonlyEditorProvider<vs
     void sendTelemetry(TelemetryType.VIEWER_OPENED);
 
     try {
-      const objUris = await getObjFiles([medPath]);
+      const objUris = await getObjFiles([medPath], ({ message, fraction, preview }) => {
+        visu.sendProgress(message, fraction);
+        if (preview) {
+          // The preview is deleted once the conversion is done: skip it if
+          // the mesh is already there
+          void readObjFilesContent([preview], false).then((previewContexts) => {
+            if (previewContexts.length > 0) {
+              visu.sendPreview(previewContexts, [medBaseName]);
+            }
+          });
+        }
+      });
 
       if (objUris.length === 0) {
         webviewPanel.webview.postMessage({
@@ -1,13 +1,50 @@
 import * as vscode from 'vscode';
 import * as path from 'path';
 import * as fs from 'fs';
-import { spawn } from 'child_process';
+import { ConversionProgress, Med2ObjServer } from './Med2ObjServer';
 import { sendTelemetry, TelemetryType } from './telemetry';
 import { WebviewVisu } from './WebviewVisu';
 import { TextDecoder } from 'util';
 import { getMeshCacheDir } from './projectPaths';
 
-const EXPECTED_MED2OBJ_VERSION = 2;
+const EXPECTED_MED2OBJ_VERSION = 4;
+
+// Meshes are converted to med2obj's binary format (typed arrays behind a
+// JSON header), which the viewer loads without parsing text.
+const MESH_CACHE_EXTENSION = '.m2b';
+
+// Grid resolution of the decimated faces written for large meshes, which the
+// viewer shows while it builds the full resolution ones (it only reads the
+// coarsest level). med2obj drops a level that doesn't halve the faces.
+const MESH_LOD_LEVELS = [128];
+const BINARY_MAGIC = 'M2OB';
+
+// Share of a conversion taken by each of its stages, to show one fraction
+const STAGE_WEIGHTS: Record<string, { start: number; weight: number; label: string }> = {
+  reading: { start: 0, weight: 0.1, label: 'Reading mesh' },
+  skin: { start: 0.1, weight: 0.1, label: 'Extracting skin' },
+  groups: { start: 0.2, weight: 0.5, label: 'Extracting groups' },
+  writing: { start: 0.7, weight: 0.2, label: 'Writing mesh' },
+  lod: { start: 0.9, weight: 0.1, label: 'Decimating mesh' },
+  cached: { start: 0, weight: 1, label: 'Reading cached mesh' },
+};
+
+/**
+ * Progress of the conversion of a .med file, as reported to the user.
+ */
+export interface MeshConversionProgress {
+  /** Path of the .med file */
+  medFile: string;
+  /** Description of the current stage */
+  message: string;
+  /** Overall progress of the conversion, between 0 and 1 */
+  fraction: number;
+  /** Binary file of the skin of the mesh, once written ('skin' stage) */
+  preview?: vscode.Uri;
+}
+
+/** Content of a converted mesh: text .obj, or binary med2obj output. */
+export type MeshFileContent = string | Uint8Array;
 
 function readObjVersion(objFilePath: string): number | null {
   try {
@@ -15,6 +52,13 @@ function readObjVersion(objFilePath: string): number | null {
     try {
       const buf = Buffer.alloc(128);
       const bytesRead = fs.readSync(fd, buf, 0, buf.length, 0);
+      if (bytesRead >= 8 && buf.toString('latin1', 0, 4) === BINARY_MAGIC) {
+        // Binary output: the version is in the JSON header
+        const header = Buffer.alloc(buf.readUInt32LE(4));
+        fs.readSync(fd, header, 0, header.length, 8);
+        const version = JSON.parse(header.toString('utf-8')).version;
+        return typeof version === 'number' ? version : null;
+      }
       const head = buf.slice(0, bytesRead).toString('utf-8');
       const firstLine = head.split('\n', 1)[0];
       const m = firstLine.match(/^#\s*med2obj-version:\s*(\d+)/);
@@ -121,36 +165,30 @@ export class VisuManager {
     }
     const medFiles = findMedFiles(commUri.fsPath);
 
-    let objUris: vscode.Uri[] = [];
-
     if (medFiles.length === 0) {
       return;
     }
 
-    objUris = await getObjFiles(medFiles);
-
-    if (objUris.length === 0) {
-      return;
-    }
-
-    const fileContexts = await readObjFilesContent(objUris);
-
     const testDir = path.resolve(__dirname, '..');
 
     const commName = path.basename(commUri.fsPath, path.extname(commUri.fsPath));
 
+    // The viewer is shown right away: its loading screen follows the
+    // conversion, and shows the skin of the meshes once written (see
+    // `getObjFiles`). The data is sent via `sendInit` after conversion.
     const visu = new WebviewVisu(
       'meshViewer',
       testDir,
       'webviews/viewer/dist/index.html',
-      fileContexts,
-      objUris.map((uri) => path.basename(uri.fsPath)),
+      [],
+      [],
       undefined,
       commName
     );
 
     visu.sourceDir = path.dirname(commUri.fsPath);
-    this.views.set(key, { commUri, objUris, visu });
+    const entry: WebviewEntry = { commUri, objUris: [], visu };
+    this.views.set(key, entry);
 
     // Send telemetry once per opening of this .comm (non-blocking).
     // This will not run when simply revealing an existing viewer.
@@ -159,6 +197,40 @@ export class VisuManager {
     visu.panel.onDidDispose(() => {
       this.views.delete(key);
     });
+
+    // Each file takes an equal share of the progress
+    const fractions = new Map<string, number>();
+    const previews = new Map<string, MeshFileContent>();
+    const objUris = await getObjFiles(medFiles, ({ medFile, message, fraction, preview }) => {
+      fractions.set(medFile, fraction);
+      let total = 0;
+      fractions.forEach((value) => (total += value));
+      visu.sendProgress(`${path.basename(medFile)}: ${message}`, total / medFiles.length);
+      if (preview) {
+        // The preview is deleted once the conversion is done: skip it if
+        // the mesh is already there
+        void readObjFilesContent([preview], false).then((previewContexts) => {
+          if (previewContexts.length === 0) {
+            return;
+          }
+          previews.set(medFile, previewContexts[0]);
+          const shown = medFiles.filter((file) => previews.has(file));
+          visu.sendPreview(
+            shown.map((file) => previews.get(file)!),
+            shown.map((file) => path.basename(file, path.extname(file)))
+          );
+        });
+      }
+    });
+
+    if (objUris.length === 0) {
+      visu.panel.dispose();
+      return;
+    }
+
+    entry.objUris = objUris;
+    const fileContexts = await readObjFilesContent(objUris);
+    visu.sendInit(fileContexts, objUris.map((uri) => path.basename(uri.fsPath)));
   }
 
   public getViewer(commUri: vscode.Uri): WebviewEntry | undefined {
@@ -202,18 +274,27 @@ export class VisuManager {
 }
 
 /**
- * Reads the contents of all .obj files and returns them as a string array.
- * @param objUris Array of vscode.Uri for .obj files
+ * Reads the contents of all converted mesh files: text for .obj files, raw
+ * bytes for binary ones (posted as is to the webview).
+ * @param objUris Array of vscode.Uri for mesh files
+ * @param showErrors Whether to show the files that can't be read to the user
  */
-export async function readObjFilesContent(objUris: vscode.Uri[]): Promise<string[]> {
+export async function readObjFilesContent(
+  objUris: vscode.Uri[],
+  showErrors = true
+): Promise<MeshFileContent[]> {
   const decoder = new TextDecoder('utf-8');
-  const contexts: string[] = [];
+  const contexts: MeshFileContent[] = [];
   for (const uri of objUris) {
     try {
       const fileData = await vscode.workspace.fs.readFile(uri);
-      contexts.push(decoder.decode(fileData));
+      contexts.push(
+        path.extname(uri.fsPath) === MESH_CACHE_EXTENSION ? fileData : decoder.decode(fileData)
+      );
     } catch (err) {
-      vscode.window.showErrorMessage(`Error reading .obj file: ${uri.fsPath}`);
+      if (showErrors) {
+        vscode.window.showErrorMessage(`Error reading .obj file: ${uri.fsPath}`);
+      }
     }
   }
   return contexts;
@@ -293,132 +374,127 @@ export function findMedFiles(commFilePath: string): string[] {
 
 /**
  * Returns the .obj files associated with the given .mmed files. Creates a .visu_data folder if needed.
+ * The missing or outdated files are generated in parallel by the med2obj server.
+ *
+ * The mesh file itself is only written once all the groups are extracted.
+ * Before that, med2obj writes the skin of the mesh to a separate preview file
+ * (`<name>.preview.m2b`, next to the mesh file), reported with the 'skin'
+ * stage so that the viewers can show it meanwhile. It is deleted once the
+ * conversion ends, so it may already be gone when read.
  * @param medFiles Array of .mmed file paths
- * @returns Array of URIs for found .obj files
+ * @param onProgress Called as each file is converted
+ * @returns Array of URIs for found .obj files, in the order of `medFiles`
  */
-export async function getObjFiles(medFiles: string[]): Promise<vscode.Uri[]> {
-  const objUris: vscode.Uri[] = [];
-  for (const mmedFilePath of medFiles) {
-    try {
-      const ext = path.extname(mmedFilePath);
-      const mmedBase = path.basename(mmedFilePath, ext);
-      const cacheDir = getMeshCacheDir(path.dirname(mmedFilePath));
-      const objFilePath = path.join(cacheDir, `${mmedBase}.obj`);
-
-      let needsGenerate = !fs.existsSync(objFilePath);
-      let reason = '';
-
-      if (!needsGenerate) {
-        const mmedStat = fs.statSync(mmedFilePath);
-        const objStat = fs.statSync(objFilePath);
-        if (objStat.mtime < mmedStat.mtime) {
+export async function getObjFiles(
+  medFiles: string[],
+  onProgress?: (progress: MeshConversionProgress) => void
+): Promise<vscode.Uri[]> {
+  const found = await Promise.all(
+    medFiles.map((mmedFilePath) => getObjFile(mmedFilePath, onProgress))
+  );
+  return found.filter((uri): uri is vscode.Uri => uri !== undefined);
+}
+
+async function getObjFile(
+  mmedFilePath: string,
+  onProgress?: (progress: MeshConversionProgress) => void
+): Promise<vscode.Uri | undefined> {
+  try {
+    const ext = path.extname(mmedFilePath);
+    const mmedBase = path.basename(mmedFilePath, ext);
+    const cacheDir = getMeshCacheDir(path.dirname(mmedFilePath));
+    const objFilePath = path.join(cacheDir, `${mmedBase}${MESH_CACHE_EXTENSION}`);
+
+    let needsGenerate = !fs.existsSync(objFilePath);
+    let reason = '';
+
+    if (!needsGenerate) {
+      const mmedStat = fs.statSync(mmedFilePath);
+      const objStat = fs.statSync(objFilePath);
+      if (objStat.mtime < mmedStat.mtime) {
+        needsGenerate = true;
+        reason = 'outdated';
+      } else {
+        const version = readObjVersion(objFilePath);
+        if (version !== EXPECTED_MED2OBJ_VERSION) {
           needsGenerate = true;
-          reason = 'outdated';
-        } else {
-          const version = readObjVersion(objFilePath);
-          if (version !== EXPECTED_MED2OBJ_VERSION) {
-            needsGenerate = true;
-            reason = `converter version ${version ?? 'missing'} → ${EXPECTED_MED2OBJ_VERSION}`;
-          }
+          reason = `converter version ${version ?? 'missing'} → ${EXPECTED_MED2OBJ_VERSION}`;
         }
       }
+    }
 
-      if (needsGenerate) {
-        const msg = reason
-          ? `Regenerating .obj (${reason}): ${path.basename(objFilePath)}`
-          : `Creating .obj file for: ${path.basename(mmedFilePath)}`;
-        vscode.window.showInformationMessage(msg);
-        console.log(`[getObjFiles] ${msg}`);
-        await generateObjFromMed(mmedFilePath, objFilePath);
-      } else {
-        console.log(`[getObjFiles] .obj file found: ${objFilePath}`);
+    if (needsGenerate) {
+      const msg = reason
+        ? `Regenerating mesh (${reason}): ${path.basename(objFilePath)}`
+        : `Creating .obj file for: ${path.basename(mmedFilePath)}`;
+      vscode.window.showInformationMessage(msg);
+      console.log(`[getObjFiles] ${msg}`);
+      const previewPath = path.join(cacheDir, `${mmedBase}.preview${MESH_CACHE_EXTENSION}`);
+      try {
+        await generateObjFromMed(mmedFilePath, objFilePath, previewPath, (progress) => {
+          const stage = STAGE_WEIGHTS[progress.stage] ?? STAGE_WEIGHTS.reading;
+          const done = progress.total > 0 ? Math.min(1, progress.done / progress.total) : 1;
+          onProgress?.({
+            medFile: mmedFilePath,
+            message:
+              progress.total > 1
+                ? `${stage.label} (${progress.done}/${progress.total})`
+                : stage.label,
+            fraction: stage.start + stage.weight * done,
+            preview: progress.stage === 'skin' ? vscode.Uri.file(previewPath) : undefined,
+          });
+        });
+      } finally {
+        fs.rmSync(previewPath, { force: true });
       }
+    } else {
+      console.log(`[getObjFiles] mesh file found: ${objFilePath}`);
+    }
 
-      if (fs.existsSync(objFilePath)) {
-        objUris.push(vscode.Uri.file(objFilePath));
-      }
-    } catch (err) {
-      const msg = err instanceof Error ? err.message : String(err);
+    if (fs.existsSync(objFilePath)) {
+      return vscode.Uri.file(objFilePath);
+    }
+  } catch (err) {
+    const msg = err instanceof Error ? err.message : String(err);
 
-      if (msg.includes("No module named 'medcoupling'")) {
-        vscode.window.showErrorMessage(
-          "Python module 'medcoupling' is not installed. " +
-            'Please install it by running `pip install medcoupling` in your Python environment, then retry.'
-        );
-      } else {
-        vscode.window.showErrorMessage(
-          `Error while searching for .obj file: ${(err as Error).message}`
-        );
-      }
+    if (msg.includes("No module named 'medcoupling'")) {
+      vscode.window.showErrorMessage(
+        "Python module 'medcoupling' is not installed. " +
+          'Please install it by running `pip install medcoupling` in your Python environment, then retry.'
+      );
+    } else {
+      vscode.window.showErrorMessage(
+        `Error while searching for .obj file: ${(err as Error).message}`
+      );
     }
   }
-  return objUris;
+  return undefined;
 }
 
 /**
- * Generates a .obj file from a .med file by calling the med2obj.py Python script.
+ * Generates the mesh file of a .med file with the med2obj server, which keeps
+ * Python and medcoupling loaded between conversions.
  * @param medFilePath Path to the input .med file
- * @param objFilePath Path to the output .obj file
+ * @param objFilePath Path to the output mesh file
+ * @param previewPath Path of the binary file of the skin, written first
+ * @param onProgress Called as the conversion goes through its stages
  */
-async function generateObjFromMed(medFilePath: string, objFilePath: string): Promise<void> {
-  return new Promise((resolve, reject) => {
-    // Locate med2obj.py script - assumed to be in python/asterstudy/post or similar
-    const scriptPath = path.join(__dirname, '..', 'python', 'med2obj.py');
-
-    console.log(
-      `[generateObjFromMed] Executing: python ${scriptPath} ${medFilePath} ${objFilePath}`
-    );
-
-    const config = vscode.workspace.getConfiguration('vs-code-aster');
-    const pythonExecutablePath = config.get<string>('pythonExecutablePath', 'python3');
-
-    const process = spawn(
-      pythonExecutablePath,
-      [scriptPath, '-i', medFilePath, '-o', objFilePath],
-      {
-        cwd: path.dirname(medFilePath),
-      }
-    );
-
-    let stderr = '';
-    let settled = false;
-
-    process.stderr.on('data', (data) => {
-      stderr += data.toString();
-      console.log(`[generateObjFromMed] stderr: ${data}`);
-    });
-
-    process.on('error', (err: NodeJS.ErrnoException) => {
-      if (settled) {
-        return;
-      }
-      settled = true;
-      console.error(`[generateObjFromMed] Process error: ${err.message}`);
-      if (err.code === 'ENOENT') {
-        reject(
-          new Error(
-            `Python executable not found: "${pythonExecutablePath}". ` +
-              `Please update the "vs-code-aster.pythonExecutablePath" setting.`
-          )
-        );
-      } else {
-        reject(new Error(`Failed to generate .obj file: ${err.message}`));
-      }
-    });
-
-    process.on('close', (code) => {
-      if (settled) {
-        return;
-      }
-      settled = true;
-      if (code === 0) {
-        console.log(`[generateObjFromMed] Successfully generated: ${objFilePath}`);
-        resolve();
-      } else {
-        const errorMsg = `med2obj.py exited with code ${code}. ${stderr}`;
-        console.error(`[generateObjFromMed] ${errorMsg}`);
-        reject(new Error(errorMsg));
-      }
-    });
-  });
+async function generateObjFromMed(
+  medFilePath: string,
+  objFilePath: string,
+  previewPath: string,
+  onProgress: (progress: ConversionProgress) => void
+): Promise<void> {
+  console.log(`[generateObjFromMed] Converting: ${medFilePath} -> ${objFilePath}`);
+  await Med2ObjServer.instance.convert(
+    medFilePath,
+    objFilePath,
+    { format: 'binary', lod: MESH_LOD_LEVELS, preview: previewPath },
+    (progress) => {
+      const { stage, done, total } = progress;
+      console.log(`[generateObjFromMed] ${path.basename(medFilePath)}: ${stage} ${done}/${total}`);
+      onProgress(progress);
+    }
+  );
+  console.log(`[generateObjFromMed] Successfully generated: ${objFilePath}`);
 }
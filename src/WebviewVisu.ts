@@ -2,6 +2,7 @@ import * as vscode from 'vscode';
 import * as path from 'path';
 import * as fs from 'fs';
 import { getScreenshotsDir, getRecordingsDir } from './projectPaths';
+import type { MeshFileContent } from './VisuManager';
 
 /**
  * Provides basic dialog semantics over a VS Code webview panel for mesh visualization.
@@ -14,7 +15,9 @@ export class WebviewVisu implements vscode.Disposable {
   private selectedGroups: string[];
 
   private readyReceived = false;
-  private deferredInit?: { fileContexts: string[]; objFilenames: string[] };
+  private disposed = false;
+  private deferredInit?: { fileContexts: MeshFileContent[]; objFilenames: string[] };
+  private deferredPreview?: { fileContexts: MeshFileContent[]; objFilenames: string[] };
   public sourceDir?: string;
 
   public get webview(): vscode.Webview {
@@ -45,7 +48,7 @@ export class WebviewVisu implements vscode.Disposable {
     viewType: string,
     resourceRootDir: string,
     htmlFileName: string,
-    fileContexts: string[],
+    fileContexts: MeshFileContent[],
     objFilenames: string[],
     viewColumn?: vscode.ViewColumn,
     title?: string,
@@ -101,6 +104,11 @@ export class WebviewVisu implements vscode.Disposable {
           // Webview is ready, send initialization message
           console.log('[WebviewVisu] Webview ready signal received');
           this.readyReceived = true;
+          if (this.deferredPreview && !this.deferredInit) {
+            // The mesh is still being converted
+            this.sendPreview(this.deferredPreview.fileContexts, this.deferredPreview.objFilenames);
+          }
+          this.deferredPreview = undefined;
           if (objFilenames && objFilenames.length > 0) {
             console.log('[WebviewVisu] Sending init with files:', objFilenames);
             this.doSendInit(fileContexts, objFilenames);
@@ -185,6 +193,7 @@ export class WebviewVisu implements vscode.Disposable {
     // Dispose the webview panel when it is closed
     this.panel.onDidDispose(() => {
       console.log('[WebviewVisu] Webview panel disposed');
+      this.disposed = true;
       this.dispose();
     }, null);
 
@@ -196,10 +205,14 @@ export class WebviewVisu implements vscode.Disposable {
    * posts the message immediately; otherwise buffers the data so it is sent
    * when `ready` fires.
    *
-   * Used by the standalone .med editor provider, which only has obj data
-   * available after running conversion asynchronously.
+   * Used by the viewers that are shown while their meshes are converted (the
+   * .med editor provider and the .comm viewer). Dropped if the panel was
+   * closed meanwhile.
    */
-  public sendInit(fileContexts: string[], objFilenames: string[]): void {
+  public sendInit(fileContexts: MeshFileContent[], objFilenames: string[]): void {
+    if (this.disposed) {
+      return;
+    }
     if (this.readyReceived) {
       this.doSendInit(fileContexts, objFilenames);
     } else {
@@ -207,7 +220,34 @@ export class WebviewVisu implements vscode.Disposable {
     }
   }
 
-  private doSendInit(fileContexts: string[], objFilenames: string[]): void {
+  /**
+   * Send the progress of the conversion to the loading screen of the webview.
+   * Dropped if the webview isn't ready yet, as the next one replaces it.
+   * @param message Description of the current stage
+   * @param progress Overall progress, between 0 and 1
+   */
+  public sendProgress(message: string, progress: number): void {
+    if (this.readyReceived && !this.disposed) {
+      this.panel.webview.postMessage({ type: 'conversionProgress', body: { message, progress } });
+    }
+  }
+
+  /**
+   * Send the skin of the meshes being converted, shown until `sendInit`.
+   * Buffered like `sendInit` if the webview hasn't signalled `ready` yet.
+   */
+  public sendPreview(fileContexts: MeshFileContent[], objFilenames: string[]): void {
+    if (this.disposed) {
+      return;
+    }
+    if (this.readyReceived) {
+      this.panel.webview.postMessage({ type: 'preview', body: { fileContexts, objFilenames } });
+    } else {
+      this.deferredPreview = { fileContexts, objFilenames };
+    }
+  }
+
+  private doSendInit(fileContexts: MeshFileContent[], objFilenames: string[]): void {
     const config = vscode.workspace.getConfiguration('vs-code-aster');
     const settings = {
       hiddenObjectOpacity: config.get<number>('viewer.hiddenObjectOpacity', 0),
@@ -280,7 +320,7 @@ export class WebviewVisu implements vscode.Disposable {
     });
 
     // Parse the text to find object names
-    // Object keys are like "all_mesh.obj"; match against the stem (no "all_" prefix, no extension)
+    // Object keys are like "all_mesh.m2b"; match against the stem (no "all_" prefix, no extension)
     // Only send showOnlyObjects when a mesh name is explicitly selected, to avoid
     // resetting user-hidden meshes on every text selection change.
     const selectedObjects =
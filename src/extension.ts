@@ -17,6 +17,7 @@ import { StatusBar } from './StatusBar';
 import { CaveStatusBar } from './CaveStatusBar';
 import { activateMedLanguageSync } from './MedLanguageSync';
 import { MedEditorProvider, STATIC_MED_EXTS } from './MedEditorProvider';
+import { Med2ObjServer } from './Med2ObjServer';
 import { activateMedAutoDetect, isExtensionConfigured, openAsMedMesh } from './MedAutoDetect';
 import { setTelemetryContext } from './telemetry';
 import { clearCatalogCache, getCatalogChannel, getCatalogInfo } from './CatalogResolver';
@@ -121,6 +122,8 @@ export async function activate(context: vscode.ExtensionContext) {
   // Register the custom editor for .med/.mmed/.rmed files so they open
   // directly in the mesh viewer instead of the binary text editor.
   context.subscriptions.push(MedEditorProvider.register(context));
+  // Stops the med2obj server (started by the first mesh conversion)
+  context.subscriptions.push(Med2ObjServer.instance);
 
   // Auto-detect MED files by HDF5 magic bytes, and offer to add their
   // extension to the list — avoids having to edit settings manually.
@@ -1,10 +1,13 @@
 import { VtkApp } from './core/VtkApp';
 import { CreateGroups } from './data/CreateGroups';
+import { ObjLoader } from './data/ObjLoader';
+import { FaceActorCreator } from './data/create/FaceActorCreator';
 import { VisibilityManager } from './commands/VisibilityManager';
 import { CameraManager } from './interaction/CameraManager';
 import { GlobalSettings } from './settings/GlobalSettings';
 import { groupHierarchy as groupHierarchyStore, loadingProgress, loadingMessage } from './state';
 import type { Group, GroupKind } from './data/Group';
+import type { MeshFileContent } from './data/ObjLoader';
 
 export class Controller {
   private static _i: Controller;
@@ -12,6 +15,8 @@ export class Controller {
   private _vsCodeApi: any = null;
   private _groups: Record<string, Group> | null = null;
   private _groupHierarchy: Record<string, any> | null = null;
+  private _previewActors: any[] = [];
+  private _loading = false;
 
   static get Instance(): Controller {
     if (!this._i) {
@@ -34,10 +39,11 @@ export class Controller {
     return this._vsCodeApi;
   }
 
-  async loadFiles(fileContexts: string[], fileNames: string[]): Promise<void> {
+  async loadFiles(fileContexts: MeshFileContent[], fileNames: string[]): Promise<void> {
     if (this._groups) {
       return;
     }
+    this._loading = true;
     loadingProgress.set(0);
     loadingMessage.set('');
     const lfr = new CreateGroups(fileContexts, fileNames);
@@ -52,6 +58,42 @@ export class Controller {
     });
   }
 
+  /**
+   * Shows the skin of the meshes being converted (written first by med2obj),
+   * until `loadFiles` builds the scene.
+   */
+  async showPreview(fileContexts: MeshFileContent[], fileNames: string[]): Promise<void> {
+    if (this._loading) {
+      return;
+    }
+    const { vertices, cells, cellIndexToGroup, faceGroups } = await ObjLoader.loadFiles(
+      fileContexts,
+      fileNames,
+      () => {},
+      () => {}
+    );
+    if (this._loading) {
+      return;
+    }
+    this.clearPreview();
+    // Preview actors don't take the colors of the objects of the scene
+    const objIndex = GlobalSettings.Instance.objIndex;
+    const creator = new FaceActorCreator(vertices, cells, cellIndexToGroup);
+    faceGroups.forEach((key, groupId) => {
+      this._previewActors.push(creator.create(key, groupId, true).actor);
+    });
+    GlobalSettings.Instance.objIndex = objIndex;
+    VtkApp.Instance.getRenderer().resetCamera();
+    VtkApp.Instance.getRenderWindow().render();
+  }
+
+  clearPreview(): void {
+    for (const actor of this._previewActors) {
+      VtkApp.Instance.getRenderer().removeActor(actor);
+    }
+    this._previewActors = [];
+  }
+
   saveGroups(groups: Record<string, Group>, groupHierarchy: Record<string, any>): void {
     this._groups = groups;
     this._groupHierarchy = this.buildSortedHierarchy(groupHierarchy);
@@ -1,5 +1,6 @@
 import { GlobalSettings } from '../settings/GlobalSettings';
-import { ObjLoader } from './ObjLoader';
+import vtkPoints from '@kitware/vtk.js/Common/Core/Points';
+import { ObjLoader, type LazyFaces, type MeshFileContent } from './ObjLoader';
 import { FaceActorCreator } from './create/FaceActorCreator';
 import { NodeActorCreator } from './create/NodeActorCreator';
 import { EdgeActorCreator } from './create/EdgeActorCreator';
@@ -8,11 +9,11 @@ import { Controller } from '../Controller';
 import { VtkApp } from '../core/VtkApp';
 
 export class CreateGroups {
-  private fileContexts: string[];
+  private fileContexts: MeshFileContent[];
   private fileNames: string[];
   groups: Record<string, Group> = {};
 
-  constructor(fileContexts: string[], fileNames: string[]) {
+  constructor(fileContexts: MeshFileContent[], fileNames: string[]) {
     this.fileContexts = fileContexts;
     this.fileNames = fileNames;
   }
@@ -47,36 +48,24 @@ export class CreateGroups {
       nodeGroups,
       edgeGroups,
       groupHierarchy,
+      coarse,
+      fullFaces,
     } = result;
 
-    const faceActorCreator = new FaceActorCreator(vertices, cells, cellIndexToGroup);
+    // With levels of detail, the scene is built from the decimated faces,
+    // then refined (see `refine`)
+    const faceActorCreator = coarse
+      ? new FaceActorCreator(coarse.vertices, coarse.cells, coarse.cellIndexToGroup)
+      : new FaceActorCreator(vertices, cells, cellIndexToGroup);
+    Controller.Instance.clearPreview();
     const nodeActorCreator = new NodeActorCreator(vertices, nodes, nodeIndexToGroup);
     const edgeActorCreator = new EdgeActorCreator(vertices, edges, edgeIndexToGroup);
 
-    const edgeKey = (a: number, b: number) => (a < b ? `${a}-${b}` : `${b}-${a}`);
-    const faceEdgeSet = new Set<string>();
-    for (const cell of cells) {
-      for (let i = 0; i < cell.length; i++) {
-        faceEdgeSet.add(edgeKey(cell[i], cell[(i + 1) % cell.length]));
-      }
-    }
-    const standaloneByFile: Record<string, number[]> = {};
-    for (let i = 0; i < edges.length; i++) {
-      const e = edges[i];
-      let isStandalone = false;
-      for (let j = 0; j + 1 < e.length; j++) {
-        if (!faceEdgeSet.has(edgeKey(e[j], e[j + 1]))) {
-          isStandalone = true;
-          break;
-        }
-      }
-      if (!isStandalone) continue;
-      const egId = edgeIndexToGroup[i];
-      if (egId < 0) continue;
-      const fileGroup = edgeGroups[egId]?.split('::')[0];
-      if (!fileGroup) continue;
-      (standaloneByFile[fileGroup] ||= []).push(i);
-    }
+    // Found once the full faces are decoded, with levels of detail
+    const standaloneByFile: Record<string, number[]> =
+      fullFaces.length > 0
+        ? {}
+        : this.findStandaloneEdges(cells, [], edges, edgeIndexToGroup, edgeGroups);
 
     const groupKeys = Object.keys(groupHierarchy);
     const yield_ = () => new Promise<void>((r) => setTimeout(r, 0));
@@ -109,14 +98,12 @@ export class CreateGroups {
       );
       this.groups[fileGroup] = groupInstance;
 
-      const standaloneIdx = standaloneByFile[fileGroup];
-      if (standaloneIdx && standaloneIdx.length > 0) {
-        const result = edgeActorCreator.createStandalone(standaloneIdx, objColor);
-        if (result) {
-          groupInstance.standaloneEdgesActor = result.actor;
-          groupInstance.standaloneEdgesContourActor = result.contourActor;
-        }
-      }
+      this.addStandaloneEdges(
+        groupInstance,
+        standaloneByFile[fileGroup],
+        objColor,
+        edgeActorCreator
+      );
 
       const size = this.computeSize(actor);
 
@@ -208,6 +195,123 @@ export class CreateGroups {
     post(`actors : ${Object.keys(this.groups).length}`);
 
     Controller.Instance.saveGroups(this.groups, groupHierarchy);
+
+    if (fullFaces.length > 0) {
+      await this.refine(fullFaces, faceGroups);
+      const standalone = this.findStandaloneEdges(
+        cells,
+        fullFaces,
+        edges,
+        edgeIndexToGroup,
+        edgeGroups
+      );
+      for (const fileGroup of groupKeys) {
+        this.addStandaloneEdges(
+          this.groups[fileGroup],
+          standalone[fileGroup],
+          (groupHierarchy[fileGroup] as any).color,
+          edgeActorCreator
+        );
+      }
+      VtkApp.Instance.getRenderWindow().render();
+    }
+  }
+
+  /**
+   * Replaces the decimated faces of the face and volume groups by the full
+   * resolution ones, decoded group by group from the typed arrays of their
+   * file, while the scene stays usable.
+   */
+  private async refine(fullFaces: LazyFaces[], faceGroups: string[]): Promise<void> {
+    const yield_ = () => new Promise<void>((r) => setTimeout(r, 0));
+    let refined = 0;
+    for (const full of fullFaces) {
+      const points = vtkPoints.newInstance();
+      points.setData(full.coords, 3);
+      for (const { groupId, start, end } of full.groups) {
+        const group = this.groups[faceGroups[groupId]];
+        if (!group) continue;
+        group.actor
+          .getMapper()
+          .setInputData(
+            FaceActorCreator.fromBuffers(points, full.faces, full.faceOffsets, start, end)
+          );
+        group.cellCount = end - start;
+        refined++;
+        VtkApp.Instance.getRenderWindow().render();
+        await yield_();
+      }
+    }
+    Controller.Instance.getVSCodeAPI().postMessage({
+      type: 'debugPanel',
+      text: `Refined ${refined} face groups to full resolution`,
+    });
+  }
+
+  /**
+   * Edges of the edge groups that are not on any face, by file group.
+   */
+  private findStandaloneEdges(
+    cells: number[][],
+    fullFaces: LazyFaces[],
+    edges: number[][],
+    edgeIndexToGroup: number[],
+    edgeGroups: string[]
+  ): Record<string, number[]> {
+    const standaloneByFile: Record<string, number[]> = {};
+    if (edges.length === 0) {
+      return standaloneByFile;
+    }
+    const edgeKey = (a: number, b: number) => (a < b ? `${a}-${b}` : `${b}-${a}`);
+    const faceEdgeSet = new Set<string>();
+    for (const cell of cells) {
+      for (let i = 0; i < cell.length; i++) {
+        faceEdgeSet.add(edgeKey(cell[i], cell[(i + 1) % cell.length]));
+      }
+    }
+    for (const { faces, faceOffsets, vertexStart } of fullFaces) {
+      for (let c = 0; c + 1 < faceOffsets.length; c++) {
+        const first = faceOffsets[c];
+        const count = faceOffsets[c + 1] - first;
+        for (let i = 0; i < count; i++) {
+          faceEdgeSet.add(
+            edgeKey(faces[first + i] + vertexStart, faces[first + ((i + 1) % count)] + vertexStart)
+          );
+        }
+      }
+    }
+    for (let i = 0; i < edges.length; i++) {
+      const e = edges[i];
+      let isStandalone = false;
+      for (let j = 0; j + 1 < e.length; j++) {
+        if (!faceEdgeSet.has(edgeKey(e[j], e[j + 1]))) {
+          isStandalone = true;
+          break;
+        }
+      }
+      if (!isStandalone) continue;
+      const egId = edgeIndexToGroup[i];
+      if (egId < 0) continue;
+      const fileGroup = edgeGroups[egId]?.split('::')[0];
+      if (!fileGroup) continue;
+      (standaloneByFile[fileGroup] ||= []).push(i);
+    }
+    return standaloneByFile;
+  }
+
+  private addStandaloneEdges(
+    group: Group,
+    standaloneIdx: number[] | undefined,
+    objColor: number[],
+    edgeActorCreator: EdgeActorCreator
+  ): void {
+    if (!standaloneIdx || standaloneIdx.length === 0) {
+      return;
+    }
+    const result = edgeActorCreator.createStandalone(standaloneIdx, objColor);
+    if (result) {
+      group.setStandaloneEdges(result.actor, result.contourActor);
+    }
   }
 
   private computeSize(actor: any): number {
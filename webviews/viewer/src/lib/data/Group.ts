@@ -137,6 +137,13 @@ export class Group {
     this._updateStandaloneEdges();
   }
 
+  /** Attaches the actors of the edges of the group that are not on its faces. */
+  setStandaloneEdges(actor: any, contourActor: any): void {
+    this.standaloneEdgesActor = actor;
+    this.standaloneEdgesContourActor = contourActor;
+    this._updateStandaloneEdges();
+  }
+
   setWireframeMode(wireframe: boolean): void {
     this._wireframe = wireframe;
     this._updateStandaloneEdges();
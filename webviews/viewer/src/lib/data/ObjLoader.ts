@@ -2,6 +2,7 @@ import { Controller } from '../Controller';
 
 export interface ObjLoaderResult {
   vertices: { x: number; y: number; z: number }[];
+  /** Decoded faces: those of the files with levels of detail are in `fullFaces` */
   cells: number[][];
   cellIndexToGroup: number[];
   nodes: number[];
@@ -16,13 +17,97 @@ export interface ObjLoaderResult {
     string,
     { faces: string[]; nodes: string[]; volumes: string[]; edges: string[] }
   >;
+  /**
+   * Decimated faces to display first, when a binary file has levels of
+   * detail: the coarsest level of those files, the full faces of the others.
+   * Same face groups as `cells`.
+   */
+  coarse?: CoarseFaces;
+  /** Full resolution faces of the files with levels of detail, not decoded */
+  fullFaces: LazyFaces[];
 }
 
+export interface CoarseFaces {
+  vertices: { x: number; y: number; z: number }[];
+  cells: number[][];
+  cellIndexToGroup: number[];
+}
+
+/**
+ * Faces of a binary file, kept as its typed arrays until the scene is refined
+ * (see `CreateGroups.refine`). Vertex indices are local to the file.
+ */
+export interface LazyFaces {
+  /** Coordinates of the vertices of the file (x, y, z) */
+  coords: Float32Array;
+  faces: Uint32Array;
+  faceOffsets: Uint32Array;
+  /** Index of the first vertex of the file in `vertices` */
+  vertexStart: number;
+  /** Range of faces of each face group */
+  groups: { groupId: number; start: number; end: number }[];
+}
+
+/** Content of a converted mesh: text .obj, or binary med2obj output. */
+export type MeshFileContent = string | Uint8Array;
+
 const YIELD_EVERY_LINES = 5_000;
 
+const BINARY_MAGIC = 'M2OB';
+
+interface BinaryRange {
+  name: string;
+  start: number;
+  end: number;
+}
+
+interface BinaryHeader {
+  version: number;
+  buffers: Record<string, { offset: number; length: number; type: 'float32' | 'uint32' }>;
+  faceGroups: (BinaryRange & { kind: 'skin' | 'volume' | 'face' })[];
+  edgeGroups: BinaryRange[];
+  nodeGroups: BinaryRange[];
+  // Decimated faces, coarsest first; `faceGroups` are [start, end] ranges
+  // matching the face groups above
+  lods?: {
+    resolution: number;
+    buffers: { vertices: string; faces: string; faceOffsets: string };
+    faceGroups: [number, number][];
+  }[];
+}
+
+/**
+ * Reads the header of a binary med2obj file and returns it with a getter
+ * for its typed arrays (viewed in place when aligned, copied otherwise).
+ */
+function readBinaryMesh(bytes: Uint8Array) {
+  const magic = String.fromCharCode(...bytes.subarray(0, 4));
+  if (magic !== BINARY_MAGIC) {
+    throw new Error('Not a binary med2obj file');
+  }
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  const headerLength = view.getUint32(4, true);
+  const dataStart = 8 + headerLength;
+  const header: BinaryHeader = JSON.parse(
+    new TextDecoder('utf-8').decode(bytes.subarray(8, dataStart))
+  );
+
+  const buffer = (name: string): Float32Array | Uint32Array => {
+    const { offset, length, type } = header.buffers[name];
+    const Type = type === 'float32' ? Float32Array : Uint32Array;
+    const start = dataStart + offset;
+    if ((bytes.byteOffset + start) % Type.BYTES_PER_ELEMENT === 0) {
+      return new Type(bytes.buffer, bytes.byteOffset + start, length);
+    }
+    return new Type(bytes.slice(start, start + length * Type.BYTES_PER_ELEMENT).buffer);
+  };
+
+  return { header, buffer };
+}
+
 export class ObjLoader {
   static async loadFiles(
-    fileContexts: string[],
+    fileContexts: MeshFileContent[],
     fileNames: string[],
     onProgress: (progress: number) => void,
     onMessage: (message: string) => void
@@ -50,6 +135,26 @@ export class ObjLoader {
 
     const yield_ = () => new Promise<void>((r) => setTimeout(r, 0));
 
+    const hasLods = fileContexts.some(
+      (content) => typeof content !== 'string' && !!readBinaryMesh(content).header.lods?.length
+    );
+    const coarse: CoarseFaces | undefined = hasLods
+      ? { vertices: [], cells: [], cellIndexToGroup: [] }
+      : undefined;
+    const fullFaces: LazyFaces[] = [];
+    // Full faces of a file without levels of detail, shown as is
+    const addFullToCoarse = (vertexStart: number, cellStart: number) => {
+      if (!coarse) return;
+      const shift = coarse.vertices.length - vertexStart;
+      for (let v = vertexStart; v < vertices.length; v++) {
+        coarse.vertices.push(vertices[v]);
+      }
+      for (let c = cellStart; c < cells.length; c++) {
+        coarse.cells.push(cells[c].map((v) => v + shift));
+        coarse.cellIndexToGroup.push(cellIndexToGroup[c]);
+      }
+    };
+
     for (let i = 0; i < fileContexts.length; i++) {
       try {
         groupId++;
@@ -58,9 +163,116 @@ export class ObjLoader {
         groupHierarchy[skinName] = { faces: [], nodes: [], volumes: [], edges: [] };
         faceGroups.push(skinName);
         nbVertices = vertices.length;
+        const cellStart = cells.length;
 
         onMessage(`Parsing ${fileNames[i]}...`);
-        const lines = fileContexts[i].split('\n').map((l) => l.replace('\r', ''));
+        const content = fileContexts[i];
+        if (typeof content !== 'string') {
+          const { header, buffer } = readBinaryMesh(content);
+
+          const coords = buffer('vertices') as Float32Array;
+          for (let k = 0; k < coords.length; k += 3) {
+            vertices.push({ x: coords[k], y: coords[k + 1], z: coords[k + 2] });
+          }
+          onProgress(((i + 0.3) / fileContexts.length) * 0.9);
+          await yield_();
+
+          const faces = buffer('faces') as Uint32Array;
+          const faceOffsets = buffer('faceOffsets') as Uint32Array;
+          const faceGroupIds: number[] = [];
+          // With levels of detail, the full faces are decoded by `refine`
+          const lod = coarse ? header.lods?.[0] : undefined;
+          const lazyGroups: LazyFaces['groups'] = [];
+          for (const group of header.faceGroups) {
+            if (group.kind === 'volume') {
+              groupId++;
+              const key = `${skinName}::${group.name}::volume`;
+              faceGroups.push(key);
+              volumeGroups.push(key);
+              groupHierarchy[skinName].volumes.push(group.name);
+            } else if (group.kind === 'face') {
+              groupId++;
+              faceGroups.push(`${skinName}::${group.name}::face`);
+              groupHierarchy[skinName].faces.push(group.name);
+            }
+            faceGroupIds.push(groupId);
+            if (lod) {
+              lazyGroups.push({ groupId, start: group.start, end: group.end });
+              continue;
+            }
+            for (let c = group.start; c < group.end; c++) {
+              const cell: number[] = [];
+              for (let k = faceOffsets[c]; k < faceOffsets[c + 1]; k++) {
+                cell.push(faces[k] + nbVertices);
+              }
+              cells.push(cell);
+              cellIndexToGroup.push(groupId);
+            }
+          }
+          onProgress(((i + 0.7) / fileContexts.length) * 0.9);
+          await yield_();
+
+          const lineIds = buffer('lines');
+          const lineOffsets = buffer('lineOffsets');
+          for (const group of header.edgeGroups) {
+            edgeGroupId++;
+            edgeGroups.push(`${skinName}::${group.name}::edge`);
+            groupHierarchy[skinName].edges.push(group.name);
+            for (let c = group.start; c < group.end; c++) {
+              const edge: number[] = [];
+              for (let k = lineOffsets[c]; k < lineOffsets[c + 1]; k++) {
+                edge.push(lineIds[k] + nbVertices);
+              }
+              edges.push(edge);
+              edgeIndexToGroup.push(edgeGroupId);
+            }
+          }
+
+          const nodeIds = buffer('nodes');
+          for (const group of header.nodeGroups) {
+            nodeGroupId++;
+            nodeGroups.push(`${skinName}::${group.name}::node`);
+            groupHierarchy[skinName].nodes.push(group.name);
+            for (let k = group.start; k < group.end; k++) {
+              nodes.push(nodeIds[k] + nbVertices);
+              nodeIndexToGroup.push(nodeGroupId);
+            }
+          }
+
+          if (coarse && lod) {
+            fullFaces.push({
+              coords,
+              faces,
+              faceOffsets,
+              vertexStart: nbVertices,
+              groups: lazyGroups,
+            });
+            const lodBase = coarse.vertices.length;
+            const lodCoords = buffer(lod.buffers.vertices);
+            for (let k = 0; k < lodCoords.length; k += 3) {
+              coarse.vertices.push({ x: lodCoords[k], y: lodCoords[k + 1], z: lodCoords[k + 2] });
+            }
+            const lodFaces = buffer(lod.buffers.faces);
+            const lodOffsets = buffer(lod.buffers.faceOffsets);
+            lod.faceGroups.forEach(([start, end], g) => {
+              for (let c = start; c < end; c++) {
+                const cell: number[] = [];
+                for (let k = lodOffsets[c]; k < lodOffsets[c + 1]; k++) {
+                  cell.push(lodFaces[k] + lodBase);
+                }
+                coarse.cells.push(cell);
+                coarse.cellIndexToGroup.push(faceGroupIds[g]);
+              }
+            });
+          } else {
+            addFullToCoarse(nbVertices, cellStart);
+          }
+
+          onProgress(((i + 1) / fileContexts.length) * 0.9);
+          await yield_();
+          continue;
+        }
+        const lines = content.split('\n').map((l) => l.replace('\r', ''));
         const totalLines = lines.length;
 
         for (let lineIdx = 0; lineIdx < totalLines; lineIdx++) {
@@ -144,6 +356,7 @@ export class ObjLoader {
             }
           }
         }
+        addFullToCoarse(nbVertices, cellStart);
 
         onProgress(((i + 1) / fileContexts.length) * 0.9);
         await yield_();
@@ -156,9 +369,13 @@ export class ObjLoader {
       }
     }
 
+    let cellCount = cells.length;
+    for (const full of fullFaces) {
+      cellCount += full.faceOffsets.length - 1;
+    }
     Controller.Instance.getVSCodeAPI().postMessage({
       type: 'debugPanel',
-      text: `TOTAL: ${vertices.length} vertices, ${cells.length} cells, ${nodes.length} nodes, ${edges.length} edges`,
+      text: `TOTAL: ${vertices.length} vertices, ${cellCount} cells, ${nodes.length} nodes, ${edges.length} edges`,
     });
 
     return {
@@ -174,6 +391,8 @@ export class ObjLoader {
       volumeGroups,
       edgeGroups,
       groupHierarchy,
+      coarse,
+      fullFaces,
     };
   }
 }
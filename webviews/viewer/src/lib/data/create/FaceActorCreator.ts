@@ -44,6 +44,33 @@ export class FaceActorCreator {
     return { actor, colorIndex, isObjectActor, cellCount };
   }
 
+  /**
+   * Poly data of the faces `start` to `end` of the typed arrays of a binary
+   * file, on the shared `points` of the file.
+   */
+  static fromBuffers(
+    points: any,
+    faces: Uint32Array,
+    faceOffsets: Uint32Array,
+    start: number,
+    end: number
+  ): any {
+    const pd = vtkPolyData.newInstance();
+    pd.setPoints(points);
+    if (end > start) {
+      const values = new Uint32Array(end - start + faceOffsets[end] - faceOffsets[start]);
+      let n = 0;
+      for (let c = start; c < end; c++) {
+        values[n++] = faceOffsets[c + 1] - faceOffsets[c];
+        for (let k = faceOffsets[c]; k < faceOffsets[c + 1]; k++) {
+          values[n++] = faces[k];
+        }
+      }
+      pd.setPolys(vtkCellArray.newInstance({ values }));
+    }
+    return pd;
+  }
+
   private prepare(groupId: number): { polyData: any; cellCount: number } {
     const pd = vtkPolyData.newInstance();
 
@@ -8,6 +8,8 @@ import { GlobalSettings } from './lib/settings/GlobalSettings';
 import {
   settings,
   errorMessage,
+  loadingMessage,
+  loadingProgress,
   sessionShowBoundingBox,
   sessionShowWireframe,
   sessionAutoRotate,
@@ -106,6 +108,15 @@ window.addEventListener('message', async (e) => {
       break;
     }
 
+    case 'conversionProgress':
+      loadingMessage.set(body.message);
+      loadingProgress.set(body.progress);
+      break;
+
+    case 'preview':
+      Controller.Instance.showPreview(body.fileContexts, body.objFilenames);
+      break;
+
     case 'displayGroup':
       VisibilityManager.Instance.setVisibility(body.group, body.visible);
       break;